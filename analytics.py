@@ -0,0 +1,57 @@
+# analytics.py - 集計・グラフ用の履歴の読み込み（数値とカテゴリの列だけを小さい型で持つ）
+# get_all_history() は SELECT * なので、数KBあるフィードバックや認識結果の文字列まで Python のオブジェクトとして
+# 読み込み、件数や平均点を出すだけでもメモリが本文の長さに比例して増える。
+# ここでは数値とカテゴリの列だけを読み、スコアは float32、クラス・課題タイプ・バンド・CEFR などは category 型、
+# 日時は datetime64 にする（10万件で数十MB）。
+# 読み込んだ表は DB ごとに持っておき、PRAGMA data_version が変わったときだけ読み直す。
+# data_version は「他の接続」が書き込むと変わる接続ごとの値なので、確認と読み込みには DB ごとに開いたままの
+# 専用の接続を使う（この接続からは書き込まない）。
+
+import sqlite3
+import threading
+from typing import Dict, List, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+CATEGORY_COLUMNS = ["student_id", "class_group", "task_type", "band", "cefr", "toefl", "ielts", "rubric_version"]
+EXTRA_NUMERIC_COLUMNS = ["processing_time"]
+
+_lock = threading.Lock()
+_conns: Dict[str, sqlite3.Connection] = {}
+_cache: Dict[Tuple[str, Tuple[str, ...]], Tuple[int, pd.DataFrame]] = {}
+
+def _conn(db_path: str) -> sqlite3.Connection:
+    if db_path not in _conns:
+        _conns[db_path] = sqlite3.connect(db_path, check_same_thread=False)
+    return _conns[db_path]
+
+def _columns(conn: sqlite3.Connection, score_columns: Sequence[str]) -> Tuple[List[str], List[str]]:
+    """(数値の列, カテゴリの列)。古いDBにない列は除く"""
+    existing = {row[1] for row in conn.execute("PRAGMA table_info(assessments)")}
+    numeric = [c for c in list(score_columns) + EXTRA_NUMERIC_COLUMNS if c in existing]
+    return numeric, [c for c in CATEGORY_COLUMNS if c in existing]
+
+def _read(conn: sqlite3.Connection, score_columns: Sequence[str]) -> pd.DataFrame:
+    numeric, categories = _columns(conn, score_columns)
+    df = pd.read_sql_query(f"SELECT datetime, {', '.join(categories + numeric)} FROM assessments "
+                           "ORDER BY datetime DESC", conn)
+    df["datetime"] = pd.to_datetime(df["datetime"], errors="coerce")
+    for col in categories:
+        df[col] = df[col].astype("category")
+    for col in numeric:
+        df[col] = pd.to_numeric(df[col], errors="coerce").astype(np.float32)
+    return df
+
+def load(db_path: str, score_columns: Sequence[str]) -> pd.DataFrame:
+    """集計用の履歴（新しい順）。DB が変わっていなければ前回の表をそのまま返すので、書き換えずに使うこと"""
+    key = (db_path, tuple(score_columns))
+    with _lock:
+        conn = _conn(db_path)
+        version = conn.execute("PRAGMA data_version").fetchone()[0]
+        cached = _cache.get(key)
+        if cached and cached[0] == version:
+            return cached[1]
+        df = _read(conn, score_columns)
+        _cache[key] = (version, df)
+        return df
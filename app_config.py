@@ -0,0 +1,103 @@
+# app_config.py - class_config.json の読み書き（Azure版 / Speechace版 共通）
+# load_config は画面の再実行ごとに何度も呼ばれる（クラス一覧・課題一覧・ルーブリック・アップロード制限など）。
+# 読み込んだ設定はプロセス内に持っておき、ファイルの更新時刻・サイズが変わったときだけ読み直す
+# （別の教員や手で編集した変更も、次の呼び出しから反映される）。
+# 書き込みは class_config.json.lock のファイルロックを取ってから、一時ファイルに書いて rename で置き換える。
+# 読み込み途中のファイルを見ることはなく、二人が同時に保存しても一方の変更が消えない（update_config を使う場合）。
+
+import json
+import os
+import tempfile
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Callable, Dict, Optional, Tuple
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+# クラス設定ファイル
+CLASS_CONFIG_FILE = Path(__file__).parent / "class_config.json"
+
+DEFAULT_CONFIG = {
+    'university': '北海道大学',
+    'department': '大学院メディア・コミュニケーション研究院',
+    'classes': ['英語特定技能演習（発信）', '英語特定技能演習（受信）', '英語I', '英語II']
+}
+
+_lock = threading.Lock()
+_cached: Optional[Tuple[Tuple[int, int, int], Dict[str, Any]]] = None
+
+def _signature() -> Optional[Tuple[int, int, int]]:
+    try:
+        st = CLASS_CONFIG_FILE.stat()
+    except FileNotFoundError:
+        return None
+    return st.st_mtime_ns, st.st_size, st.st_ino
+
+def load_config() -> Dict[str, Any]:
+    """設定全体を読み込む（ファイルが変わっていなければ前回読んだものを返す）
+
+    返す dict は呼び出し元どうしで共有するので書き換えないこと。変更は update_config で行う。
+    """
+    global _cached
+    signature = _signature()
+    if signature is None:
+        return DEFAULT_CONFIG
+    with _lock:
+        if _cached is None or _cached[0] != signature:
+            with open(CLASS_CONFIG_FILE, 'r', encoding='utf-8') as f:
+                _cached = (signature, json.load(f))
+        return _cached[1]
+
+@contextmanager
+def _file_lock():
+    """別のプロセス（もう一方のアプリ・評価サーバー）とも排他する書き込みロック"""
+    with _lock, open(CLASS_CONFIG_FILE.with_name(CLASS_CONFIG_FILE.name + ".lock"), "a+b") as f:
+        if fcntl:
+            fcntl.flock(f, fcntl.LOCK_EX)
+        else:
+            f.seek(0)
+            msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+        try:
+            yield
+        finally:
+            if fcntl:
+                fcntl.flock(f, fcntl.LOCK_UN)
+            else:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+def _write(config: Dict[str, Any]):
+    global _cached
+    fd, tmp = tempfile.mkstemp(prefix=CLASS_CONFIG_FILE.name + ".", suffix=".tmp", dir=CLASS_CONFIG_FILE.parent)
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump(config, f, ensure_ascii=False, indent=2)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, CLASS_CONFIG_FILE)
+    except BaseException:
+        Path(tmp).unlink(missing_ok=True)
+        raise
+    _cached = None
+
+def save_config(config: Dict[str, Any]):
+    """設定全体を保存（ファイル全体を置き換える。一部の項目だけ変えるときは update_config）"""
+    with _file_lock():
+        _write(config)
+
+def update_config(change: Callable[[Dict[str, Any]], None]) -> Dict[str, Any]:
+    """ロックを取ってから最新の設定を読み直し、change(config) で書き換えて保存する"""
+    with _file_lock():
+        if CLASS_CONFIG_FILE.exists():
+            with open(CLASS_CONFIG_FILE, 'r', encoding='utf-8') as f:
+                config = json.load(f)
+        else:
+            config = json.loads(json.dumps(DEFAULT_CONFIG))
+        change(config)
+        _write(config)
+    return config
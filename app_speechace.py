@@ -4,18 +4,37 @@
 import streamlit as st
 import pandas as pd
 import os
-import json
 import uuid
 import sqlite3
-import subprocess
-import requests
+import shutil
 from pathlib import Path
 from typing import Dict, Any, Optional
 from datetime import datetime
-from openai import OpenAI
-from pydub import AudioSegment
 import io
+from contextlib import contextmanager
 import time
+import scoring
+from app_config import load_config, update_config
+from db_utils import ensure_columns, insert_row
+import raw_store
+import phoneme_store
+import search_index
+import progress
+import rollup
+import analytics
+import archive
+import timing
+import audio_profile
+import audio_stream
+import audio_guard
+import audio_quality
+import async_engine
+import live_progress
+import text_align
+import assessment_server
+import feedback
+import blob_store
+from scoring import get_band, get_cefr, get_toefl, get_ielts
 
 # ============================================
 # 設定
@@ -24,7 +43,14 @@ import time
 DB_PATH = "history_speechace.db"
 DOWNLOADS_DIR = Path("./downloads")
 MAX_HISTORY = 1000
+ENGINE = "speechace"
+SCORE_COLUMNS = ["total_score", "pronunciation", "fluency", "prosody"]  # 進捗サマリー・クラス統計で集計する観点
+PHONEME_ERROR_THRESHOLD = 70  # 音素ヒートマップでエラーとみなすスコア
 SPEECHACE_API_URL = "https://api2.speechace.com/api/scoring/text/v9/json"
+CHUNK_SECONDS = 40
+PAUSE_SEARCH_SECONDS = 5  # チャンクの最後の5秒の中でいちばん静かな位置で区切る
+CHUNK_CONCURRENCY = 8  # 同時に処理するチャンク数（チャンクごとに Whisper → Speechace。共有のイベントループで待つ）
+DOWNLOAD_TIMEOUT = 600  # yt-dlp の待ち時間の上限（秒）
 
 
 def ensure_dir(d: Path):
@@ -34,25 +60,6 @@ def ensure_dir(d: Path):
 # SQLite データベース管理
 # ============================================
 
-# クラス設定ファイル
-CLASS_CONFIG_FILE = Path(__file__).parent / "class_config.json"
-
-def load_config():
-    """設定全体を読み込む"""
-    if CLASS_CONFIG_FILE.exists():
-        with open(CLASS_CONFIG_FILE, 'r', encoding='utf-8') as f:
-            return json.load(f)
-    return {
-        'university': '北海道大学',
-        'department': '大学院メディア・コミュニケーション研究院',
-        'classes': ['英語特定技能演習（発信）', '英語特定技能演習（受信）', '英語I', '英語II']
-    }
-
-def save_config(config):
-    """設定全体を保存"""
-    with open(CLASS_CONFIG_FILE, 'w', encoding='utf-8') as f:
-        json.dump(config, f, ensure_ascii=False, indent=2)
-
 def load_classes():
     """クラス設定を読み込む"""
     config = load_config()
@@ -60,12 +67,11 @@ def load_classes():
 
 def save_classes(classes):
     """クラス設定を保存"""
-    config = load_config()
-    config['classes'] = classes
-    save_config(config)
+    update_config(lambda config: config.update(classes=classes))
 
-# クラスリスト
-CLASS_LIST = ["-- 選択 --"] + load_classes()
+# クラスリスト（呼び出すたびに class_config.json の変更を反映する）
+def class_list():
+    return ["-- 選択 --"] + load_classes()
 
 def init_db():
     conn = sqlite3.connect(DB_PATH)
@@ -92,48 +98,72 @@ def init_db():
             word_scores TEXT,
             problem_words TEXT,
             feedback TEXT,
-            processing_time REAL
+            processing_time REAL,
+            rubric_version TEXT
         )
     ''')
+    ensure_columns(conn, "assessments", {"rubric_version": "TEXT"})
+    raw_store.init_table(conn)
+    phoneme_store.init_tables(conn)
+    timing.init_table(conn)
+    audio_quality.init_table(conn)
+    search_index.init_index(conn, ["problem_words"])
+    progress.init_table(conn, SCORE_COLUMNS)
+    rollup.init_tables(conn, SCORE_COLUMNS)
+    feedback.init_table(conn)
     conn.commit()
     conn.close()
 
-def save_assessment(data: Dict[str, Any]):
+def save_assessment(data: Dict[str, Any]) -> str:
+    db_start = time.perf_counter()
     conn = sqlite3.connect(DB_PATH)
     c = conn.cursor()
     
-    c.execute("SELECT COUNT(*) FROM assessments")
-    count = c.fetchone()[0]
-    if count >= MAX_HISTORY:
-        c.execute(f"DELETE FROM assessments WHERE id IN (SELECT id FROM assessments ORDER BY datetime ASC LIMIT {count - MAX_HISTORY + 1})")
-    
-    c.execute('''
-        INSERT INTO assessments VALUES (?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?)
-    ''', (
-        str(uuid.uuid4())[:8],
-        datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-        data.get("student_id", ""),
-        data.get("student_name", ""),
-        data.get("class_group", ""),
-        data.get("task_type", ""),
-        data.get("target_text", "")[:500],
-        data.get("transcription", "")[:1000],
-        data.get("pronunciation", 0),
-        data.get("fluency", 0),
-        data.get("prosody", 0),
-        data.get("total_score", 0),
-        data.get("band", ""),
-        data.get("cefr", ""),
-        data.get("toefl", ""),
-        data.get("ielts", ""),
-        data.get("speechace_ielts", ""),
-        data.get("word_scores", ""),
-        data.get("problem_words", ""),
-        data.get("feedback", ""),
-        data.get("processing_time", 0)
-    ))
+    # アーカイブ（archive.py）を使う場合は削除せず、終わった学期ごとに Parquet へ移す
+    if not archive.archive_dir():
+        c.execute("SELECT COUNT(*) FROM assessments")
+        count = c.fetchone()[0]
+        if count >= MAX_HISTORY:
+            c.execute(f"DELETE FROM assessments WHERE id IN (SELECT id FROM assessments ORDER BY datetime ASC LIMIT {count - MAX_HISTORY + 1})")
+    
+    assessment_id = str(uuid.uuid4())[:8]
+    saved_at = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    insert_row(conn, "assessments", {
+        "id": assessment_id,
+        "datetime": saved_at,
+        "student_id": data.get("student_id", ""),
+        "student_name": data.get("student_name", ""),
+        "class_group": data.get("class_group", ""),
+        "task_type": data.get("task_type", ""),
+        "target_text": data.get("target_text", "")[:500],
+        "transcription": data.get("transcription", "")[:1000],
+        "pronunciation": data.get("pronunciation", 0),
+        "fluency": data.get("fluency", 0),
+        "prosody": data.get("prosody", 0),
+        "total_score": data.get("total_score", 0),
+        "band": data.get("band", ""),
+        "cefr": data.get("cefr", ""),
+        "toefl": data.get("toefl", ""),
+        "ielts": data.get("ielts", ""),
+        "speechace_ielts": data.get("speechace_ielts", ""),
+        "word_scores": data.get("word_scores", ""),
+        "problem_words": data.get("problem_words", ""),
+        "feedback": data.get("feedback", ""),
+        "processing_time": data.get("processing_time", 0),
+        "rubric_version": data.get("rubric_version", "")
+    })
+    raw_store.save_raw(conn, assessment_id, ENGINE, data.get("raw"))
+    phoneme_store.save_scores(conn, assessment_id, data.get("class_group", ""), data.get("words", []))
+    progress.update(conn, data, SCORE_COLUMNS, saved_at)
+    rollup.update(conn, data, SCORE_COLUMNS, saved_at)
+    timings = data.get("timings")
+    if timings is not None:
+        timings.add("db", (time.perf_counter() - db_start) * 1000)
+    timing.save(conn, assessment_id, ENGINE, timings, saved_at)
+    audio_quality.save(conn, assessment_id, data.get("quality"), data.get("quality_warnings", []))
     conn.commit()
     conn.close()
+    return assessment_id
 
 def get_all_history() -> pd.DataFrame:
     conn = sqlite3.connect(DB_PATH)
@@ -150,21 +180,14 @@ def get_student_history(student_id: str) -> pd.DataFrame:
     conn.close()
     return df
 
-def get_class_stats() -> pd.DataFrame:
-    conn = sqlite3.connect(DB_PATH)
-    df = pd.read_sql_query('''
-        SELECT 
-            class_group as クラス,
-            COUNT(*) as 件数,
-            ROUND(AVG(total_score), 1) as 平均点,
-            ROUND(MIN(total_score), 1) as 最低点,
-            ROUND(MAX(total_score), 1) as 最高点
-        FROM assessments 
-        WHERE class_group != '' AND class_group != '-- 選択 --'
-        GROUP BY class_group ORDER BY class_group
-    ''', conn)
-    conn.close()
-    return df
+def get_score_frame() -> pd.DataFrame:
+    """集計・グラフ用の履歴（数値とカテゴリの列だけ。フィードバックなどの本文は読まない）"""
+    return analytics.load(DB_PATH, SCORE_COLUMNS)
+
+def get_class_stats(dimension: str = "total_score", task_type: Optional[str] = None,
+                    since_week: Optional[str] = None) -> pd.DataFrame:
+    """クラス別統計（集計テーブル class_rollup から。assessments は走査しない）"""
+    return rollup.class_summary(DB_PATH, dimension, task_type, since_week)
 
 def export_csv() -> str:
     df = get_all_history()
@@ -176,44 +199,49 @@ def export_csv() -> str:
 # 音声処理（YouTube / Google Drive / ファイル）
 # ============================================
 
-def convert_to_wav(input_path: Path, output_path: Path) -> Path:
-    audio = AudioSegment.from_file(input_path)
-    audio = audio.set_channels(1).set_frame_rate(16000).set_sample_width(2)
-    audio.export(output_path, format="wav")
+def convert_to_wav(input_path: Path, output_path: Path, max_seconds: Optional[float] = None) -> Path:
+    # 録音全体をメモリに載せないように ffmpeg の出力を1秒ずつ書き出す
+    with timing.span("convert"), audio_profile.profile("convert", input_path):
+        audio_stream.convert_to_wav(input_path, output_path, max_seconds)
     return output_path
 
-def split_audio(audio_path: Path, max_seconds: int = 40) -> list:
-    """音声を40秒ごとに分割"""
-    audio = AudioSegment.from_file(audio_path)
-    chunks = []
-    chunk_ms = max_seconds * 1000
-    
-    for i in range(0, len(audio), chunk_ms):
-        chunk = audio[i:i + chunk_ms]
-        chunk_path = DOWNLOADS_DIR / f"{uuid.uuid4().hex}_chunk{i//chunk_ms}.wav"
-        chunk.export(chunk_path, format="wav")
-        chunks.append(chunk_path)
-    
-    return chunks
+def prepare_audio(src: Path, task_type: str) -> Path:
+    """ヘッダだけ読んでサイズ・長さ・形式を確認してから WAV に変換する（規定外はデコード前に止める）"""
+    limits = audio_guard.load_limits(task_type)
+    with timing.span("probe"):
+        info = audio_guard.probe(src)
+        max_seconds = audio_guard.check(info, src.stat().st_size, limits)
+    if info["duration"] and info["duration"] > max_seconds:
+        st.warning(f"⚠️ 録音が{info['duration']:.0f}秒あるため、先頭の{max_seconds:g}秒だけを評価します")
+    ensure_dir(DOWNLOADS_DIR)
+    wav_path = DOWNLOADS_DIR / f"{uuid.uuid4().hex}.wav"
+    return convert_to_wav(src, wav_path, max_seconds)
+
+def split_audio(audio_path: Path, max_seconds: int = CHUNK_SECONDS) -> list:
+    """音声を40秒以下に分割（単語の途中で切らないように、区切りの手前の静かな位置で区切る）"""
+    with audio_profile.profile("split", audio_path):
+        return list(audio_stream.iter_chunks(audio_path, DOWNLOADS_DIR, max_seconds, prefix=f"{uuid.uuid4().hex}_chunk",
+                                             search_seconds=PAUSE_SEARCH_SECONDS))
 
-def download_from_youtube(url: str) -> Path:
+def download_from_youtube(url: str, task_type: str = "") -> Path:
     ensure_dir(DOWNLOADS_DIR)
     output_id = uuid.uuid4().hex
     output_template = str(DOWNLOADS_DIR / f"{output_id}.%(ext)s")
     
     cmd = ["yt-dlp", "-x", "--audio-format", "mp3", "--audio-quality", "128K", "-o", output_template, "--no-playlist", url]
-    result = subprocess.run(cmd, capture_output=True, text=True)
+    with timing.span("download"):
+        returncode, _, stderr = async_engine.run(async_engine.run_process(cmd, DOWNLOAD_TIMEOUT),
+                                                 poll=live_progress.flush)
     
-    if result.returncode != 0:
-        raise ValueError(f"YouTube ダウンロードエラー: {result.stderr}")
+    if returncode != 0:
+        raise ValueError(f"YouTube ダウンロードエラー: {stderr}")
     
     for f in DOWNLOADS_DIR.glob(f"{output_id}.*"):
-        wav_path = DOWNLOADS_DIR / f"{uuid.uuid4().hex}.wav"
-        return convert_to_wav(f, wav_path)
+        return prepare_audio(f, task_type)
     
     raise ValueError("ダウンロードしたファイルが見つかりません")
 
-def download_from_google_drive(url: str) -> Path:
+def download_from_google_drive(url: str, task_type: str = "") -> Path:
     ensure_dir(DOWNLOADS_DIR)
     
     try:
@@ -224,107 +252,177 @@ def download_from_google_drive(url: str) -> Path:
     output_path = DOWNLOADS_DIR / f"{uuid.uuid4().hex}.mp3"
     
     try:
-        gdown.download(url, str(output_path), quiet=False, fuzzy=True)
+        with timing.span("download"):
+            gdown.download(url, str(output_path), quiet=False, fuzzy=True)
     except Exception as e:
         raise ValueError(f"Google Drive ダウンロードエラー: {str(e)}")
     
     if not output_path.exists():
         raise ValueError("ダウンロードしたファイルが見つかりません")
     
-    wav_path = DOWNLOADS_DIR / f"{uuid.uuid4().hex}.wav"
-    return convert_to_wav(output_path, wav_path)
+    return prepare_audio(output_path, task_type)
 
-def process_uploaded_file(uploaded_file) -> Path:
+def save_upload(uploaded_file, task_type: str = "") -> Path:
     ensure_dir(DOWNLOADS_DIR)
+    # 全体を getvalue() で複製せず、サイズを確認してから少しずつ書き出す
+    audio_guard.check_size(uploaded_file.size, audio_guard.load_limits(task_type))
     ext = uploaded_file.name.split('.')[-1].lower()
     temp = DOWNLOADS_DIR / f"{uuid.uuid4().hex}.{ext}"
+    uploaded_file.seek(0)
     with open(temp, "wb") as f:
-        f.write(uploaded_file.getvalue())
-    wav = DOWNLOADS_DIR / f"{uuid.uuid4().hex}.wav"
-    return convert_to_wav(temp, wav)
+        shutil.copyfileobj(uploaded_file, f, 1024 * 1024)
+    return temp
+
+def process_uploaded_file(uploaded_file, task_type: str = "") -> Path:
+    return prepare_audio(save_upload(uploaded_file, task_type), task_type)
 
 # ============================================
 # Speechace 発音評価
 # ============================================
 
-def speechace_assess_single(audio_path: Path, target_text: str, api_key: str) -> Dict[str, Any]:
-    """単一チャンクの評価"""
-    with open(audio_path, 'rb') as f:
-        audio_data = f.read()
-    
-    files = {'user_audio_file': ('audio.wav', audio_data, 'audio/wav')}
-    data = {
-        'text': target_text,
-        'question_info': '{"questionId": "q1"}',
-        'user_id': 'student',
-        'dialect': 'en-us',
-        'include_fluency': '1',
-        'include_intonation': '1'
-    }
-    params = {'key': api_key}
-    
-    response = requests.post(SPEECHACE_API_URL, params=params, files=files, data=data)
-    
-    if response.status_code != 200:
-        raise ValueError(f"Speechace API エラー: {response.status_code}")
+def align_chunks(chunks: list, target_text: str, durations: list) -> tuple:
+    """目標テキストをチャンクごとの該当箇所に分ける。(チャンクごとのテキスト, 方式) を返す
+
+    OPENAI_API_KEY があれば各チャンクを Whisper で認識して対応付け、なければ（失敗したら）長さの比で割り振る。
+    """
+    if len(chunks) <= 1:
+        return [target_text] * len(chunks), "single"
+    api_key = os.getenv("OPENAI_API_KEY", "")
+    if api_key:
+        try:
+            transcripts = async_engine.run(async_engine.gather_limited(
+                [async_engine.transcribe(api_key, chunk_path) for chunk_path in chunks], CHUNK_CONCURRENCY),
+                poll=live_progress.flush)
+            return text_align.spans_from_transcripts(target_text, transcripts), "whisper"
+        except Exception:
+            pass
+    return text_align.spans_by_duration(target_text, durations), "duration"
+
+async def score_chunk(chunk_path: Path, text: Optional[str], api_key: str) -> Dict[str, Any]:
+    """1チャンク分の評価。text が None ならこのチャンクだけ Whisper で認識してから評価する"""
+    started = time.perf_counter()
+    if text is None:
+        text = await async_engine.transcribe(os.getenv("OPENAI_API_KEY", ""), chunk_path)
+    transcribed = time.perf_counter()
+    if not text.strip():
+        # 最初や最後の無音のチャンクなど。エラーではないので評価を省く（途中経過でも失敗に数えない）
+        return {"text": "", "result": {"status": "skipped", "detail_message": "音声または目標テキストの該当箇所がありません"},
+                "whisper_ms": (transcribed - started) * 1000, "transcribed": transcribed}
+    result = await async_engine.post_speechace(SPEECHACE_API_URL, api_key, chunk_path, text)
+    return {"text": text, "result": result, "whisper_ms": (transcribed - started) * 1000, "transcribed": transcribed}
+
+def chunk_scores(result: Dict[str, Any]) -> tuple:
+    """1チャンクの応答から (有効なセグメントのスコア, 単語スコア, 問題のある単語) を取り出す"""
+    scores, word_scores, problem_words = [], [], []
+    if result.get('status') != 'success':
+        return scores, word_scores, problem_words
+    text_score = result.get('text_score', {})
+    fluency_data = text_score.get('fluency', {})
     
-    return response.json()
+    # segment_metrics_listから有効なセグメントのスコアを取得
+    segment_list = fluency_data.get('segment_metrics_list', [])
+    for seg in segment_list:
+        # durationが0のセグメントは無視（音声がない部分）
+        if seg.get('duration', 0) > 0:
+            seg_score = seg.get('speechace_score', {})
+            seg_ielts = seg.get('ielts_score', {})
+            if seg_score.get('pronunciation', 0) > 0:
+                scores.append({
+                    'pronunciation': seg_score.get('pronunciation', 0),
+                    'fluency': seg_score.get('fluency', 0),
+                    'ielts_pron': seg_ielts.get('pronunciation', 0),
+                    'ielts_fluency': seg_ielts.get('fluency', 0)
+                })
+    
+    # 単語スコアも取得
+    for ws in text_score.get('word_score_list', []):
+        word = ws.get('word', '')
+        quality = ws.get('quality_score', 100)
+        word_scores.append(f"{word}:{quality}")
+        if quality < 70:
+            problem_words.append(f"{word}({quality}点)")
+    return scores, word_scores, problem_words
 
 def speechace_assess(audio_path: Path, target_text: str) -> Dict[str, Any]:
+    """チャンクごとに並列で評価する
+
+    目標テキストがある場合は、チャンクごとに読んだ範囲だけを送る（全文を送ると読んでいない部分が読み飛ばし扱いになる）。
+    ない場合は各チャンクの認識が終わったものから、その認識結果で評価を始める。
+    """
     api_key = os.getenv("SPEECHACE_API_KEY", "")
     if not api_key:
         raise ValueError("SPEECHACE_API_KEY が未設定です")
+    if not target_text and not os.getenv("OPENAI_API_KEY", ""):
+        raise ValueError("OPENAI_API_KEY が必要です")
+    timings = timing.current()
+    live = live_progress.current()
     
     # 音声を分割
-    chunks = split_audio(audio_path, max_seconds=40)
+    with timings.span("split"):
+        chunks = split_audio(audio_path, max_seconds=CHUNK_SECONDS)
+    live.set_chunks(len(chunks))
+    durations = [audio_stream.wav_seconds(chunk_path) for chunk_path in chunks]
+    offsets_ms = [round(sum(durations[:i]) * 1000) for i in range(len(chunks))]
+    
+    texts, align = [None] * len(chunks), "transcript"
+    if target_text:
+        with timings.span("align"):
+            texts, align = align_chunks(chunks, target_text, durations)
+    
+    async def tracked(index: int, chunk_path: Path, text: Optional[str]) -> Dict[str, Any]:
+        # 終わったチャンクから途中経過に加える（画面への表示は下の poll で）
+        live.chunk_started(index)
+        try:
+            outcome = await score_chunk(chunk_path, text, api_key)
+        except Exception as e:
+            live.chunk_done(index, error=str(e))
+            raise
+        result = outcome["result"]
+        scores, _, problem_words = chunk_scores(result)
+        status = result.get("status")
+        live.chunk_done(index, [{k: seg[k] for k in ("pronunciation", "fluency")} for seg in scores], problem_words,
+                        "" if status in ("success", "skipped") else result.get("detail_message", "エラー"),
+                        skipped=status == "skipped")
+        return outcome
+    
+    live.stage("engine")
+    started = time.perf_counter()
+    results = async_engine.run(async_engine.gather_limited(
+        [tracked(i, chunk_path, text) for i, (chunk_path, text) in enumerate(zip(chunks, texts))],
+        CHUNK_CONCURRENCY, return_exceptions=True), poll=live_progress.flush)
+    outcomes = []
+    for outcome in results:
+        if isinstance(outcome, Exception):
+            outcome = {"text": "", "result": {"status": "error", "detail_message": str(outcome)}}
+        outcomes.append(outcome)
+    finished = time.perf_counter()
+    # 認識と評価は重なって進むので、最後のチャンクの認識が終わるまでを Whisper、残りを発音評価として記録する
+    transcribed = [o["transcribed"] for o in outcomes if "transcribed" in o]
+    whisper_end = max(transcribed) if transcribed and not target_text else started
+    if not target_text:
+        timings.add("whisper", (whisper_end - started) * 1000)
+    timings.add("engine", (finished - whisper_end) * 1000)
+    transcription = target_text or " ".join(o["text"].strip() for o in outcomes if o["text"].strip())
     
     all_scores = []
     all_word_scores = []
     all_problem_words = []
+    raw_chunks = []
     
-    for chunk_path in chunks:
-        try:
-            result = speechace_assess_single(chunk_path, target_text, api_key)
-            
-            if result.get('status') == 'success':
-                text_score = result.get('text_score', {})
-                fluency_data = text_score.get('fluency', {})
-                
-                # segment_metrics_listから有効なセグメントのスコアを取得
-                segment_list = fluency_data.get('segment_metrics_list', [])
-                for seg in segment_list:
-                    # durationが0のセグメントは無視（音声がない部分）
-                    if seg.get('duration', 0) > 0:
-                        seg_score = seg.get('speechace_score', {})
-                        seg_ielts = seg.get('ielts_score', {})
-                        if seg_score.get('pronunciation', 0) > 0:
-                            all_scores.append({
-                                'pronunciation': seg_score.get('pronunciation', 0),
-                                'fluency': seg_score.get('fluency', 0),
-                                'ielts_pron': seg_ielts.get('pronunciation', 0),
-                                'ielts_fluency': seg_ielts.get('fluency', 0)
-                            })
-                
-                # 単語スコアも取得
-                for ws in text_score.get('word_score_list', []):
-                    word = ws.get('word', '')
-                    quality = ws.get('quality_score', 100)
-                    all_word_scores.append(f"{word}:{quality}")
-                    if quality < 70:
-                        all_problem_words.append(f"{word}({quality}点)")
-        except Exception as e:
-            pass
+    for outcome in outcomes:
+        result = outcome["result"]
+        raw_chunks.append(result)
+        
+        scores, word_scores, problem_words = chunk_scores(result)
+        all_scores += scores
+        all_word_scores += word_scores
+        all_problem_words += problem_words
     
     if not all_scores:
         raise ValueError("音声を評価できませんでした")
     
-    # 有効なスコア（pronunciation >= 50）だけを抽出
-    valid_scores = [s for s in all_scores if s['pronunciation'] >= 50]
-    
-    # 有効なスコアがない場合は全体から最高値を取得
-    if not valid_scores:
-        max_pron = max(s['pronunciation'] for s in all_scores)
-        valid_scores = [s for s in all_scores if s['pronunciation'] == max_pron]
+    # チャンクごとに読んだ範囲だけで評価しているので、全セグメントをそのまま平均する
+    valid_scores = all_scores
     
     # 有効セグメントの平均スコアを計算
     avg_pronunciation = sum(s['pronunciation'] for s in valid_scores) / len(valid_scores)
@@ -332,229 +430,89 @@ def speechace_assess(audio_path: Path, target_text: str) -> Dict[str, Any]:
     avg_ielts_pron = sum(s['ielts_pron'] for s in valid_scores) / len(valid_scores)
     avg_ielts_fluency = sum(s['ielts_fluency'] for s in valid_scores) / len(valid_scores)
     avg_ielts = (avg_ielts_pron + avg_ielts_fluency) / 2
+    raw = {"chunk_seconds": CHUNK_SECONDS, "chunk_offsets_ms": offsets_ms, "align": align,
+           "chunk_texts": [o["text"] for o in outcomes], "chunks": raw_chunks}
     
     return {
-        "transcription": target_text,
+        "transcription": transcription,
         "pronunciation": round(avg_pronunciation, 1),
         "fluency": round(avg_fluency, 1),
         "prosody": round((avg_pronunciation + avg_fluency) / 2, 1),  # 代替値
         "speechace_ielts": round(avg_ielts, 1) if avg_ielts else 'N/A',
         "word_scores": ", ".join(all_word_scores[:15]),
-        "problem_words": ", ".join(all_problem_words[:10]) if all_problem_words else "特になし"
-    }
-
-def _old_speechace_assess(audio_path: Path, target_text: str) -> Dict[str, Any]:
-    api_key = os.getenv("SPEECHACE_API_KEY", "")
-    if not api_key:
-        raise ValueError("SPEECHACE_API_KEY が未設定です")
-    
-    with open(audio_path, 'rb') as f:
-        audio_data = f.read()
-    
-    files = {'user_audio_file': ('audio.wav', audio_data, 'audio/wav')}
-    data = {
-        'text': target_text,
-        'question_info': '{"questionId": "q1"}',
-        'user_id': 'student',
-        'dialect': 'en-us',
-        'include_fluency': '1',
-        'include_intonation': '1'
-    }
-    params = {'key': api_key}
-    
-    response = requests.post(SPEECHACE_API_URL, params=params, files=files, data=data)
-    
-    if response.status_code != 200:
-        raise ValueError(f"Speechace API エラー: {response.status_code}")
-    
-    result = response.json()
-    
-    if result.get('status') != 'success':
-        raise ValueError(f"Speechace評価エラー: {result.get('detail_message', '不明')}")
-    
-    text_score = result.get('text_score', {})
-    
-    # 単語スコア解析
-    word_scores = []
-    problem_words = []
-    
-    for ws in text_score.get('word_score_list', []):
-        word = ws.get('word', '')
-        quality = ws.get('quality_score', 100)
-        word_scores.append(f"{word}:{quality}")
-        if quality < 70:
-            problem_words.append(f"{word}({quality}点)")
-    
-    overall = text_score.get('speechace_score', {})
-    fluency_data = text_score.get('fluency', {})
-    
-    return {
-        "transcription": target_text,
-        "pronunciation": round(overall.get('pronunciation', 0), 1),
-        "fluency": round(fluency_data.get('overall_score', 0) if fluency_data else 0, 1),
-        "prosody": round(fluency_data.get('rhythm_score', 0) if fluency_data else 0, 1),
-        "speechace_ielts": overall.get('ielts_score', 'N/A'),
-        "word_scores": ", ".join(word_scores[:10]),
-        "problem_words": ", ".join(problem_words) if problem_words else "特になし"
+        "problem_words": ", ".join(all_problem_words[:10]) if all_problem_words else "特になし",
+        "raw": raw,
+        "words": phoneme_store.speechace_words(raw)
     }
 
-def whisper_transcribe(audio_path: Path) -> str:
-    """Whisperで音声認識（目標テキストなしの場合）"""
-    api_key = os.getenv("OPENAI_API_KEY", "")
-    if not api_key:
-        raise ValueError("OPENAI_API_KEY が必要です")
-    
-    client = OpenAI(api_key=api_key)
-    with open(audio_path, "rb") as f:
-        transcript = client.audio.transcriptions.create(model="whisper-1", file=f, language="en")
-    return transcript.text
-
 # ============================================
 # スコア計算・換算
 # ============================================
 
-def calc_total(scores: Dict, task_type: str) -> float:
-    if task_type == "reading":
-        w = {"pronunciation": 0.50, "fluency": 0.30, "prosody": 0.20}
-    else:
-        w = {"pronunciation": 0.35, "fluency": 0.35, "prosody": 0.30}
-    return round(scores["pronunciation"]*w["pronunciation"] + scores["fluency"]*w["fluency"] + scores["prosody"]*w["prosody"], 1)
-
-def get_band(s: float) -> str:
-    if s >= 85: return "A（優秀）"
-    elif s >= 70: return "B（良好）"
-    elif s >= 55: return "C（要努力）"
-    else: return "D（要改善）"
-
-def get_cefr(s: float) -> str:
-    if s >= 90: return "C1"
-    elif s >= 80: return "B2"
-    elif s >= 70: return "B1"
-    elif s >= 55: return "A2"
-    elif s >= 40: return "A1"
-    else: return "Pre-A1"
-
-def get_toefl(s: float) -> str:
-    if s >= 90: return f"{min(30, 26+int((s-90)/10*4))}/30"
-    elif s >= 80: return f"{22+int((s-80)/10*4)}/30"
-    elif s >= 70: return f"{18+int((s-70)/10*4)}/30"
-    elif s >= 55: return f"{14+int((s-55)/15*4)}/30"
-    else: return f"{max(0,int(s/55*14))}/30"
-
-def get_ielts(s: float) -> str:
-    if s >= 90: i = min(9.0, 8.0+(s-90)/10)
-    elif s >= 80: i = 7.0+(s-80)/10
-    elif s >= 70: i = 6.0+(s-70)/10
-    elif s >= 60: i = 5.5+(s-60)/20
-    elif s >= 50: i = 5.0+(s-50)/20
-    elif s >= 40: i = 4.0+(s-40)/10
-    else: i = max(1.0, s/40*4)
-    return f"{round(i*2)/2}"
+def calc_total(scores: Dict, task_type: str, rubric: Optional[Dict] = None) -> float:
+    return scoring.calc_total(scores, task_type, ENGINE, rubric)
 
 # ============================================
 # AIフィードバック生成
 # ============================================
 
 def generate_feedback(transcription: str, target_text: str, scores: Dict, 
-                      problem_words: str, task_type: str) -> str:
+                      problem_words: str, task_type: str,
+                      rubric: Optional[Dict] = None, task_name: str = "") -> str:
+    # 総合点を計算してレベル判定（採点と同じルーブリックを使う）
+    total = calc_total(scores, task_type, rubric)
+    level_hint = scoring.get_level_hint(total, rubric)
+    item = feedback.make_item("", ENGINE, task_type, level_hint, target_text, transcription, scores,
+                              {"problem_words": problem_words}, total)
+    
+    # 普段の練習はローカルのコメント、成績を付ける課題（gpt_tasks）は GPT-4o（class_config.json の feedback）
+    if feedback.choose_engine(task_name) == "local":
+        return feedback.local_feedback(item)
+    
     api_key = os.getenv("OPENAI_API_KEY", "")
     if not api_key:
-        return "（OPENAI_API_KEY未設定のためフィードバック省略）"
-    
-    client = OpenAI(api_key=api_key)
-    
-    # 総合点を計算してレベル判定
-    total = (scores['pronunciation'] + scores['fluency']) / 2
-    
-    if total >= 85:
-        level_hint = "上位レベル。読んでる感をなくしスピーチのように。場数を踏む段階。"
-    elif total >= 70:
-        level_hint = "まあまあ良い方。リズム、抑揚、スピードの強弱を意識。"
-    elif total >= 55:
-        level_hint = "基本は掴んでいる。リズム、イントネーションを練習。"
-    else:
-        level_hint = "リズムを掴む練習が必要。発音より先にリズム、イントネーションを。"
-    
-    prompt = f"""あなたは日本の大学で英語を教える教員です。以下のサンプルのトーンを厳密に真似してフィードバックを書いてください。
-
-【絶対禁止】
-- 「素晴らしい！」「頑張ってください！」「この調子で！」のような過度に褒める表現
-- 「！」の多用
-- 学生を持ち上げすぎる表現
-
-【サンプルコメント（このトーンを真似すること）】
-1. 「もう少しリズムを掴む練習をしましょう。発音よりも、先ずはそこ。リズム、どこでポーズするか、スピードの強弱（単に速く読めって感じではない）、イントネーションを掴むといい。単語の発音も重要なんだけれど、日本語的でもそこが抑えられていれば、伝わる感じになる。」
-
-2. 「なかなかいい方です。大幅に直すところは今のところないですが、次の段階にいきましょう。可能な範囲で読んでいる感をなくしていき、スピーチ原稿を確認しながら話しているような感じを目指して音読の練習をしてください。」
-
-3. 「基本は掴んでいて、まあまあいい方だと思います。もう少しスピードの強弱をつけること、リズムを意識してください。余裕があるようであれば、単語レベルでの発音、特に子音の音を明瞭にすることも意識すると質の向上につながります。」
-
-4. 「最初よりいいという気がしますが、つっかかてるところがあるので、そこはなるべく減らしていきましょう。」
-
-5. 「伸び代があんまりでそうにないけれど、ここからのレベルは、場数を踏んで質をあげていくという感じなので、この調子で練習してください。」
-
-【学生の評価データ】
-- 目標テキスト: {target_text[:300]}
-- 学生の発話: {transcription[:300]}
-- 発音: {scores['pronunciation']}/100
-- 流暢さ: {scores['fluency']}/100  
-- 問題のある単語: {problem_words}
-- レベル判定: {level_hint}
-
-【フィードバックの構成】
-1. 全体的な印象（サンプルのトーンで。「まあまあいい方」「もう少しリズムを」など率直に）
-2. 良かった箇所があれば軽く触れる（大げさに褒めない）
-3. 改善点：問題のある単語を具体的に指摘（「〜の発音に注意。/r/の音を意識して」など）
-4. 練習のアドバイス（リズム、イントネーション、スピードの強弱、ポーズ位置など）
-
-【条件】
-- 300〜500字程度
-- サンプルのトーンを厳守（率直、実践的、過度に褒めない、「！」を使わない）
-- 「ですます調」と「だ・である調」混在OK"""
+        return feedback.fallback(item, "OPENAI_API_KEY未設定")
     
     try:
-        res = client.chat.completions.create(
-            model="gpt-4o",
-            temperature=0.7,
-            max_tokens=1000,
-            messages=[
-                {"role": "user", "content": prompt}
-            ]
-        )
-        return res.choices[0].message.content.strip()
+        return async_engine.run(feedback.generate_async(async_engine.openai_client(api_key), DB_PATH, item))
     except Exception as e:
-        return f"（フィードバック生成エラー: {str(e)}）"
+        return feedback.fallback(item, str(e))
 
 
 # ============================================
 # 評価実行（共通処理）
 # ============================================
 
-def run_assessment(audio_path: Path, student_id: str, student_name: str, 
-                   class_group: str, task_type: str, task_name: str, target_text: str):
-    
-    start_time = time.time()
-    # 目標テキストがない場合はWhisperで認識
-    if not target_text:
-        target_text = whisper_transcribe(audio_path)
-    
+def assess(audio_path: Path, student_id: str, student_name: str,
+           class_group: str, task_type: str, task_name: str, target_text: str) -> Dict[str, Any]:
+    """評価して履歴に保存する（画面には何も表示しない。評価サーバーのワーカーからも呼ばれる）"""
+    timings = timing.current()
+    # 無音・短すぎる録音などは API を呼ぶ前に止める（基準は class_config.json の quality_gate）
+    gate = audio_quality.load_gate(task_type)
+    with timings.span("quality"):
+        quality = audio_quality.analyze(audio_path, gate["silence_dbfs"])
+        quality_warnings = audio_quality.check(quality, gate)
+    # 目標テキストがない場合はチャンクごとに Whisper で認識して、その認識結果で評価する
     result = speechace_assess(audio_path, target_text)
+    target_text = target_text or result["transcription"]
     
     scores = {
         "pronunciation": result["pronunciation"],
         "fluency": result["fluency"],
         "prosody": result["prosody"]
     }
-    # デバッグ表示
-    st.write(f"DEBUG - 生スコア: pronunciation={result['pronunciation']}, fluency={result['fluency']}, prosody={result['prosody']}")
     task_val = "reading" if task_type == "音読課題" else "speech"
-    total = calc_total(scores, task_val)
-    band = get_band(total)
-    cefr = get_cefr(total)
-    toefl = get_toefl(total)
-    ielts = get_ielts(total)
-    
-    feedback = generate_feedback(result["transcription"], target_text, scores, result["problem_words"], task_val)
+    rubric = scoring.load_rubric()
+    total = calc_total(scores, task_val, rubric)
+    band = get_band(total, rubric)
+    cefr = get_cefr(total, rubric)
+    toefl = get_toefl(total, rubric)
+    ielts = get_ielts(total, rubric)
+    
+    with timings.span("feedback"):
+        feedback_text = generate_feedback(result["transcription"], target_text, scores, result["problem_words"], task_val,
+                                          rubric, task_name)
+    processing_time = round(timings.elapsed(), 1)
     
     save_data = {
         "student_id": student_id,
@@ -574,13 +532,89 @@ def run_assessment(audio_path: Path, student_id: str, student_name: str,
         "speechace_ielts": str(result.get("speechace_ielts", "")),
         "word_scores": result["word_scores"],
         "problem_words": result["problem_words"],
-        "feedback": feedback,
-        "processing_time": round(time.time() - start_time, 1)
+        "feedback": feedback_text,
+        "processing_time": processing_time,
+        "rubric_version": rubric["version"],
+        "raw": result.get("raw"),
+        "words": result.get("words", []),
+        "quality": quality,
+        "quality_warnings": quality_warnings,
+        "timings": timings
     }
-    save_assessment(save_data)
-    
-    processing_time = round(time.time() - start_time, 1)
-    st.success(f"✅ 評価完了！（処理時間: {processing_time}秒）履歴に保存しました。")
+    save_data["id"] = save_assessment(save_data)
+    return save_data
+
+@contextmanager
+def live_view():
+    """評価の途中経過を表示しながら実行する（st.spinner の代わり。終わったら消す）"""
+    box = st.empty()
+    live_progress.start(lambda p: show_progress(box, p))
+    try:
+        yield
+    finally:
+        box.empty()
+
+def show_progress(box, p: Dict[str, Any]):
+    with box.container():
+        st.info(f"🔄 {p['stage_label'] or '評価中'}...（{p['elapsed']:.0f}秒）")
+        if not p["total"]:
+            return
+        st.progress(p["done"] / p["total"], text=f"チャンク {p['done']} / {p['total']} 評価済み")
+        labels = dict(feedback.SCORE_LABELS[ENGINE])
+        if p["averages"]:
+            cols = st.columns(len(p["averages"]))
+            for col, (key, value) in zip(cols, p["averages"].items()):
+                col.metric(f"{labels.get(key, key)}（ここまでの平均）", value)
+        if p["problem_words"]:
+            st.caption("問題のある単語（ここまで）: " + ", ".join(p["problem_words"][:15]))
+        for index, seconds in p["running"]:
+            if seconds >= live_progress.SLOW_SECONDS:
+                st.warning(f"⏳ チャンク {index + 1} の応答が{seconds:.0f}秒ありません")
+        if p["failed"]:
+            st.warning(f"⚠️ {p['failed']}個のチャンクを評価できませんでした")
+        if p["skipped"]:
+            st.caption(f"{p['skipped']}個のチャンクは発話（または目標テキストの該当箇所）がないため評価を省きました")
+
+def run_assessment(audio_path: Path, student_id: str, student_name: str, 
+                   class_group: str, task_type: str, task_name: str, target_text: str):
+    show_result(assess(audio_path, student_id, student_name, class_group, task_type, task_name, target_text))
+
+def run_remote(source: Dict[str, Any], student_id: str, student_name: str,
+               class_group: str, task_type: str, task_name: str, target_text: str):
+    """評価サーバーに依頼して結果を表示する（source: file / youtube / gdrive、アップロードは upload）"""
+    status = st.empty()
+    with st.spinner("🔄 評価サーバーで処理中..."):
+        try:
+            if source["type"] == "upload":
+                # ワーカーが読めるようにサイズだけ確認して保存し、変換はワーカーに任せる
+                saved = save_upload(source["file"], task_type)
+                if blob_store.blob_dir():
+                    # 他のノードのワーカーも読めるように共有の置き場所に入れる
+                    source = {"type": "blob", "key": blob_store.put(saved)}
+                    saved.unlink()
+                else:
+                    source = {"type": "file", "path": str(saved.resolve())}
+            job = assessment_server.submit({
+                "engine": ENGINE, "source": source, "student_id": student_id, "student_name": student_name,
+                "class_group": class_group if class_group != "-- 選択 --" else "",
+                "task_type": task_type, "task_name": task_name, "target_text": target_text,
+            })
+            on_update = lambda s: status.info(
+                f"⏳ 待ち順: {s['position'] + 1}番目" if s.get("position") is not None else "⚙️ 評価中...")
+            on_update(job)
+            data = assessment_server.wait(job["id"], on_update)
+        except Exception as e:
+            status.empty()
+            st.error(f"❌ エラー: {str(e)}")
+            return
+    status.empty()
+    show_result(data)
+
+def show_result(data: Dict[str, Any]):
+    total, band, cefr, toefl, ielts = data["total_score"], data["band"], data["cefr"], data["toefl"], data["ielts"]
+    st.success(f"✅ 評価完了！（処理時間: {data['processing_time']}秒）履歴に保存しました。")
+    for message in data.get("quality_warnings", []):
+        st.warning(f"⚠️ {message}")
     
     st.divider()
     st.subheader("📊 評価結果")
@@ -593,9 +627,9 @@ def run_assessment(audio_path: Path, student_id: str, student_name: str,
     
     st.divider()
     c1, c2, c3 = st.columns(3)
-    c1.metric("発音スコア", f"{result['pronunciation']}")
-    c2.metric("流暢さ", f"{result['fluency']}")
-    c3.metric("プロソディ", f"{result['prosody']}")
+    c1.metric("発音スコア", f"{data['pronunciation']}")
+    c2.metric("流暢さ", f"{data['fluency']}")
+    c3.metric("プロソディ", f"{data['prosody']}")
     
     st.divider()
     c1, c2, c3 = st.columns(3)
@@ -603,25 +637,25 @@ def run_assessment(audio_path: Path, student_id: str, student_name: str,
     c2.info(f"**TOEFL Speaking**: {toefl}")
     c3.info(f"**IELTS Speaking**: {ielts}")
     
-    if result.get("speechace_ielts") and result["speechace_ielts"] != "N/A":
-        st.success(f"🎯 **Speechace IELTS推定スコア**: {result['speechace_ielts']}")
+    if data["speechace_ielts"] not in ("", "None", "N/A"):
+        st.success(f"🎯 **Speechace IELTS推定スコア**: {data['speechace_ielts']}")
     
     st.divider()
     st.subheader("🔍 単語レベル分析")
     c1, c2 = st.columns(2)
     with c1:
         st.markdown("**問題のある単語**")
-        st.warning(result["problem_words"])
+        st.warning(data["problem_words"])
     with c2:
         st.markdown("**単語別スコア（一部）**")
-        st.text(result["word_scores"])
+        st.text(data["word_scores"])
     
     st.divider()
     with st.expander("📝 目標/認識テキスト", expanded=True):
-        st.text(target_text)
+        st.text(data["target_text"])
     
     with st.expander("💬 AIフィードバック", expanded=True):
-        st.write(feedback)
+        st.write(data["feedback"])
 
 # ============================================
 # Streamlit UI
@@ -633,7 +667,7 @@ init_db()
 
 with st.sidebar:
     st.header("📊 メニュー")
-    menu = st.radio("", ["🎯 評価実行", "📋 履歴一覧", "🔍 学生検索", "📈 クラス統計", "📥 CSV出力", "⚙️ クラス設定"])
+    menu = st.radio("", ["🎯 評価実行", "📋 履歴一覧", "🔍 学生検索", "📊 学生進捗", "🔎 全文検索", "📈 クラス統計", "🔤 音素ヒートマップ", "⏱️ パフォーマンス", "📥 CSV出力", "⚙️ クラス設定"])
     
     st.divider()
     
@@ -650,7 +684,7 @@ with st.sidebar:
     
     st.divider()
     try:
-        df = get_all_history()
+        df = get_score_frame()
         st.metric("総評価件数", len(df))
         if len(df) > 0:
             st.metric("全体平均", f"{df['total_score'].mean():.1f}点")
@@ -682,7 +716,7 @@ if menu == "🎯 評価実行":
     
     c1, c2 = st.columns(2)
     with c1:
-        class_group = st.selectbox("クラス", CLASS_LIST)
+        class_group = st.selectbox("クラス", class_list())
     with c2:
         task_name = st.text_input("課題名", placeholder="例: 課題1、中間テスト等")
     
@@ -707,6 +741,7 @@ if menu == "🎯 評価実行":
     
     if input_method == "📁 ファイルアップロード":
         uploaded = st.file_uploader("音声ファイル", type=["mp3", "wav", "m4a", "ogg", "webm"])
+        st.caption(audio_guard.describe(audio_guard.load_limits(task_type)))
         
         if st.button("🚀 評価を実行", type="primary", use_container_width=True):
             if not student_id:
@@ -715,10 +750,13 @@ if menu == "🎯 評価実行":
                 st.error("⚠️ 音声ファイルをアップロードしてください")
             elif False:  # 目標テキストなしでもOK
                 st.error("⚠️ 音読課題では目標テキストが必須です")
+            elif assessment_server.server_url():
+                run_remote({"type": "upload", "file": uploaded}, student_id, student_name, class_group, task_type, task_name, target_text)
             else:
-                with st.spinner("🔄 評価中..."):
+                timing.start()
+                with live_view():
                     try:
-                        audio_path = process_uploaded_file(uploaded)
+                        audio_path = process_uploaded_file(uploaded, task_type)
                         run_assessment(audio_path, student_id, student_name, class_group, task_type, task_name, target_text)
                     except Exception as e:
                         st.error(f"❌ エラー: {str(e)}")
@@ -733,16 +771,19 @@ if menu == "🎯 評価実行":
                 st.error("⚠️ YouTubeリンクを入力してください")
             elif False:  # 目標テキストなしでもOK
                 st.error("⚠️ 音読課題では目標テキストが必須です")
+            elif assessment_server.server_url():
+                run_remote({"type": "youtube", "url": youtube_url}, student_id, student_name, class_group, task_type, task_name, target_text)
             else:
-                with st.spinner("🔄 YouTube音声をダウンロード中..."):
+                timing.start()
+                with live_view():
                     try:
-                        audio_path = download_from_youtube(youtube_url)
+                        audio_path = download_from_youtube(youtube_url, task_type)
                         st.success("✅ ダウンロード完了")
                     except Exception as e:
                         st.error(f"❌ ダウンロードエラー: {str(e)}")
                         st.stop()
                 
-                with st.spinner("🔄 評価中..."):
+                with live_view():
                     try:
                         run_assessment(audio_path, student_id, student_name, class_group, task_type, task_name, target_text)
                     except Exception as e:
@@ -759,16 +800,19 @@ if menu == "🎯 評価実行":
                 st.error("⚠️ Google Driveリンクを入力してください")
             elif False:  # 目標テキストなしでもOK
                 st.error("⚠️ 音読課題では目標テキストが必須です")
+            elif assessment_server.server_url():
+                run_remote({"type": "gdrive", "url": gdrive_url}, student_id, student_name, class_group, task_type, task_name, target_text)
             else:
-                with st.spinner("🔄 Google Driveからダウンロード中..."):
+                timing.start()
+                with live_view():
                     try:
-                        audio_path = download_from_google_drive(gdrive_url)
+                        audio_path = download_from_google_drive(gdrive_url, task_type)
                         st.success("✅ ダウンロード完了")
                     except Exception as e:
                         st.error(f"❌ ダウンロードエラー: {str(e)}")
                         st.stop()
                 
-                with st.spinner("🔄 評価中..."):
+                with live_view():
                     try:
                         run_assessment(audio_path, student_id, student_name, class_group, task_type, task_name, target_text)
                     except Exception as e:
@@ -782,7 +826,7 @@ elif menu == "📋 履歴一覧":
     else:
         c1, c2 = st.columns(2)
         with c1:
-            cls_filter = st.selectbox("クラス絞込", ["すべて"] + [c for c in CLASS_LIST if c != "-- 選択 --"])
+            cls_filter = st.selectbox("クラス絞込", ["すべて"] + load_classes())
         with c2:
             task_filter = st.selectbox("課題絞込", ["すべて", "音読課題", "スピーチ課題"])
         
@@ -826,10 +870,17 @@ elif menu == "🔍 学生検索":
             st.warning("該当する履歴がありません")
         else:
             st.success(f"✅ {len(df)}件の履歴")
-            c1, c2, c3 = st.columns(3)
-            c1.metric("評価回数", len(df))
-            c2.metric("平均点", f"{df['total_score'].mean():.1f}")
-            c3.metric("最高点", f"{df['total_score'].max():.1f}")
+            summary = progress.student_summary(DB_PATH, search_id)
+            overall = summary[(summary["課題タイプ"] == "全体") & (summary["観点"] == "総合")]
+            if len(overall) > 0:
+                o = overall.iloc[0]
+                c1, c2, c3, c4 = st.columns(4)
+                c1.metric("評価回数", int(o["回数"]))
+                c2.metric("平均点", f"{o['平均']:.1f}")
+                c3.metric("最高点", f"{o['最高']:.1f}")
+                c4.metric("最新", f"{o['最新']:.1f}", delta=f"{o['初回→最新']:+.1f}（初回比）")
+                with st.expander("📊 観点別・課題タイプ別の推移", expanded=False):
+                    st.dataframe(summary, use_container_width=True, hide_index=True)
             st.divider()
             for _, row in df.iterrows():
                 with st.expander(f"📅 {row['datetime']} | {row['task_type']} | {row['total_score']}点"):
@@ -838,16 +889,132 @@ elif menu == "🔍 学生検索":
                     st.write("**問題単語**:", row['problem_words'])
                     st.write("**フィードバック**:", row['feedback'])
 
+elif menu == "📊 学生進捗":
+    st.title("📊 学生別 進捗ダッシュボード")
+    c1, c2, c3 = st.columns(3)
+    with c1:
+        cls_filter = st.selectbox("クラス", ["すべて"] + load_classes())
+    with c2:
+        dimension = st.selectbox("観点", SCORE_COLUMNS, format_func=lambda d: progress.DIMENSION_LABELS.get(d, d))
+    with c3:
+        task_filter = st.selectbox("課題タイプ", ["すべて", "音読課題", "スピーチ課題"])
+    board = progress.course_progress(
+        DB_PATH, dimension,
+        class_group=None if cls_filter == "すべて" else cls_filter,
+        task_type=progress.ALL_TASKS if task_filter == "すべて" else task_filter
+    )
+    if len(board) == 0:
+        st.info("データがありません")
+    else:
+        c1, c2, c3 = st.columns(3)
+        c1.metric("学生数", len(board))
+        c2.metric("平均（学生平均の平均）", f"{board['平均'].mean():.1f}")
+        c3.metric("初回→最新（平均）", f"{board['初回→最新'].mean():+.1f}")
+        st.dataframe(board, use_container_width=True, hide_index=True)
+        import plotly.express as px
+        fig = px.bar(board.sort_values("初回→最新"), x="学籍番号", y="初回→最新", color="伸び/回",
+                     hover_data=["氏名", "回数", "平均"], title="初回→最新の変化", color_continuous_scale="RdBu")
+        st.plotly_chart(fig, use_container_width=True)
+
+elif menu == "🔎 全文検索":
+    st.title("🔎 全文検索")
+    st.caption("目標テキスト・書き起こし・AIフィードバック・問題単語から検索（例: /θ/、ポーズ）")
+    c1, c2 = st.columns([3, 1])
+    with c1:
+        query = st.text_input("キーワード（スペース区切りでAND検索）")
+    with c2:
+        cls_filter = st.selectbox("クラス絞込", ["すべて"] + load_classes())
+    if query:
+        page_size = 20
+        page = st.number_input("ページ", min_value=1, value=1, step=1)
+        total, results = search_index.search(
+            DB_PATH, query, None if cls_filter == "すべて" else cls_filter,
+            limit=page_size, offset=(page - 1) * page_size
+        )
+        if total == 0:
+            st.warning("該当する履歴がありません")
+        elif len(results) == 0:
+            st.warning(f"{total}件ヒットしましたが、このページには結果がありません")
+        else:
+            pages = (total + page_size - 1) // page_size
+            st.caption(f"{total}件中 {(page - 1) * page_size + 1}〜{min(page * page_size, total)}件目（{page}/{pages}ページ）")
+            for _, row in results.iterrows():
+                with st.expander(f"📝 {row['datetime']} | {row['student_id']} {row['student_name']} | {row['task_type']} | {row['total_score']}点", expanded=True):
+                    st.markdown(row['snippet'])
+
 elif menu == "📈 クラス統計":
     st.title("📈 クラス別統計")
-    stats = get_class_stats()
+    c1, c2, c3 = st.columns(3)
+    with c1:
+        dimension = st.selectbox("観点", SCORE_COLUMNS, format_func=lambda d: progress.DIMENSION_LABELS.get(d, d))
+    with c2:
+        task_filter = st.selectbox("課題タイプ", ["すべて", "音読課題", "スピーチ課題"])
+    with c3:
+        period = st.selectbox("期間", ["全期間", "直近4週", "直近12週"])
+    task_type = None if task_filter == "すべて" else task_filter
+    since_week = None
+    if period != "全期間":
+        weeks = 4 if period == "直近4週" else 12
+        since_week = rollup.iso_week((datetime.now() - pd.Timedelta(weeks=weeks - 1)).strftime("%Y-%m-%d"))
+    stats = get_class_stats(dimension, task_type, since_week)
     if len(stats) == 0:
         st.info("データがありません")
     else:
-        st.dataframe(stats, use_container_width=True)
+        st.dataframe(stats, use_container_width=True, hide_index=True)
+        st.caption("P25〜P90 は1点刻みのヒストグラムからの近似値です")
+        import plotly.express as px
+        fig = px.bar(stats, x='クラス', y='平均点', error_y='標準偏差', title='クラス別平均スコア', color='平均点', color_continuous_scale='Greens')
+        st.plotly_chart(fig, use_container_width=True)
+        
+        st.divider()
+        st.subheader("週ごとの推移")
+        cls = st.selectbox("クラス", ["全クラス"] + list(stats["クラス"]))
+        trend = rollup.weekly_trend(DB_PATH, dimension, None if cls == "全クラス" else cls, task_type, since_week)
+        fig = px.line(trend, x="週", y=["平均点", "P25", "P50", "P75"], markers=True, title=f"{cls}の週別スコア")
+        st.plotly_chart(fig, use_container_width=True)
+        
+        st.subheader("観点別の平均点")
+        means = rollup.dimension_means(DB_PATH, SCORE_COLUMNS, task_type, since_week)
+        st.dataframe(means.rename(columns=progress.DIMENSION_LABELS), use_container_width=True, hide_index=True)
+
+elif menu == "🔤 音素ヒートマップ":
+    st.title("🔤 クラス別 音素ヒートマップ")
+    stats = phoneme_store.class_phoneme_stats(DB_PATH, PHONEME_ERROR_THRESHOLD)
+    if len(stats) == 0:
+        st.info("データがありません（音素スコアはこの機能の追加後に評価した分から蓄積されます）")
+    else:
+        metric = st.radio("表示する値", ["エラー率", "平均スコア"], horizontal=True)
+        # 全クラスで苦手な音素から順に並べる
+        order = stats.groupby("音素")["エラー率"].mean().sort_values(ascending=False).index
+        pivot = stats.pivot(index="クラス", columns="音素", values=metric)[order]
+        import plotly.express as px
+        fig = px.imshow(pivot, aspect="auto", labels=dict(color=metric),
+                        color_continuous_scale="Reds" if metric == "エラー率" else "Blues")
+        st.plotly_chart(fig, use_container_width=True)
+        st.caption(f"エラー率: 音素スコアが{PHONEME_ERROR_THRESHOLD}点未満の割合（%）")
+        
+        st.divider()
+        cls = st.selectbox("クラス別の苦手な単語", list(pivot.index))
+        st.dataframe(phoneme_store.class_problem_words(DB_PATH, cls), use_container_width=True)
+
+elif menu == "⏱️ パフォーマンス":
+    st.title("⏱️ 処理時間（段階別）")
+    period = st.selectbox("期間", ["直近7日", "直近30日", "全期間"])
+    since = None
+    if period != "全期間":
+        days = 7 if period == "直近7日" else 30
+        since = (datetime.now() - pd.Timedelta(days=days)).strftime("%Y-%m-%d %H:%M:%S")
+    stats = timing.stage_percentiles(DB_PATH, since)
+    if len(stats) == 0:
+        st.info("データがありません（段階別の計測はこの機能の追加後に評価した分から蓄積されます）")
+    else:
+        st.dataframe(stats, use_container_width=True, hide_index=True)
+        st.caption("単位: ミリ秒")
         import plotly.express as px
-        fig = px.bar(stats, x='クラス', y='平均点', title='クラス別平均スコア', color='平均点', color_continuous_scale='Greens')
+        fig = px.bar(stats, x="段階", y=["p50", "p95", "p99"], barmode="group", title="段階別の処理時間（ミリ秒）")
         st.plotly_chart(fig, use_container_width=True)
+        st.download_button("📥 Prometheus形式でダウンロード", data=timing.prometheus_text(DB_PATH, since),
+                           file_name="speechace_timings.prom", mime="text/plain")
 
 elif menu == "📥 CSV出力":
     st.title("📥 データエクスポート")
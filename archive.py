@@ -0,0 +1,275 @@
+# archive.py - 終わった学期の履歴を Parquet に移し、学期をまたいだ集計をする
+# 履歴DBは MAX_HISTORY 件を超えると古い評価から削除されるため、入学年度をまたいだ発音の伸びの研究ができなかった。
+# ここでは終わった学期の評価を SQLite から年度・学期・クラスで分けた Parquet に移し、履歴DBは今の学期だけにする。
+#   <ASSESSMENT_ARCHIVE_DIR>/<engine>/<table>/year=2025/term=1/class_group=英語I/<engine>-<実行ID>-0.parquet
+# table は assessments（評価1件1行）、word_scores / phoneme_scores（単語・音素スコア）、
+# assessment_raw（エンジンの生レスポンス。圧縮したまま。raw_records() で読む）、audio_quality（音声の品質）、
+# assessment_timings（段階別の所要時間）。APIを呼ばずに再採点・再分析できるように生レスポンスも残す。
+# 履歴DBから消す前に、書き出したファイルを読み戻して件数と生レスポンスが一致することを確かめる。
+# 学期は class_config.json の archive.term_start_months（既定 [4, 10]: 4月〜9月が1、10月〜3月が2）で決め、
+# 1〜3月は前の年度の最後の学期に入れる。
+# 集計は query()（pyarrow.dataset）か sql()（DuckDB）で行う。年度・学期・クラスの条件に当たらない
+# ディレクトリは開かず、残ったファイルも Parquet の統計で行グループを読み飛ばす（述語プッシュダウン）。
+# pyarrow が必要（pip install pyarrow）。sql() はさらに duckdb が必要（pip install duckdb）。
+#
+# 使い方:
+#   python archive.py history_azure.db --archive-dir /mnt/shared/archive            # 今の学期より前を移す
+#   python archive.py history_speechace.db --before 2025-10-01 --dry-run           # 対象件数だけ表示
+# ASSESSMENT_ARCHIVE_DIR を設定したアプリは MAX_HISTORY による削除をしない（古い評価はここで移す）。
+
+import argparse
+import os
+import sqlite3
+import uuid
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+
+import pandas as pd
+
+import raw_store
+import search_index
+from app_config import load_config
+from rescore import detect_engine
+
+TABLES = ["assessments", "word_scores", "phoneme_scores", "assessment_raw", "audio_quality", "assessment_timings"]
+PARTITION_COLUMNS = ["year", "term", "class_group"]
+DEFAULT_TERM_START_MONTHS = [4, 10]
+
+def archive_dir() -> Optional[Path]:
+    """アーカイブの置き場所（未設定なら None。その場合アプリは従来どおり MAX_HISTORY で古い評価を削除する）"""
+    d = os.getenv("ASSESSMENT_ARCHIVE_DIR", "")
+    return Path(d) if d else None
+
+def _root(root: Optional[Path]) -> Path:
+    root = root or archive_dir()
+    if root is None:
+        raise ValueError("ASSESSMENT_ARCHIVE_DIR が設定されていません")
+    return Path(root)
+
+def _pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.dataset
+    except ImportError:
+        raise ValueError("アーカイブには pyarrow が必要です: pip install pyarrow")
+    return pyarrow, pyarrow.dataset
+
+# ============================================
+# 学期
+# ============================================
+
+def term_start_months() -> List[int]:
+    return sorted(load_config().get("archive", {}).get("term_start_months", DEFAULT_TERM_START_MONTHS))
+
+def term_of(at: datetime, starts: Optional[Sequence[int]] = None) -> Tuple[int, int]:
+    """(年度, 学期)。学期は1から数える"""
+    starts = starts or term_start_months()
+    passed = [i for i, month in enumerate(starts) if month <= at.month]
+    if not passed:
+        return at.year - 1, len(starts)
+    return at.year, passed[-1] + 1
+
+def term_start(year: int, term: int, starts: Optional[Sequence[int]] = None) -> str:
+    """学期の初日（assessments.datetime と比べられる文字列）"""
+    starts = starts or term_start_months()
+    return f"{year}-{starts[term - 1]:02d}-01 00:00:00"
+
+def _add_terms(df: pd.DataFrame, at: pd.Series, starts: Sequence[int]) -> pd.DataFrame:
+    at = pd.to_datetime(at, errors="coerce")
+    terms = [term_of(t, starts) if not pd.isna(t) else (None, None) for t in at]
+    df["year"] = pd.array([y for y, _ in terms], dtype="Int32")
+    df["term"] = pd.array([t for _, t in terms], dtype="Int32")
+    # クラスなしは空文字ではなく null にする（Hive 形式のディレクトリ名にできないため）
+    df["class_group"] = df["class_group"].replace("", None)
+    return df
+
+# ============================================
+# 移動
+# ============================================
+
+def _select(conn: sqlite3.Connection, table: str, cutoff: str) -> pd.DataFrame:
+    if table == "assessments":
+        df = pd.read_sql_query("SELECT * FROM assessments WHERE datetime < ?", conn, params=(cutoff,))
+        return _add_terms(df, df["datetime"], term_start_months())
+    # 評価に付いている行は評価の日時で学期を決める（クラスも評価の側に合わせる）
+    df = pd.read_sql_query(f'''
+        SELECT t.*, a.datetime AS assessed_at, a.class_group AS assessment_class
+        FROM {table} t JOIN assessments a ON a.id = t.assessment_id
+        WHERE a.datetime < ?
+    ''', conn, params=(cutoff,))
+    df["class_group"] = df.pop("assessment_class")
+    return _add_terms(df, df.pop("assessed_at"), term_start_months())
+
+def _schema(conn: sqlite3.Connection, table: str):
+    """SQLite の列の型から Parquet の型を決める（すべて null の列があっても、実行ごとに型が変わらないように）"""
+    pa, _ = _pyarrow()
+    types = {"TEXT": pa.string(), "REAL": pa.float64(), "INTEGER": pa.int64(), "BLOB": pa.binary()}
+    fields = [(row[1], types.get(row[2].upper(), pa.string())) for row in conn.execute(f"PRAGMA table_info({table})")]
+    # クラス列のない表（生レスポンス・品質・計測値）は評価の側のクラスで分ける
+    if "class_group" not in {name for name, _ in fields}:
+        fields.append(("class_group", pa.string()))
+    return pa.schema(fields + [("year", pa.int32()), ("term", pa.int32())])
+
+def _write(df: pd.DataFrame, schema, path: Path, basename: str, written: List[str]):
+    pa, ds = _pyarrow()
+    ds.write_dataset(
+        pa.Table.from_pandas(df[schema.names], schema=schema, preserve_index=False), str(path), format="parquet",
+        partitioning=ds.partitioning(pa.schema([schema.field(c) for c in PARTITION_COLUMNS]), flavor="hive"),
+        basename_template=basename + "-{i}.parquet", existing_data_behavior="overwrite_or_ignore",
+        file_visitor=lambda f: written.append(f.path),
+    )
+
+def _verify(conn: sqlite3.Connection, cutoff: str, base: Path, counts: Dict[str, int], written: List[str]):
+    """書き出したファイルを読み戻し、表ごとの件数と生レスポンスが履歴DBと一致するか確かめる（合わなければ ValueError）"""
+    _, ds = _pyarrow()
+
+    def files(table: str) -> List[str]:
+        prefix = str(base / table) + os.sep
+        return [path for path in written if path.startswith(prefix)]
+
+    for table, expected in counts.items():
+        paths = files(table)
+        archived = ds.dataset(paths, format="parquet").count_rows() if paths else 0
+        if archived != expected:
+            raise ValueError(f"アーカイブを読み戻した件数が一致しません: {table} {archived}/{expected}件")
+    paths = files("assessment_raw")
+    if not paths:
+        return
+    stored = dict(conn.execute('''
+        SELECT r.assessment_id, r.payload FROM assessment_raw r JOIN assessments a ON a.id = r.assessment_id
+        WHERE a.datetime < ?
+    ''', (cutoff,)))
+    for row in ds.dataset(paths, format="parquet").to_table(columns=["assessment_id", "codec", "payload"]).to_pylist():
+        if stored.get(row["assessment_id"]) != row["payload"]:
+            raise ValueError(f"アーカイブの生レスポンスが一致しません: {row['assessment_id']}")
+        raw_store.decode(row["codec"], row["payload"])
+
+def archive_closed_terms(db_path: str, root: Optional[Path] = None, before: Optional[datetime] = None,
+                         engine: Optional[str] = None, dry_run: bool = False, vacuum: bool = True) -> pd.DataFrame:
+    """before（既定: 今日）を含む学期より前の評価を Parquet に書き出してから履歴DBから削除する
+
+    書き出しがすべて終わり、読み戻して確かめてから1つのトランザクションで削除する。確認か削除に失敗したら
+    書き出したファイルを消す（両方に残ったり、どちらからも消えたりしない）。年度・学期・クラスごとの件数を返す。
+    """
+    root = _root(root)
+    year, term = term_of(before or datetime.now())
+    cutoff = term_start(year, term)
+    conn = sqlite3.connect(db_path)
+    written: List[str] = []
+    try:
+        engine = engine or detect_engine(conn)
+        assessments = _select(conn, "assessments", cutoff)
+        summary = assessments.groupby(PARTITION_COLUMNS, dropna=False).size().rename("件数").reset_index()
+        if dry_run or len(assessments) == 0:
+            return summary
+        basename = f"{engine}-{uuid.uuid4().hex[:12]}"
+        try:
+            counts: Dict[str, int] = {}
+            for table in TABLES:
+                if not conn.execute("SELECT name FROM sqlite_master WHERE type = 'table' AND name = ?",
+                                    (table,)).fetchone():
+                    continue  # この機能より前のDB
+                df = assessments if table == "assessments" else _select(conn, table, cutoff)
+                counts[table] = len(df)
+                if len(df):
+                    _write(df, _schema(conn, table), root / engine / table, basename, written)
+            _verify(conn, cutoff, root / engine, counts, written)
+            with conn:
+                # 単語・音素・生レスポンス・品質・計測値はトリガーで一緒に消える（どれも上で書き出し済み。
+                # 集計テーブルはそのまま残る）
+                search_index.delete_assessments(conn, "datetime < ?", (cutoff,))
+        except Exception:
+            for path in written:
+                Path(path).unlink(missing_ok=True)
+            raise
+        if vacuum:
+            conn.execute("VACUUM")
+        return summary
+    finally:
+        conn.close()
+
+# ============================================
+# 集計
+# ============================================
+
+def dataset(engine: str, table: str = "assessments", root: Optional[Path] = None):
+    """pyarrow.dataset.Dataset（年度・学期・クラスはディレクトリ名から読む）"""
+    _, ds = _pyarrow()
+    path = _root(root) / engine / table
+    if not path.exists():
+        raise ValueError(f"アーカイブがありません: {path}")
+    return ds.dataset(str(path), format="parquet", partitioning="hive")
+
+def _expression(where: Dict[str, Any]):
+    """{"year": 2025, "class_group": ["英語I", "英語II"], "total_score": (">=", 80)} → pyarrow の式"""
+    _, ds = _pyarrow()
+    expr = None
+    for col, value in where.items():
+        field = ds.field(col)
+        if isinstance(value, tuple):
+            op, operand = value
+            cond = {"==": field == operand, "!=": field != operand, "<": field < operand,
+                    "<=": field <= operand, ">": field > operand, ">=": field >= operand}[op]
+        elif isinstance(value, (list, set)):
+            cond = field.isin(list(value))
+        else:
+            cond = field == value
+        expr = cond if expr is None else expr & cond
+    return expr
+
+def query(engine: str, table: str = "assessments", columns: Optional[List[str]] = None,
+          where: Optional[Dict[str, Any]] = None, root: Optional[Path] = None) -> pd.DataFrame:
+    """アーカイブから必要な列・行だけ読む。where は列 → 値（リストなら isin、(演算子, 値) なら比較）"""
+    expr = _expression(where) if where else None
+    return dataset(engine, table, root).to_table(columns=columns, filter=expr).to_pandas()
+
+def raw_records(engine: str, where: Optional[Dict[str, Any]] = None,
+                root: Optional[Path] = None) -> Iterator[raw_store.RawRecord]:
+    """アーカイブした生レスポンス（raw_store.iter_raw と同じ RawRecord。data で展開した JSON を読む）"""
+    table = dataset(engine, "assessment_raw", root).to_table(
+        columns=["assessment_id", "engine", "codec", "raw_size", "payload"],
+        filter=_expression(where) if where else None,
+    )
+    for row in table.to_pylist():
+        yield raw_store.RawRecord(row["assessment_id"], row["engine"], row["codec"], row["raw_size"], row["payload"])
+
+def sql(statement: str, root: Optional[Path] = None) -> pd.DataFrame:
+    """DuckDB の SQL で集計する。<engine>_<table>（例: azure_assessments）というビューで参照できる"""
+    try:
+        import duckdb
+    except ImportError:
+        raise ValueError("sql() には duckdb が必要です: pip install duckdb")
+    root = _root(root)
+    con = duckdb.connect()
+    try:
+        for engine_dir in sorted(p for p in root.iterdir() if p.is_dir()):
+            for table_dir in sorted(p for p in engine_dir.iterdir() if p.is_dir()):
+                pattern = str(table_dir / "**" / "*.parquet").replace("'", "''")
+                con.execute(f'CREATE VIEW "{engine_dir.name}_{table_dir.name}" AS '
+                            f"SELECT * FROM read_parquet('{pattern}', hive_partitioning = true)")
+        return con.execute(statement).df()
+    finally:
+        con.close()
+
+def main():
+    parser = argparse.ArgumentParser(description="終わった学期の履歴を Parquet のアーカイブに移す")
+    parser.add_argument("db_path", help="履歴DB（history_azure.db / history_speechace.db）")
+    parser.add_argument("--archive-dir", default=None, help="省略時は ASSESSMENT_ARCHIVE_DIR")
+    parser.add_argument("--before", default=None, help="この日を含む学期より前を移す（例: 2025-10-01。既定: 今日）")
+    parser.add_argument("--engine", choices=["azure", "speechace"], default=None, help="省略時は列構成から判定")
+    parser.add_argument("--dry-run", action="store_true", help="移さずに件数だけ表示")
+    parser.add_argument("--no-vacuum", action="store_true", help="削除後に VACUUM しない")
+    args = parser.parse_args()
+
+    before = datetime.strptime(args.before, "%Y-%m-%d") if args.before else None
+    root = Path(args.archive_dir) if args.archive_dir else None
+    summary = archive_closed_terms(args.db_path, root, before, args.engine, args.dry_run, not args.no_vacuum)
+    if len(summary) == 0:
+        print("移す評価はありません")
+        return
+    print(summary.to_string(index=False))
+    print(f"{int(summary['件数'].sum())}件を{'移す予定です' if args.dry_run else '移しました'}")
+
+if __name__ == "__main__":
+    main()
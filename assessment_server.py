@@ -0,0 +1,472 @@
+# assessment_server.py - 評価処理を Streamlit から切り離すローカルの評価サーバー
+# Streamlit はセッションごとのスクリプトを1つのプロセスのスレッドで実行するため、
+# ある教員の音声変換（ffmpeg）や発音評価APIの待ちが、同じアプリを使う他のセッションまで遅くする。
+# このサーバーは評価（ダウンロード・ヘッダ確認・変換・Whisper・発音評価・GPT-4o・DB保存）を
+# ワーカープロセスのプールで実行し、アプリは依頼と結果の表示だけを行う。
+#
+# 使い方（アプリと同じディレクトリで起動する。DB と downloads/ はアプリと共有）:
+#   python assessment_server.py --workers 4 --port 8765
+#   python assessment_server.py --workers 4 --socket /tmp/assessment.sock
+# アプリ側は環境変数 ASSESSMENT_SERVER を設定すると評価をサーバーに依頼する（未設定なら従来どおり）:
+#   ASSESSMENT_SERVER=http://127.0.0.1:8765
+#   ASSESSMENT_SERVER=unix:///tmp/assessment.sock
+#
+# API（JSON）
+#   POST /jobs       評価を依頼 → 202 {"id", "position"}。待ち行列が一杯なら 429（Retry-After 付き）
+#   GET  /jobs/<id>  状態（queued / running / done / error）と結果
+#   GET  /health     ワーカー数・実行中の件数・クラス別の待ち件数
+# 待ち行列はクラスごとに分け、ラウンドロビンでワーカーに渡す（あるクラスの一括提出で他のクラスが待たされない）。
+#
+# 複数ノードで動かす場合は --store で共有ジョブストア（job_store.py）を指定し、他のノードでは
+# assessment_worker.py を起動する。アップロードされた音声は ASSESSMENT_BLOB_DIR（blob_store.py）経由で渡す。
+#   python assessment_server.py --workers 2 --store sqlite:////mnt/shared/assessment/jobs.db
+
+import argparse
+import http.client
+import importlib
+import json
+import logging
+import math
+import multiprocessing
+import os
+import socket
+import socketserver
+import threading
+import time
+import uuid
+from collections import OrderedDict, deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Any, Callable, Dict, Optional, Tuple
+from urllib.parse import urlparse
+
+import blob_store
+import job_store
+import timing
+
+logger = logging.getLogger(__name__)
+
+APP_MODULES = {"azure": "app_azure", "speechace": "app_speechace"}
+SOURCE_TYPES = ("file", "blob", "youtube", "gdrive")
+JOB_FIELDS = ("student_id", "student_name", "class_group", "task_type", "task_name", "target_text")
+NO_CLASS = "（クラスなし）"
+JOB_TTL = 3600  # 終わったジョブの結果を保持する秒数
+POLL_INTERVAL = 1.0
+
+# ============================================
+# ワーカー（別プロセス）
+# ============================================
+
+_apps: Dict[str, Any] = {}
+
+def _load_app(engine: str):
+    """アプリを Streamlit の bare モードで読み込む（画面の部品は何もしない）。プロセスごとに1回"""
+    if engine not in _apps:
+        import streamlit.config
+        import streamlit.logger
+        streamlit.config.set_option("logger.level", "error")
+        streamlit.logger.set_log_level("error")
+        _apps[engine] = importlib.import_module(APP_MODULES[engine])
+    return _apps[engine]
+
+def run_job(job: Dict[str, Any], queued_ms: float) -> Dict[str, Any]:
+    """1件の評価。結果は JSON で返せる項目だけにする"""
+    app = _load_app(job["engine"])
+    timings = timing.start()
+    timings.add("queue", queued_ms)
+    source, task_type = job["source"], job["task_type"]
+    if source["type"] == "youtube":
+        audio_path = app.download_from_youtube(source["url"], task_type)
+    elif source["type"] == "gdrive":
+        audio_path = app.download_from_google_drive(source["url"], task_type)
+    elif source["type"] == "blob":
+        audio_path = app.prepare_audio(blob_store.path(source["key"]), task_type)
+    else:
+        audio_path = app.prepare_audio(Path(source["path"]), task_type)
+    data = app.assess(audio_path, *(job[k] for k in JOB_FIELDS))
+    result = {k: v for k, v in data.items() if k not in ("raw", "words", "timings")}
+    result["timings_ms"] = {stage: round(ms, 1) for stage, ms in timings.spans.items()}
+    return result
+
+# ============================================
+# 待ち行列とディスパッチ
+# ============================================
+
+class QueueFull(Exception):
+    pass
+
+class FairQueue:
+    """クラスごとの待ち行列。取り出しはクラス間のラウンドロビン"""
+
+    def __init__(self, max_total: int, max_per_class: int):
+        self.max_total = max_total
+        self.max_per_class = max_per_class
+        self.queues: "OrderedDict[str, deque[Job]]" = OrderedDict()
+        self.cond = threading.Condition()
+
+    def __len__(self) -> int:
+        return sum(len(q) for q in self.queues.values())
+
+    def put(self, key: str, job: "Job"):
+        with self.cond:
+            if len(self) >= self.max_total:
+                raise QueueFull("評価サーバーの待ち行列が一杯です")
+            if len(self.queues.get(key, ())) >= self.max_per_class:
+                raise QueueFull(f"{key} の待ち行列が一杯です")
+            self.queues.setdefault(key, deque()).append(job)
+            self.cond.notify()
+
+    def get(self) -> "Job":
+        with self.cond:
+            while not self.queues:
+                self.cond.wait()
+            key, q = next(iter(self.queues.items()))
+            job = q.popleft()
+            if q:
+                self.queues.move_to_end(key)
+            else:
+                del self.queues[key]
+            return job
+
+    def position(self, job: "Job") -> Optional[int]:
+        """自分より先に取り出される件数の目安（0 = 次に実行）"""
+        with self.cond:
+            q = self.queues.get(job.key)
+            if q is None or job not in q:
+                return None
+            # i 周目までに他のクラスから取り出される件数 + この周で順番が先のクラスの分
+            i = q.index(job)
+            keys = list(self.queues)
+            ahead = keys[:keys.index(job.key)]
+            return i + sum(min(len(other), i) for key, other in self.queues.items() if key != job.key) \
+                + sum(1 for key in ahead if len(self.queues[key]) > i)
+
+    def depths(self) -> Dict[str, int]:
+        with self.cond:
+            return {key: len(q) for key, q in self.queues.items()}
+
+class Job:
+    def __init__(self, payload: Dict[str, Any]):
+        self.id = uuid.uuid4().hex
+        self.payload = payload
+        self.key = payload.get("class_group") or NO_CLASS
+        self.status = "queued"
+        self.result: Optional[Dict[str, Any]] = None
+        self.error = ""
+        self.submitted = time.time()
+        self.started: Optional[float] = None
+        self.finished: Optional[float] = None
+
+class Dispatcher:
+    """FairQueue から空いているワーカーの数だけ取り出してプロセスプールに渡す"""
+
+    def __init__(self, workers: int, max_queue: int, max_per_class: int):
+        self.workers = workers
+        self.queue = FairQueue(max_queue, max_per_class)
+        self.jobs: Dict[str, Job] = {}
+        self.lock = threading.Lock()
+        self.slots = threading.Semaphore(workers)
+        self.running = 0
+        self.avg_seconds = 30.0  # 1件の所要時間の移動平均（Retry-After の目安）
+        self.pool = self._new_pool()
+        threading.Thread(target=self._loop, name="dispatcher", daemon=True).start()
+
+    def _new_pool(self) -> ProcessPoolExecutor:
+        # HTTP サーバーのスレッドがあるので fork ではなく spawn で起動する
+        return ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context("spawn"))
+
+    def _replace_pool(self, broken: ProcessPoolExecutor) -> ProcessPoolExecutor:
+        """壊れたプールを作り直す。1つのワーカーの異常終了で実行中のジョブがまとめて失敗しても作るのは1回だけ"""
+        with self.lock:
+            if self.pool is not broken:
+                return self.pool
+            logger.error("ワーカープロセスが異常終了したため作り直します")
+            self.pool = self._new_pool()
+            pool = self.pool
+        broken.shutdown(wait=False, cancel_futures=True)
+        return pool
+
+    def submit(self, payload: Dict[str, Any]) -> Dict[str, Any]:
+        job = Job(payload)
+        self.queue.put(job.key, job)
+        with self.lock:
+            self._purge()
+            self.jobs[job.id] = job
+        return self.describe(job)
+
+    def retry_after(self) -> int:
+        return max(1, math.ceil(self.avg_seconds * (len(self.queue) + 1) / self.workers))
+
+    def status(self, job_id: str) -> Optional[Dict[str, Any]]:
+        with self.lock:
+            job = self.jobs.get(job_id)
+        return self.describe(job) if job else None
+
+    def _purge(self):
+        now = time.time()
+        for job_id in [j.id for j in self.jobs.values() if j.finished and now - j.finished > JOB_TTL]:
+            del self.jobs[job_id]
+
+    def _loop(self):
+        while True:
+            self.slots.acquire()
+            job = self.queue.get()
+            job.started = time.time()
+            job.status = "running"
+            with self.lock:
+                self.running += 1
+            queued_ms = (job.started - job.submitted) * 1000
+            pool = self.pool
+            try:
+                future = pool.submit(run_job, job.payload, queued_ms)
+            except BrokenProcessPool:
+                pool = self._replace_pool(pool)
+                future = pool.submit(run_job, job.payload, queued_ms)
+            future.add_done_callback(lambda f, job=job, pool=pool: self._done(job, pool, f))
+
+    def _done(self, job: Job, pool: ProcessPoolExecutor, future):
+        try:
+            job.result = future.result()
+            job.status = "done"
+        except BrokenProcessPool:
+            job.error = "評価ワーカーが異常終了しました"
+            job.status = "error"
+            self._replace_pool(pool)
+        except Exception as e:
+            job.error = str(e)
+            job.status = "error"
+        job.finished = time.time()
+        with self.lock:
+            self.running -= 1
+            self.avg_seconds = 0.8 * self.avg_seconds + 0.2 * (job.finished - job.started)
+        self.slots.release()
+
+    def describe(self, job: Job) -> Dict[str, Any]:
+        out: Dict[str, Any] = {"id": job.id, "status": job.status}
+        if job.status == "queued":
+            out["position"] = self.queue.position(job)
+        elif job.status == "done":
+            out["result"] = job.result
+        elif job.status == "error":
+            out["error"] = job.error
+        return out
+
+    def health(self) -> Dict[str, Any]:
+        return {"workers": self.workers, "running": self.running, "queued": self.queue.depths(),
+                "max_queue": self.queue.max_total, "max_per_class": self.queue.max_per_class}
+
+class StoreDispatcher:
+    """共有ジョブストアに登録するだけの受付（実行は各ノードの assessment_worker.py）"""
+
+    def __init__(self, store_url: str, workers: int, max_queue: int, max_per_class: int):
+        self.store = job_store.open_store(store_url)
+        self.workers = workers
+        self.max_queue = max_queue
+        self.max_per_class = max_per_class
+        self.last_purge = 0.0
+
+    def submit(self, payload: Dict[str, Any]) -> Dict[str, Any]:
+        key = payload.get("class_group") or NO_CLASS
+        depths = self.store.depths()
+        if sum(depths.values()) >= self.max_queue:
+            raise QueueFull("評価サーバーの待ち行列が一杯です")
+        if depths.get(key, 0) >= self.max_per_class:
+            raise QueueFull(f"{key} の待ち行列が一杯です")
+        if time.time() - self.last_purge > JOB_TTL / 10:
+            self.store.purge(JOB_TTL)
+            self.last_purge = time.time()
+        return self.store.get(self.store.submit(payload, key))
+
+    def retry_after(self) -> int:
+        return max(1, math.ceil(30.0 * (sum(self.store.depths().values()) + 1) / max(1, self.workers)))
+
+    def status(self, job_id: str) -> Optional[Dict[str, Any]]:
+        return self.store.get(job_id)
+
+    def health(self) -> Dict[str, Any]:
+        return {"workers": self.workers, "running": self.store.running(), "queued": self.store.depths(),
+                "max_queue": self.max_queue, "max_per_class": self.max_per_class}
+
+def validate(payload: Dict[str, Any]) -> Dict[str, Any]:
+    if payload.get("engine") not in APP_MODULES:
+        raise ValueError(f"engine は {' / '.join(APP_MODULES)} のいずれかです")
+    source = payload.get("source") or {}
+    if source.get("type") not in SOURCE_TYPES:
+        raise ValueError(f"source.type は {' / '.join(SOURCE_TYPES)} のいずれかです")
+    if source["type"] == "file" and not Path(source.get("path", "")).is_absolute():
+        raise ValueError("source.path には絶対パスを指定してください")
+    if source["type"] == "blob" and not source.get("key"):
+        raise ValueError("source.key がありません")
+    if source["type"] in ("youtube", "gdrive") and not source.get("url"):
+        raise ValueError("source.url がありません")
+    if not payload.get("student_id"):
+        raise ValueError("student_id がありません")
+    return {"engine": payload["engine"], "source": source, **{k: str(payload.get(k) or "") for k in JOB_FIELDS}}
+
+# ============================================
+# HTTP / Unix ソケット
+# ============================================
+
+class Handler(BaseHTTPRequestHandler):
+    dispatcher: Dispatcher
+
+    def _send(self, status: int, body: Dict[str, Any], headers: Optional[Dict[str, str]] = None):
+        data = json.dumps(body, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(data)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        path = urlparse(self.path).path
+        if path == "/health":
+            self._send(200, self.dispatcher.health())
+        elif path.startswith("/jobs/"):
+            status = self.dispatcher.status(path[len("/jobs/"):])
+            if status is None:
+                self._send(404, {"error": "ジョブが見つかりません"})
+            else:
+                self._send(200, status)
+        else:
+            self._send(404, {"error": "not found"})
+
+    def do_POST(self):
+        if urlparse(self.path).path != "/jobs":
+            self._send(404, {"error": "not found"})
+            return
+        try:
+            payload = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+            job = self.dispatcher.submit(validate(payload))
+        except QueueFull as e:
+            retry = self.dispatcher.retry_after()
+            self._send(429, {"error": str(e), "retry_after": retry}, {"Retry-After": str(retry)})
+            return
+        except (ValueError, TypeError) as e:
+            self._send(400, {"error": str(e)})
+            return
+        self._send(202, job)
+
+    def address_string(self) -> str:
+        return self.client_address[0] if isinstance(self.client_address, tuple) else "unix"
+
+    def log_message(self, format, *args):
+        logger.debug("%s %s", self.address_string(), format % args)
+
+# 状態の問い合わせが多数のセッションから同時に来ても接続を断らないように listen のキューを大きくする
+class TCPHTTPServer(ThreadingHTTPServer):
+    request_queue_size = 128
+
+class UnixHTTPServer(socketserver.ThreadingUnixStreamServer):
+    daemon_threads = True
+    request_queue_size = 128
+
+def serve(workers: int, host: str = "127.0.0.1", port: int = 8765, socket_path: str = "",
+          max_queue: int = 0, max_per_class: int = 0, store: str = ""):
+    """store を指定すると共有ジョブストアに登録し、このノードでも workers 個のワーカーを動かす（0 なら受付だけ）"""
+    max_queue = max_queue or max(workers, 1) * 8
+    max_per_class = max_per_class or max(workers, 1) * 4
+    if store:
+        import assessment_worker
+        dispatcher = StoreDispatcher(store, workers, max_queue, max_per_class)
+        assessment_worker.start_processes(store, workers)
+    else:
+        dispatcher = Dispatcher(workers, max_queue, max_per_class)
+    handler = type("BoundHandler", (Handler,), {"dispatcher": dispatcher})
+    if socket_path:
+        if os.path.exists(socket_path):
+            os.unlink(socket_path)
+        server = UnixHTTPServer(socket_path, handler)
+        where = f"unix://{socket_path}"
+    else:
+        server = TCPHTTPServer((host, port), handler)
+        where = f"http://{host}:{server.server_address[1]}"
+    logger.info("評価サーバー起動: %s（ワーカー %d）", where, workers)
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+        if socket_path and os.path.exists(socket_path):
+            os.unlink(socket_path)
+
+# ============================================
+# クライアント（アプリ側）
+# ============================================
+
+def server_url() -> str:
+    return os.getenv("ASSESSMENT_SERVER", "")
+
+class _UnixHTTPConnection(http.client.HTTPConnection):
+    def __init__(self, path: str, timeout: float):
+        super().__init__("localhost", timeout=timeout)
+        self.socket_path = path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.connect(self.socket_path)
+        self.sock.settimeout(self.timeout)
+
+def _request(method: str, path: str, body: Optional[Dict[str, Any]] = None,
+             url: str = "", timeout: float = 10) -> Tuple[int, Dict[str, Any]]:
+    url = url or server_url()
+    parsed = urlparse(url)
+    if parsed.scheme == "unix":
+        conn: http.client.HTTPConnection = _UnixHTTPConnection(parsed.path, timeout)
+    else:
+        conn = http.client.HTTPConnection(parsed.hostname, parsed.port or 80, timeout=timeout)
+    try:
+        data = json.dumps(body, ensure_ascii=False).encode("utf-8") if body is not None else None
+        conn.request(method, path, body=data, headers={"Content-Type": "application/json"})
+        res = conn.getresponse()
+        return res.status, json.loads(res.read() or b"{}")
+    except OSError as e:
+        raise ValueError(f"評価サーバーに接続できません（{url}）: {e}")
+    finally:
+        conn.close()
+
+def submit(job: Dict[str, Any], url: str = "") -> Dict[str, Any]:
+    """評価を依頼する。混み合っていれば ValueError（再試行までの秒数つき）"""
+    status, body = _request("POST", "/jobs", job, url)
+    if status == 429:
+        raise ValueError(f"評価サーバーが混み合っています。約{body.get('retry_after', 10)}秒後に再試行してください")
+    if status != 202:
+        raise ValueError(body.get("error", f"評価サーバーのエラー（HTTP {status}）"))
+    return body
+
+def wait(job_id: str, on_update: Optional[Callable[[Dict[str, Any]], None]] = None,
+         url: str = "", timeout: Optional[float] = None) -> Dict[str, Any]:
+    """結果が出るまで待つ。on_update には状態（待ち順など）が渡る"""
+    deadline = time.time() + timeout if timeout else None
+    while True:
+        status, body = _request("GET", f"/jobs/{job_id}", url=url)
+        if status != 200:
+            raise ValueError(body.get("error", f"評価サーバーのエラー（HTTP {status}）"))
+        if body["status"] == "done":
+            return body["result"]
+        if body["status"] == "error":
+            raise ValueError(body["error"])
+        if on_update:
+            on_update(body)
+        if deadline and time.time() > deadline:
+            raise ValueError("評価サーバーからの結果待ちがタイムアウトしました")
+        time.sleep(POLL_INTERVAL)
+
+def main():
+    parser = argparse.ArgumentParser(description="評価処理をワーカープロセスで実行するローカルサーバー")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 2, help="ワーカープロセス数")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--socket", default="", help="TCP の代わりに Unix ソケットで待ち受ける")
+    parser.add_argument("--max-queue", type=int, default=0, help="待ち行列の上限（既定: ワーカー数 × 8）")
+    parser.add_argument("--max-per-class", type=int, default=0, help="1クラスの待ち行列の上限（既定: ワーカー数 × 4）")
+    parser.add_argument("--store", default="", help="複数ノードで共有するジョブストア（sqlite:////共有パス/jobs.db など）")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    serve(args.workers, args.host, args.port, args.socket, args.max_queue, args.max_per_class, args.store)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+# assessment_worker.py - 共有ジョブストアから評価ジョブを取って実行するワーカー（各ノードで起動）
+# 使い方（共有ディレクトリ /mnt/shared/assessment にジョブストア・音声・履歴DBを置く例）:
+#   export ASSESSMENT_BLOB_DIR=/mnt/shared/assessment/blobs
+#   python assessment_worker.py --store sqlite:////mnt/shared/assessment/jobs.db \
+#       --workdir /mnt/shared/assessment --processes 4
+# --workdir は履歴DB（history_*.db）と downloads/ を置くディレクトリ（アプリと同じ場所を指定する）。
+# ジョブの実行中はリースを lease/3 秒ごとに延長する。ノードが落ちて延長が止まったジョブは、
+# リースの期限が切れたあと別のノードのワーカーが取り直す。
+
+import argparse
+import logging
+import multiprocessing
+import os
+import socket
+import threading
+import time
+import uuid
+from typing import List, Optional
+
+import job_store
+
+logger = logging.getLogger(__name__)
+
+LEASE_SECONDS = 120
+IDLE_SECONDS = 1.0
+
+def _heartbeat(store: job_store.JobStore, job_id: str, worker: str, lease: float, stop: threading.Event):
+    while not stop.wait(lease / 3):
+        if not store.heartbeat(job_id, worker, lease):
+            logger.warning("ジョブ %s のリースを失いました（別のワーカーが取り直した可能性があります）", job_id)
+            return
+
+def work(store_url: str, lease: float = LEASE_SECONDS, max_jobs: Optional[int] = None):
+    """ジョブを取っては実行する（max_jobs 件で終了。None なら止めるまで続ける）"""
+    from assessment_server import run_job
+    store = job_store.open_store(store_url)
+    worker = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+    done = 0
+    while max_jobs is None or done < max_jobs:
+        job = store.claim(worker, lease)
+        if job is None:
+            time.sleep(IDLE_SECONDS)
+            continue
+        stop = threading.Event()
+        threading.Thread(target=_heartbeat, args=(store, job["id"], worker, lease, stop), daemon=True).start()
+        queued_ms = (time.time() - job["created_at"]) * 1000
+        try:
+            result = run_job(job["payload"], queued_ms)
+        except Exception as e:
+            ok = store.fail(job["id"], worker, str(e))
+        else:
+            ok = store.complete(job["id"], worker, result)
+        finally:
+            stop.set()
+        if not ok:
+            logger.warning("ジョブ %s の結果を保存できませんでした（リース切れ）", job["id"])
+        done += 1
+
+def _run(store_url: str, workdir: str, lease: float):
+    if workdir:
+        os.chdir(workdir)
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    work(store_url, lease)
+
+def start_processes(store_url: str, processes: int, workdir: str = "",
+                    lease: float = LEASE_SECONDS) -> List[multiprocessing.Process]:
+    ctx = multiprocessing.get_context("spawn")
+    procs = [ctx.Process(target=_run, args=(store_url, workdir, lease), daemon=True, name=f"worker-{i}")
+             for i in range(processes)]
+    for p in procs:
+        p.start()
+    return procs
+
+def main():
+    parser = argparse.ArgumentParser(description="共有ジョブストアの評価ジョブを実行するワーカー")
+    parser.add_argument("--store", required=True, help="sqlite:////共有パス/jobs.db または postgresql://...")
+    parser.add_argument("--processes", type=int, default=os.cpu_count() or 2, help="このノードのワーカープロセス数")
+    parser.add_argument("--workdir", default="", help="履歴DBと downloads/ を置くディレクトリ")
+    parser.add_argument("--lease", type=float, default=LEASE_SECONDS, help="リースの秒数")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    job_store.open_store(args.store)  # テーブルを作り、接続できることを先に確かめる
+    procs = start_processes(args.store, args.processes, args.workdir, args.lease)
+    logger.info("ワーカー %d プロセスを起動しました（%s）", len(procs), args.store)
+    try:
+        for p in procs:
+            p.join()
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == "__main__":
+    main()
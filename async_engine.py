@@ -0,0 +1,126 @@
+# async_engine.py - 外部の呼び出し（Speechace・Whisper・GPT-4o・yt-dlp）を1つのイベントループで待つ
+# 同期の requests / OpenAI() / subprocess.run だと、チャンクを並列にするにはスレッドが必要で、
+# 1プロセスで同時に待てる数がスレッド数で決まってしまう。ここではプロセスごとに1本だけバックグラウンドの
+# スレッドでイベントループを回し、HTTP の接続（httpx.AsyncClient / AsyncOpenAI）もそのループで共有する。
+# Streamlit や評価サーバーのワーカーなど同期のコードからは run(...) で待つ（同期の窓口）。
+#
+#   result = async_engine.run(async_engine.gather_limited([score(c) for c in chunks], limit=8))
+#
+# ループとクライアントは再実行（Streamlit の rerun）をまたいで使い回す。
+# gdown と Azure Speech SDK には非同期の API がないので、これまでどおり同期で呼ぶ。
+
+import asyncio
+import concurrent.futures
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional, Tuple
+
+import httpx
+from openai import AsyncOpenAI
+
+MAX_CONNECTIONS = 200  # 1プロセスで同時に開く HTTP 接続の上限
+HTTP_TIMEOUT = httpx.Timeout(120.0, connect=10.0)
+POLL_SECONDS = 0.5  # run(poll=...) で poll を呼ぶ間隔
+
+_loop: Optional[asyncio.AbstractEventLoop] = None
+_lock = threading.Lock()
+_http: Optional[httpx.AsyncClient] = None
+_openai: Dict[Tuple[str, str], AsyncOpenAI] = {}
+
+def loop() -> asyncio.AbstractEventLoop:
+    """このプロセスの共有イベントループ（初回に専用スレッドで起動する）"""
+    global _loop
+    with _lock:
+        if _loop is None or _loop.is_closed():
+            _loop = asyncio.new_event_loop()
+            threading.Thread(target=_loop.run_forever, name="async-engine", daemon=True).start()
+        return _loop
+
+def run(coro: Awaitable, timeout: Optional[float] = None, poll: Optional[Callable[[], None]] = None) -> Any:
+    """同期のコードからコルーチンを共有ループで実行して結果を待つ（例外もそのまま投げ直す）
+
+    poll を渡すと、待っている間 POLL_SECONDS ごとに呼ぶ（途中経過の画面を描き直すなど）。
+    タイムアウトしたとき（poll が例外を投げたときも）はループ側のタスクを取り消す（待つ人のいない
+    リクエストをループに溜めない）。
+    """
+    future = asyncio.run_coroutine_threadsafe(coro, loop())
+    deadline = time.monotonic() + timeout if timeout is not None else None
+    try:
+        while poll is not None:
+            wait = POLL_SECONDS if deadline is None else min(POLL_SECONDS, max(0.0, deadline - time.monotonic()))
+            if concurrent.futures.wait([future], wait).done or (deadline is not None and time.monotonic() >= deadline):
+                break
+            poll()
+        return future.result(None if deadline is None else max(0.0, deadline - time.monotonic()))
+    except BaseException:
+        future.cancel()
+        raise
+
+async def gather_limited(coros: Iterable[Awaitable], limit: int, return_exceptions: bool = False) -> List[Any]:
+    """同時に limit 個までにして、順番どおりの結果のリストを返す"""
+    semaphore = asyncio.Semaphore(limit)
+
+    async def one(coro):
+        async with semaphore:
+            return await coro
+
+    return await asyncio.gather(*(one(c) for c in coros), return_exceptions=return_exceptions)
+
+# ============================================
+# クライアント（ループの中で作って使い回す）
+# ============================================
+
+def http() -> httpx.AsyncClient:
+    global _http
+    if _http is None:
+        limits = httpx.Limits(max_connections=MAX_CONNECTIONS, max_keepalive_connections=MAX_CONNECTIONS)
+        _http = httpx.AsyncClient(limits=limits, timeout=HTTP_TIMEOUT)
+    return _http
+
+def openai_client(api_key: str) -> AsyncOpenAI:
+    """APIキーごとの AsyncOpenAI（OPENAI_BASE_URL などの環境変数は OpenAI() と同じく読む）"""
+    key = (api_key, os.getenv("OPENAI_BASE_URL", ""))
+    if key not in _openai:
+        _openai[key] = AsyncOpenAI(api_key=api_key)
+    return _openai[key]
+
+# ============================================
+# 呼び出し
+# ============================================
+
+async def post_speechace(url: str, api_key: str, audio_path: Path, text: str) -> Dict[str, Any]:
+    """Speechace の text スコアリング（1チャンク分）"""
+    files = {"user_audio_file": ("audio.wav", Path(audio_path).read_bytes(), "audio/wav")}
+    data = {
+        "text": text,
+        "question_info": '{"questionId": "q1"}',
+        "user_id": "student",
+        "dialect": "en-us",
+        "include_fluency": "1",
+        "include_intonation": "1",
+    }
+    response = await http().post(url, params={"key": api_key}, files=files, data=data)
+    if response.status_code != 200:
+        raise ValueError(f"Speechace API エラー: {response.status_code}")
+    return response.json()
+
+async def transcribe(api_key: str, audio_path: Path, language: str = "en") -> str:
+    """Whisper で音声認識"""
+    with open(audio_path, "rb") as f:
+        transcript = await openai_client(api_key).audio.transcriptions.create(model="whisper-1", file=f,
+                                                                              language=language)
+    return transcript.text
+
+async def run_process(cmd: List[str], timeout: Optional[float] = None) -> Tuple[int, str, str]:
+    """外部コマンド（yt-dlp など）を待つ。timeout を過ぎたら止めて ValueError"""
+    proc = await asyncio.create_subprocess_exec(*cmd, stdout=asyncio.subprocess.PIPE,
+                                                stderr=asyncio.subprocess.PIPE)
+    try:
+        out, err = await asyncio.wait_for(proc.communicate(), timeout)
+    except asyncio.TimeoutError:
+        proc.kill()
+        await proc.wait()
+        raise ValueError(f"{cmd[0]} が {timeout:g}秒以内に終わりませんでした")
+    return proc.returncode, out.decode("utf-8", "replace"), err.decode("utf-8", "replace")
@@ -0,0 +1,121 @@
+# audio_guard.py - 音声ファイルのサイズ・長さ・形式のチェック（デコードやAPI呼び出しの前に行う）
+# ffprobe でコンテナのヘッダだけを読み、長さ・コーデック・チャンネル数を調べる。
+# ffprobe がない環境ではファイル先頭のマジックバイトで形式を判定し、WAVはヘッダから長さを読む。
+# 上限は課題タイプごとに class_config.json の upload_limits で変えられる:
+#   "upload_limits": {
+#     "default": {"max_mb": 50, "min_seconds": 1, "max_seconds": 600, "max_channels": 2, "on_too_long": "reject"},
+#     "音読課題": {"max_seconds": 180, "on_too_long": "trim"}
+#   }
+# on_too_long が "trim" なら先頭 max_seconds 秒だけを変換し、"reject" なら受け付けない。
+
+import json
+import subprocess
+import wave
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+from pydub.utils import which
+
+from app_config import load_config
+
+DEFAULT_LIMITS = {
+    "max_mb": 50,
+    "min_seconds": 1,
+    "max_seconds": 600,
+    "max_channels": 2,
+    "on_too_long": "reject",
+}
+PROBE_TIMEOUT = 15  # 秒
+
+MAGIC = [
+    (b"RIFF", "wav"),
+    (b"ID3", "mp3"),
+    (b"\xff\xfb", "mp3"),
+    (b"\xff\xf3", "mp3"),
+    (b"\xff\xf2", "mp3"),
+    (b"OggS", "ogg"),
+    (b"\x1a\x45\xdf\xa3", "webm"),
+    (b"fLaC", "flac"),
+]
+
+def load_limits(task_type: str = "") -> Dict[str, Any]:
+    """既定値 ← upload_limits.default ← upload_limits[課題タイプ] の順に上書き"""
+    config = load_config().get("upload_limits", {})
+    return {**DEFAULT_LIMITS, **config.get("default", {}), **config.get(task_type, {})}
+
+def describe(limits: Dict[str, Any]) -> str:
+    action = "超えた分はカット" if limits["on_too_long"] == "trim" else "超える場合は受付不可"
+    return (f"※ {limits['max_mb']}MBまで・{limits['min_seconds']:g}〜{limits['max_seconds']:g}秒"
+            f"（{action}）")
+
+def _sniff(path: Path) -> Optional[str]:
+    with open(path, "rb") as f:
+        head = f.read(12)
+    if head[4:8] == b"ftyp":
+        return "m4a"
+    for magic, fmt in MAGIC:
+        if head.startswith(magic):
+            return fmt
+    return None
+
+def _probe_ffprobe(path: Path) -> Dict[str, Any]:
+    cmd = ["ffprobe", "-v", "error", "-show_entries",
+           "format=duration,format_name:stream=codec_type,codec_name,channels,sample_rate",
+           "-of", "json", str(path)]
+    try:
+        out = subprocess.run(cmd, capture_output=True, text=True, timeout=PROBE_TIMEOUT)
+    except subprocess.TimeoutExpired:
+        raise ValueError("音声ファイルのヘッダを読めませんでした（タイムアウト）")
+    if out.returncode != 0:
+        raise ValueError("音声ファイルを読み込めません（破損しているか、対応していない形式です）")
+    data = json.loads(out.stdout or "{}")
+    audio = next((s for s in data.get("streams", []) if s.get("codec_type") == "audio"), None)
+    if audio is None:
+        raise ValueError("音声トラックが見つかりません")
+    duration = data.get("format", {}).get("duration")
+    return {
+        "format": data.get("format", {}).get("format_name", ""),
+        "codec": audio.get("codec_name", ""),
+        "channels": audio.get("channels"),
+        "sample_rate": int(audio["sample_rate"]) if audio.get("sample_rate") else None,
+        "duration": float(duration) if duration not in (None, "N/A") else None,
+        "source": "ffprobe",
+    }
+
+def _probe_header(path: Path) -> Dict[str, Any]:
+    fmt = _sniff(path)
+    if fmt is None:
+        raise ValueError("対応していない形式、または破損した音声ファイルです")
+    info = {"format": fmt, "codec": "", "channels": None, "sample_rate": None, "duration": None, "source": "header"}
+    if fmt == "wav":
+        try:
+            with wave.open(str(path), "rb") as w:
+                info.update(codec=f"pcm_s{w.getsampwidth() * 8}le", channels=w.getnchannels(),
+                            sample_rate=w.getframerate(), duration=w.getnframes() / w.getframerate())
+        except (wave.Error, EOFError):
+            raise ValueError("WAVファイルのヘッダが壊れています")
+    return info
+
+def probe(path: Path) -> Dict[str, Any]:
+    """長さ（秒）・コーデック・チャンネル数など。長さが分からない場合 duration は None"""
+    path = Path(path)
+    return _probe_ffprobe(path) if which("ffprobe") else _probe_header(path)
+
+def check_size(size_bytes: int, limits: Dict[str, Any]):
+    if size_bytes > limits["max_mb"] * 1024 * 1024:
+        raise ValueError(f"ファイルが大きすぎます（{size_bytes / 1024 / 1024:.1f}MB / 上限 {limits['max_mb']}MB）")
+    if size_bytes == 0:
+        raise ValueError("ファイルが空です")
+
+def check(info: Dict[str, Any], size_bytes: int, limits: Dict[str, Any]) -> Optional[float]:
+    """規定外なら ValueError。変換する最大秒数を返す（長さが分からない場合も上限で打ち切る）"""
+    check_size(size_bytes, limits)
+    if info.get("channels") and info["channels"] > limits["max_channels"]:
+        raise ValueError(f"{info['channels']}チャンネルの音声には対応していません（上限 {limits['max_channels']}）")
+    duration = info.get("duration")
+    if duration is not None:
+        if duration < limits["min_seconds"]:
+            raise ValueError(f"録音が短すぎます（{duration:.1f}秒 / 最短 {limits['min_seconds']:g}秒）")
+        if duration > limits["max_seconds"] and limits["on_too_long"] != "trim":
+            raise ValueError(f"録音が長すぎます（{duration:.0f}秒 / 上限 {limits['max_seconds']:g}秒）")
+    return limits["max_seconds"]
@@ -0,0 +1,118 @@
+# audio_profile.py - 音声変換・分割（ffmpeg / wave）のプロファイリング（オプトイン）
+# 環境変数 AUDIO_PROFILE=1 のときだけ有効。convert_to_wav / split_audio を1回ごとに
+#   - cProfile（関数別の時間。ffmpeg の起動時間は subprocess の呼び出しから、待ち時間はデコード結果の
+#     読み込み（audio_stream._read_ffmpeg）と終了待ちから取り出す）
+#   - tracemalloc（Python側の確保メモリのピーク）
+#   - プロセスのピークRSS（VmHWM）と ffmpeg 子プロセスのピークRSS
+# で計測し、AUDIO_PROFILE_DIR（既定 ./profiles）に
+#   <日時>_<段階>_<id>.prof  … pstats 形式（flameprof / snakeviz でフレームグラフにできる）
+#   summary.jsonl           … 1回1行の要約
+# を書き出す。計測が混ざらないように、有効時は音声処理を1件ずつ直列に実行する。
+#
+#   flameprof profiles/20250110_101500_convert_ab12cd34.prof > convert.svg
+
+import cProfile
+import json
+import os
+import pstats
+import threading
+import time
+import tracemalloc
+import uuid
+from contextlib import contextmanager, nullcontext
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+_lock = threading.Lock()
+
+def enabled() -> bool:
+    return os.getenv("AUDIO_PROFILE", "") not in ("", "0")
+
+def profile_dir() -> Path:
+    return Path(os.getenv("AUDIO_PROFILE_DIR", "profiles"))
+
+def _reset_peak_rss():
+    """VmHWM（ピークRSS）を現在値に戻す（Linux 4.0以降。できなければ何もしない）"""
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+    except OSError:
+        pass
+
+def _peak_rss_kb() -> Optional[int]:
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss if resource else None
+
+def _child_peak_rss_kb() -> Optional[int]:
+    """終了した子プロセス（ffmpeg）のうち最大のピークRSS（プロセス起動からの通算の最大値）"""
+    return resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss if resource else None
+
+def _subprocess_ms(stats: pstats.Stats) -> Dict[str, float]:
+    """ffmpeg の起動（_execute_child）と待ち時間の累積
+
+    待ち時間はデコード結果の読み込み（audio_stream._read_ffmpeg。デコードの時間はほぼここに入る）と
+    終了待ち（communicate / wait）の合計。
+    """
+    spawn = wait = 0.0
+    for (filename, _, name), (_, _, _, cumtime, _) in stats.stats.items():
+        if filename.endswith("subprocess.py"):
+            if name == "_execute_child":
+                spawn += cumtime
+            elif name in ("communicate", "wait"):
+                wait += cumtime
+        elif filename.endswith("audio_stream.py") and name == "_read_ffmpeg":
+            wait += cumtime
+    return {"ffmpeg_spawn_ms": round(spawn * 1000, 1), "ffmpeg_wait_ms": round(wait * 1000, 1)}
+
+@contextmanager
+def _profile(stage: str, input_path: Optional[Path]):
+    with _lock:
+        out_dir = profile_dir()
+        out_dir.mkdir(parents=True, exist_ok=True)
+        job = f"{datetime.now().strftime('%Y%m%d_%H%M%S')}_{stage}_{uuid.uuid4().hex[:8]}"
+
+        _reset_peak_rss()
+        tracemalloc.start()
+        profiler = cProfile.Profile()
+        t0 = time.perf_counter()
+        profiler.enable()
+        try:
+            yield
+        finally:
+            profiler.disable()
+            wall = time.perf_counter() - t0
+            _, py_peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+
+            prof_path = out_dir / f"{job}.prof"
+            profiler.dump_stats(prof_path)
+            summary: Dict[str, Any] = {
+                "job": job,
+                "stage": stage,
+                "input": str(input_path) if input_path else None,
+                "input_bytes": input_path.stat().st_size if input_path and input_path.exists() else None,
+                "wall_ms": round(wall * 1000, 1),
+                **_subprocess_ms(pstats.Stats(profiler)),
+                "py_peak_kb": py_peak // 1024,
+                "peak_rss_kb": _peak_rss_kb(),
+                "child_peak_rss_kb": _child_peak_rss_kb(),
+                "profile": prof_path.name,
+            }
+            with open(out_dir / "summary.jsonl", "a", encoding="utf-8") as f:
+                f.write(json.dumps(summary, ensure_ascii=False) + "\n")
+
+def profile(stage: str, input_path: Optional[Path] = None):
+    """AUDIO_PROFILE=1 のときだけ計測する（無効時は何もしない）"""
+    return _profile(stage, Path(input_path) if input_path else None) if enabled() else nullcontext()
@@ -0,0 +1,140 @@
+# audio_quality.py - 発音評価APIに送る前の音声の品質チェック（ローカル・NumPy のみ）
+# 無音・極端に短い・音割れ・雑音が多い録音は、有料のAPIを呼んでから「音声を認識できませんでした」になる。
+# convert_to_wav 済みの WAV を1秒ずつ読み、20ミリ秒ごとの音量から次の値を計算する:
+#   rms_dbfs        全体の音量（dBFS）
+#   peak_dbfs       最大の振幅（dBFS）
+#   clipping_ratio  振幅が上限に張り付いたサンプルの割合（音割れ）
+#   snr_db          発話部分（上位10%の音量）と背景（下位10%の音量）の差（SN比の目安）
+#   speech_ratio    発話とみなしたフレームの割合
+#   speech_seconds  発話とみなしたフレームの合計秒数
+# 基準は class_config.json の quality_gate（upload_limits と同じく default ← 課題タイプ の順に上書き）:
+#   "quality_gate": {"default": {"min_speech_seconds": 1, "reject": ["silence", "too_short"]}}
+# reject に入っている項目は評価を止め（ValueError）、それ以外は警告として結果に表示する。
+# 言語の判定はローカルではできないので対象外（英語以外の録音はこれまでどおりエンジン側で判定する）。
+
+import sqlite3
+import wave
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+from app_config import load_config
+
+FRAME_SECONDS = 0.02
+BLOCK_SECONDS = 1.0
+FULL_SCALE = 32768.0
+CLIP_LEVEL = 32700  # これ以上の振幅を音割れとみなす
+FLOOR_DBFS = -120.0
+
+DEFAULT_GATE = {
+    "silence_dbfs": -50,         # 発話とみなす最低の音量
+    "min_speech_seconds": 1.0,   # 発話がこれより短ければ too_short
+    "max_clipping_ratio": 0.01,  # 音割れのサンプルの割合の上限
+    "min_snr_db": 10,            # SN比の下限
+    "min_speech_ratio": 0.2,     # 発話の割合の下限
+    "reject": ["silence", "too_short"],
+}
+METRIC_COLUMNS = ["duration_s", "rms_dbfs", "peak_dbfs", "clipping_ratio", "snr_db", "speech_ratio", "speech_seconds"]
+
+def load_gate(task_type: str = "") -> Dict[str, Any]:
+    """既定値 ← quality_gate.default ← quality_gate[課題タイプ] の順に上書き"""
+    config = load_config().get("quality_gate", {})
+    return {**DEFAULT_GATE, **config.get("default", {}), **config.get(task_type, {})}
+
+def _db(power: np.ndarray) -> np.ndarray:
+    return np.maximum(10 * np.log10(np.maximum(power, 1e-30) / FULL_SCALE ** 2), FLOOR_DBFS)
+
+def analyze(wav_path: Path, silence_dbfs: float = DEFAULT_GATE["silence_dbfs"]) -> Dict[str, float]:
+    """convert_to_wav 済みの WAV（16bit）の品質の値。メモリに載るのは1秒分のサンプルとフレームごとの音量だけ"""
+    powers = []
+    clipped = peak = samples = 0
+    with wave.open(str(wav_path), "rb") as r:
+        if r.getsampwidth() != 2:
+            raise ValueError("analyze には 16bit の WAV を渡してください")
+        rate = r.getframerate()
+        frame = max(1, int(rate * FRAME_SECONDS))
+        block = frame * int(BLOCK_SECONDS / FRAME_SECONDS)
+        rest = np.zeros(0, dtype=np.int16)
+        while True:
+            data = r.readframes(block)
+            if not data:
+                break
+            x = np.concatenate([rest, np.frombuffer(data, dtype="<i2")])
+            usable = len(x) // frame * frame
+            rest = x[usable:]
+            if usable:
+                f = x[:usable].astype(np.float64).reshape(-1, frame)
+                powers.append(np.mean(f * f, axis=1))
+            a = np.abs(x[:usable].astype(np.int32))
+            if len(a):
+                clipped += int(np.count_nonzero(a >= CLIP_LEVEL))
+                peak = max(peak, int(a.max()))
+            samples += usable
+    power = np.concatenate(powers) if powers else np.zeros(0)
+    if len(power) == 0:
+        return {"duration_s": 0.0, "rms_dbfs": FLOOR_DBFS, "peak_dbfs": FLOOR_DBFS, "clipping_ratio": 0.0,
+                "snr_db": 0.0, "speech_ratio": 0.0, "speech_seconds": 0.0}
+    levels = _db(power)
+    noise, loud = np.percentile(levels, [10, 90])
+    # 背景より 6dB 以上大きいフレームを発話とみなす（雑音が多く差が小さい録音は差の半分で区切る）
+    speech = levels > max(noise + min(6.0, (loud - noise) / 2), silence_dbfs)
+    return {
+        "duration_s": round(samples / rate, 2),
+        "rms_dbfs": round(float(_db(np.array([power.mean()]))[0]), 1),
+        "peak_dbfs": round(float(_db(np.array([float(peak) ** 2]))[0]), 1),
+        "clipping_ratio": round(clipped / samples, 4),
+        "snr_db": round(float(loud - noise), 1),
+        "speech_ratio": round(float(speech.mean()), 3),
+        "speech_seconds": round(float(speech.sum()) * frame / rate, 2),
+    }
+
+def check(metrics: Dict[str, float], gate: Dict[str, Any]) -> List[str]:
+    """基準を満たさない項目のうち reject にあるものは ValueError、それ以外は警告の文のリストで返す"""
+    problems = []
+    if metrics["speech_seconds"] == 0 or metrics["rms_dbfs"] < gate["silence_dbfs"]:
+        problems.append(("silence", f"録音がほぼ無音です（音量 {metrics['rms_dbfs']:.0f} dBFS）。マイクの設定を確認してください"))
+    elif metrics["speech_seconds"] < gate["min_speech_seconds"]:
+        problems.append(("too_short", f"発話が{metrics['speech_seconds']:.1f}秒しかありません"
+                                      f"（{gate['min_speech_seconds']:g}秒以上必要です）"))
+    if metrics["clipping_ratio"] > gate["max_clipping_ratio"]:
+        problems.append(("clipping", f"音割れしています（{metrics['clipping_ratio']:.1%}）。"
+                                     "マイクとの距離を離すか、入力音量を下げて録音してください"))
+    if metrics["speech_seconds"] > 0 and metrics["snr_db"] < gate["min_snr_db"]:
+        problems.append(("noise", f"雑音が多い録音です（SN比 {metrics['snr_db']:.0f} dB）。静かな場所で録音してください"))
+    if metrics["speech_seconds"] > 0 and metrics["speech_ratio"] < gate["min_speech_ratio"]:
+        problems.append(("sparse", f"録音の大部分が無音です（発話 {metrics['speech_ratio']:.0%}）"))
+    for name, message in problems:
+        if name in gate["reject"]:
+            raise ValueError(message)
+    return [message for _, message in problems]
+
+# ============================================
+# 保存
+# ============================================
+
+def init_table(conn: sqlite3.Connection):
+    conn.execute(f'''
+        CREATE TABLE IF NOT EXISTS audio_quality (
+            assessment_id TEXT PRIMARY KEY,
+            {", ".join(col + " REAL" for col in METRIC_COLUMNS)},
+            warnings TEXT
+        )
+    ''')
+    # 履歴が削除されたら品質の値も消す
+    conn.execute('''
+        CREATE TRIGGER IF NOT EXISTS audio_quality_cleanup AFTER DELETE ON assessments
+        BEGIN
+            DELETE FROM audio_quality WHERE assessment_id = old.id;
+        END
+    ''')
+
+def save(conn: sqlite3.Connection, assessment_id: str, metrics: Optional[Dict[str, float]], warnings: List[str]):
+    """save_assessment と同じトランザクション内で呼ぶ"""
+    if not metrics:
+        return
+    conn.execute(
+        f"INSERT OR REPLACE INTO audio_quality (assessment_id, {', '.join(METRIC_COLUMNS)}, warnings) "
+        f"VALUES (?, {', '.join('?' for _ in METRIC_COLUMNS)}, ?)",
+        [assessment_id] + [metrics.get(col) for col in METRIC_COLUMNS] + ["\n".join(warnings)]
+    )
@@ -0,0 +1,165 @@
+# audio_stream.py - メモリ使用量が録音の長さに比例しない音声変換・分割
+# pydub の AudioSegment.from_file は録音全体をデコードしてメモリに載せ、スライスでさらにコピーするため、
+# 誤ってアップロードされた長い講義録音でもメモリを使い切ってしまう。
+# ここでは ffmpeg の標準出力から 16kHz / モノラル / 16bit の PCM を固定サイズのブロックで読み、
+# そのまま WAV に書き出す。メモリに載るのはブロック1つ分（既定 約1秒）だけ。
+# ffmpeg がない環境でも WAV 入力は wave + audioop で同じように逐次変換できる。
+
+import subprocess
+import wave
+from pathlib import Path
+from typing import Iterator, Optional
+
+from pydub.utils import audioop, get_encoder_name, which
+
+SAMPLE_RATE = 16000
+SAMPLE_WIDTH = 2  # 16bit
+CHANNELS = 1
+BLOCK_SECONDS = 1.0
+PAUSE_FRAME_SECONDS = 0.02  # 区切り位置を探すときの音量の計算単位
+
+def _block_bytes(block_seconds: float) -> int:
+    return int(SAMPLE_RATE * block_seconds) * SAMPLE_WIDTH * CHANNELS
+
+def _read_ffmpeg(proc: subprocess.Popen, size: int) -> bytes:
+    """ffmpeg がデコードした PCM を待って読む（audio_profile はこの時間を ffmpeg の待ち時間として数える）"""
+    return proc.stdout.read(size)
+
+def _iter_ffmpeg(input_path: Path, block_bytes: int) -> Iterator[bytes]:
+    cmd = [get_encoder_name(), "-nostdin", "-v", "error", "-i", str(input_path),
+           "-f", "s16le", "-acodec", "pcm_s16le", "-ac", str(CHANNELS), "-ar", str(SAMPLE_RATE), "-"]
+    proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    try:
+        while True:
+            block = _read_ffmpeg(proc, block_bytes)
+            if not block:
+                break
+            yield block
+        proc.stdout.close()
+        err = proc.stderr.read().decode("utf-8", "replace")
+        if proc.wait() != 0:
+            raise ValueError(f"音声の変換に失敗しました: {err.strip()[:300]}")
+    finally:
+        # 途中で読むのをやめた場合（長さの上限など）も ffmpeg を残さない
+        if proc.poll() is None:
+            proc.kill()
+            proc.wait()
+
+def _iter_wave(input_path: Path, block_seconds: float) -> Iterator[bytes]:
+    """ffmpeg を使わずに WAV を 16kHz / モノラル / 16bit に変換しながら読む"""
+    with wave.open(str(input_path), "rb") as w:
+        channels, width, rate = w.getnchannels(), w.getsampwidth(), w.getframerate()
+        frames_per_block = max(1, int(rate * block_seconds))
+        state = None
+        while True:
+            data = w.readframes(frames_per_block)
+            if not data:
+                break
+            if width != SAMPLE_WIDTH:
+                data = audioop.lin2lin(data, width, SAMPLE_WIDTH)
+            if channels == 2:
+                data = audioop.tomono(data, SAMPLE_WIDTH, 0.5, 0.5)
+            elif channels > 2:
+                raise ValueError(f"{channels}チャンネルのWAVには ffmpeg が必要です")
+            if rate != SAMPLE_RATE:
+                data, state = audioop.ratecv(data, SAMPLE_WIDTH, CHANNELS, rate, SAMPLE_RATE, state)
+            yield data
+
+def iter_pcm(input_path: Path, block_seconds: float = BLOCK_SECONDS) -> Iterator[bytes]:
+    """16kHz / モノラル / 16bit の PCM をブロックごとに返す"""
+    input_path = Path(input_path)
+    if which(get_encoder_name()):
+        yield from _iter_ffmpeg(input_path, _block_bytes(block_seconds))
+    elif input_path.suffix.lower() == ".wav":
+        yield from _iter_wave(input_path, block_seconds)
+    else:
+        raise ValueError("ffmpeg がインストールされていません（WAV以外の変換に必要です）")
+
+def _open_writer(path: Path) -> wave.Wave_write:
+    w = wave.open(str(path), "wb")
+    w.setnchannels(CHANNELS)
+    w.setsampwidth(SAMPLE_WIDTH)
+    w.setframerate(SAMPLE_RATE)
+    return w
+
+def convert_to_wav(input_path: Path, output_path: Path, max_seconds: Optional[float] = None) -> Path:
+    """16kHz / モノラル / 16bit の WAV に逐次変換する。max_seconds を超えた分はデコードせずに打ち切る"""
+    limit = int(max_seconds * SAMPLE_RATE) * SAMPLE_WIDTH * CHANNELS if max_seconds else None
+    written = 0
+    with _open_writer(output_path) as w:
+        blocks = iter_pcm(input_path)
+        try:
+            for block in blocks:
+                if limit is not None and written + len(block) >= limit:
+                    w.writeframes(block[:limit - written])
+                    break
+                w.writeframes(block)
+                written += len(block)
+        finally:
+            blocks.close()
+    return output_path
+
+def wav_seconds(wav_path: Path) -> float:
+    """WAV の長さ（ヘッダだけ読む）"""
+    with wave.open(str(wav_path), "rb") as r:
+        return r.getnframes() / r.getframerate()
+
+def _blocks(r: wave.Wave_read, frames: int, frames_per_block: int) -> Iterator[bytes]:
+    while frames > 0:
+        data = r.readframes(min(frames_per_block, frames))
+        if not data:
+            return
+        frames -= len(data) // SAMPLE_WIDTH
+        yield data
+
+def _quietest(data: bytes) -> int:
+    """data の中でいちばん静かな 20ミリ秒 の中央のバイト位置（同じ静かさなら後ろ）"""
+    frame = int(PAUSE_FRAME_SECONDS * SAMPLE_RATE) * SAMPLE_WIDTH
+    best, best_rms = len(data), None
+    for start in range(0, len(data) - frame + 1, frame):
+        rms = audioop.rms(data[start:start + frame], SAMPLE_WIDTH)
+        if best_rms is None or rms <= best_rms:
+            best, best_rms = start + frame // 2, rms
+    return best - best % SAMPLE_WIDTH
+
+def iter_chunks(wav_path: Path, chunk_dir: Path, max_seconds: float = 40, prefix: str = "chunk",
+                search_seconds: float = 0) -> Iterator[Path]:
+    """convert_to_wav 済みの WAV を max_seconds 以下のファイルに分けながら、書き終えたものから返す
+
+    search_seconds > 0 なら、各チャンクの最後の search_seconds 秒の中でいちばん静かな位置で区切る
+    （単語の途中で切らないため）。メモリに載るのはブロック1つ分と探索範囲の分だけ。
+    """
+    frames_per_chunk = int(max_seconds * SAMPLE_RATE)
+    frames_per_block = int(BLOCK_SECONDS * SAMPLE_RATE)
+    search_frames = min(int(search_seconds * SAMPLE_RATE), frames_per_chunk // 2)
+    with wave.open(str(wav_path), "rb") as r:
+        if (r.getnchannels(), r.getsampwidth(), r.getframerate()) != (CHANNELS, SAMPLE_WIDTH, SAMPLE_RATE):
+            raise ValueError("iter_chunks には convert_to_wav 済みの WAV を渡してください")
+        index = 0
+        carry = b""  # 前のチャンクの区切り位置より後ろの部分
+        while True:
+            chunk_path = chunk_dir / f"{prefix}{index}.wav"
+            direct = frames_per_chunk - search_frames - len(carry) // SAMPLE_WIDTH
+            w = None
+            try:
+                if carry:
+                    w = _open_writer(chunk_path)
+                    w.writeframes(carry)
+                for data in _blocks(r, direct, frames_per_block):
+                    w = w or _open_writer(chunk_path)
+                    w.writeframes(data)
+                tail = b"".join(_blocks(r, search_frames, frames_per_block))
+                carry = b""
+                if search_frames and len(tail) // SAMPLE_WIDTH == search_frames and r.tell() < r.getnframes():
+                    cut = _quietest(tail)
+                    tail, carry = tail[:cut], tail[cut:]
+                if tail:
+                    w = w or _open_writer(chunk_path)
+                    w.writeframes(tail)
+            finally:
+                if w is not None:
+                    w.close()
+            if w is None:
+                break
+            yield chunk_path
+            index += 1
@@ -0,0 +1,121 @@
+# batch_feedback.py - 保存済み履歴のAIフィードバックをまとめて生成し直す
+# 1回の GPT-4o リクエストに複数の学生（--batch-size 人）を詰め、--workers 本ずつ並列に送る。
+# 送信中の見積もりトークン数が --token-budget を超えないように待つ（レート制限対策）。
+# 応答のJSONが壊れていた・抜けていた学生は、その学生だけ1人ずつ生成し直す。
+#
+# 使い方:
+#   python batch_feedback.py history_azure.db --missing             # 未生成・エラー・代わりのコメントだけ作り直す
+#   python batch_feedback.py history_speechace.db --class 英語I --since 2025-04-01 --batch-size 8
+#   python batch_feedback.py history_azure.db --missing --dry-run   # 対象件数だけ表示
+
+import argparse
+import logging
+import os
+import sqlite3
+import time
+from typing import Dict, List, Optional
+
+from openai import OpenAI
+
+import feedback
+import scoring
+from rescore import detect_engine
+
+logger = logging.getLogger(__name__)
+
+# 「（OPENAI_API_KEY未設定のため…）」「（フィードバック生成エラー: …）」は全角括弧で始まり、
+# GPT-4o の代わりに作ったローカルのコメントは FALLBACK_NOTE で終わる
+MISSING_CONDITION = ("(feedback IS NULL OR feedback = '' OR feedback LIKE '（%' "
+                     f"OR feedback LIKE '%{feedback.FALLBACK_NOTE.strip()}')")
+
+def select_rows(conn: sqlite3.Connection, engine: str, missing: bool = False, class_group: Optional[str] = None,
+                since: Optional[str] = None) -> List[sqlite3.Row]:
+    columns = ["id", "task_type", "target_text", "transcription", "total_score", "rubric_version"]
+    columns += feedback.SCORE_KEYS[engine] + [col for col, _ in feedback.ERROR_LABELS[engine]]
+    where, params = [], []
+    if missing:
+        where.append(MISSING_CONDITION)
+    if class_group:
+        where.append("class_group = ?")
+        params.append(class_group)
+    if since:
+        where.append("datetime >= ?")
+        params.append(since)
+    sql = f"SELECT {', '.join(columns)} FROM assessments"
+    if where:
+        sql += " WHERE " + " AND ".join(where)
+    conn.row_factory = sqlite3.Row
+    return conn.execute(sql + " ORDER BY datetime", params).fetchall()
+
+def build_items(rows: List[sqlite3.Row], engine: str) -> List[Dict]:
+    """保存時と同じルーブリックでレベル判定して、1行ずつフィードバック依頼にする"""
+    rubrics: Dict[Optional[str], Dict] = {}
+    items = []
+    for row in rows:
+        version = row["rubric_version"]
+        if version not in rubrics:
+            try:
+                rubrics[version] = scoring.load_rubric(version)
+            except ValueError:
+                rubrics[version] = scoring.load_rubric()
+        level_hint = scoring.get_level_hint(row["total_score"] or 0, rubrics[version])
+        scores = {k: row[k] or 0 for k in feedback.SCORE_KEYS[engine]}
+        errors = {col: row[col] or "" for col, _ in feedback.ERROR_LABELS[engine]}
+        # DB の課題タイプは画面の表示名（音読課題/スピーチ課題）。アプリと同じ reading/speech にして
+        # 応答キャッシュのキーを揃える
+        items.append(feedback.make_item(row["id"], engine, scoring.task_key(row["task_type"] or ""), level_hint,
+                                        row["target_text"], row["transcription"], scores, errors, row["total_score"]))
+    return items
+
+def regenerate(db_path: str, missing: bool = False, class_group: Optional[str] = None, since: Optional[str] = None,
+               batch_size: int = 5, workers: int = 4, token_budget: int = 60000, engine: Optional[str] = None,
+               dry_run: bool = False, client=None) -> Dict[str, str]:
+    """対象行のフィードバックを生成して assessments.feedback に書き込み、id → 本文 を返す"""
+    conn = sqlite3.connect(db_path, check_same_thread=False)
+    try:
+        engine = engine or detect_engine(conn)
+        feedback.init_table(conn)
+        items = build_items(select_rows(conn, engine, missing, class_group, since), engine)
+        if dry_run or not items:
+            return {item["key"]: "" for item in items}
+        if client is None:
+            api_key = os.getenv("OPENAI_API_KEY", "")
+            if not api_key:
+                raise ValueError("OPENAI_API_KEY が設定されていません")
+            client = OpenAI(api_key=api_key)
+
+        def write(texts: Dict[str, str]):
+            # まとまりごとに書き込む（途中で止まっても、それまでの分は残る）
+            with conn:
+                conn.executemany("UPDATE assessments SET feedback = ? WHERE id = ?",
+                                 [(text, key) for key, text in texts.items()])
+
+        return feedback.generate_batch(client, db_path, items, batch_size, workers, token_budget, on_done=write)
+    finally:
+        conn.close()
+
+def main():
+    parser = argparse.ArgumentParser(description="保存済み履歴のAIフィードバックをまとめて生成")
+    parser.add_argument("db_path", help="履歴DB（history_azure.db / history_speechace.db）")
+    parser.add_argument("--missing", action="store_true", help="未生成・エラーのフィードバックだけ")
+    parser.add_argument("--class", dest="class_group", default=None, help="クラスで絞り込む")
+    parser.add_argument("--since", default=None, help="この日時以降（例: 2025-04-01）")
+    parser.add_argument("--batch-size", type=int, default=5, help="1リクエストにまとめる学生数")
+    parser.add_argument("--workers", type=int, default=4, help="同時に送るリクエスト数")
+    parser.add_argument("--token-budget", type=int, default=60000, help="送信中の見積もりトークン数の上限")
+    parser.add_argument("--engine", choices=["azure", "speechace"], default=None, help="省略時は列構成から判定")
+    parser.add_argument("--dry-run", action="store_true", help="生成せずに対象件数だけ表示")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+
+    start = time.time()
+    results = regenerate(args.db_path, args.missing, args.class_group, args.since, args.batch_size,
+                         args.workers, args.token_budget, args.engine, args.dry_run)
+    if args.dry_run:
+        print(f"{len(results)}件が対象です")
+        return
+    failed = sum(1 for text in results.values() if text.startswith("（"))
+    print(f"{len(results)}件を生成（エラー {failed}件、{time.time() - start:.2f}秒）")
+
+if __name__ == "__main__":
+    main()
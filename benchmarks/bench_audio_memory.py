@@ -0,0 +1,89 @@
+# bench_audio_memory.py - 長い録音の変換・分割のメモリ使用量（pydub 全体読み込み vs ストリーミング）
+# 使い方: python benchmarks/bench_audio_memory.py [分数]
+#
+# 一時ディレクトリに合成音声（既定 60 分、44.1kHz / モノラル / 16bit の WAV）を1分ずつ書き出し、
+# 「16kHz モノラルへの変換 → 40秒ごとの分割」を別プロセスで実行してピークRSS（VmHWM）と時間を比べる。
+#   pydub   … 以前の convert_to_wav / split_audio（AudioSegment.from_file で全体をデコードしてスライス）
+#   stream  … audio_stream.convert_to_wav / iter_chunks（1秒ずつ読み書き）
+
+import json
+import subprocess
+import sys
+import tempfile
+import time
+import wave
+from pathlib import Path
+
+BENCH_DIR = Path(__file__).resolve().parent
+sys.path.insert(0, str(BENCH_DIR.parent))
+sys.path.insert(0, str(BENCH_DIR))
+
+SOURCE_RATE = 44100
+CHUNK_SECONDS = 40
+
+def make_long_wav(path: Path, minutes: int):
+    import synth_audio
+    with wave.open(str(path), "wb") as w:
+        w.setnchannels(1)
+        w.setsampwidth(2)
+        w.setframerate(SOURCE_RATE)
+        for i in range(minutes):
+            w.writeframes(synth_audio.speech_like(60, SOURCE_RATE, seed=i).tobytes())
+
+def peak_rss_kb() -> int:
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith("VmHWM:"):
+                return int(line.split()[1])
+    import resource
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+def run_pydub(src: Path, work: Path) -> int:
+    from pydub import AudioSegment
+    audio = AudioSegment.from_file(src)
+    audio = audio.set_channels(1).set_frame_rate(16000).set_sample_width(2)
+    wav = work / "converted.wav"
+    audio.export(wav, format="wav")
+    audio = AudioSegment.from_file(wav)
+    chunk_ms = CHUNK_SECONDS * 1000
+    n = 0
+    for i in range(0, len(audio), chunk_ms):
+        audio[i:i + chunk_ms].export(work / f"chunk{n}.wav", format="wav")
+        n += 1
+    return n
+
+def run_stream(src: Path, work: Path) -> int:
+    import audio_stream
+    wav = audio_stream.convert_to_wav(src, work / "converted.wav")
+    return sum(1 for _ in audio_stream.iter_chunks(wav, work, CHUNK_SECONDS))
+
+def child(mode: str, src: str, work: str):
+    """計測用の子プロセス（ピークRSSを他のモードと混ぜないため）"""
+    start_kb = peak_rss_kb()
+    t0 = time.perf_counter()
+    chunks = (run_pydub if mode == "pydub" else run_stream)(Path(src), Path(work))
+    print(json.dumps({"mode": mode, "chunks": chunks, "seconds": round(time.perf_counter() - t0, 2),
+                      "baseline_rss_mb": round(start_kb / 1024, 1), "peak_rss_mb": round(peak_rss_kb() / 1024, 1)}))
+
+def main(minutes: int):
+    with tempfile.TemporaryDirectory() as tmp:
+        src = Path(tmp) / "lecture.wav"
+        make_long_wav(src, minutes)
+        print(f"{minutes}分の録音: {src.stat().st_size / 1024 / 1024:.0f}MB（44.1kHz / モノラル / 16bit）")
+        for mode in ("stream", "pydub"):
+            work = Path(tmp) / mode
+            work.mkdir()
+            out = subprocess.run([sys.executable, __file__, "--child", mode, str(src), str(work)],
+                                 capture_output=True, text=True)
+            if out.returncode != 0:
+                print(f"{mode:<6} 失敗: {out.stderr.strip().splitlines()[-1] if out.stderr.strip() else out.returncode}")
+                continue
+            r = json.loads(out.stdout.strip().splitlines()[-1])
+            print(f"{mode:<6} ピークRSS {r['peak_rss_mb']:>7.1f}MB（起動時 {r['baseline_rss_mb']:.1f}MB） "
+                  f"{r['seconds']:>6.2f}秒  {r['chunks']}チャンク")
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "--child":
+        child(*sys.argv[2:5])
+    else:
+        main(int(sys.argv[1]) if len(sys.argv) > 1 else 60)
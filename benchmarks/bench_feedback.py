@@ -0,0 +1,161 @@
+# bench_feedback.py - AIフィードバックの1人ずつ生成とまとめて生成の比較（APIクレジットを使わない）
+# 使い方:
+#   python benchmarks/bench_feedback.py --students 200
+#   python benchmarks/bench_feedback.py --students 200 --batch-size 8 --workers 4 --latency-ms 2500 \
+#       --malformed-rate 0.1 --out bench_feedback.json
+#
+# 始める前に、batch_feedback.py が保存済みの行から作る依頼と、評価直後にアプリが作る依頼とで
+# 応答キャッシュのキーが一致することを確認する（一致しないと一括生成とアプリでキャッシュを共有できない）。
+#
+# ローカルの OpenAI スタブに対して、同じ --students 人分のフィードバックを
+#   single  1人1リクエスト（--workers 並列）
+#   batch   feedback.generate_batch（--batch-size 人で1リクエスト、--workers 並列）
+# で生成し、所要時間・リクエスト数・トークン数（キャッシュ分を含む）・やり直しの件数を比べる。
+# 応答キャッシュ（feedback_cache）は切って、毎回 API を呼ぶ条件で測る。
+
+import argparse
+import json
+import logging
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Dict, List
+
+from openai import OpenAI
+
+BENCH_DIR = Path(__file__).resolve().parent
+sys.path.insert(0, str(BENCH_DIR.parent))
+sys.path.insert(0, str(BENCH_DIR))
+from stub_servers import DEFAULT_TEXT, StubServers
+
+import batch_feedback
+import feedback
+import scoring
+
+WORDS = DEFAULT_TEXT.lower().rstrip(".").split()
+
+def make_items(n: int, seed: int = 0) -> List[Dict[str, Any]]:
+    rng = random.Random(seed)
+    items = []
+    for i in range(n):
+        scores = {k: round(rng.uniform(50, 95), 1) for k in feedback.SCORE_KEYS["azure"]}
+        bad = rng.sample(WORDS, 3)
+        errors = {
+            "mispronounced_words": ", ".join(f"{w}({rng.randint(30, 59)}点誤発音)" for w in bad),
+            "phoneme_errors": ", ".join(f"{w}[{w[0]}]" for w in bad[:2]),
+        }
+        items.append(feedback.make_item(f"s{i:04d}", "azure", "音読課題", "中級", DEFAULT_TEXT, DEFAULT_TEXT,
+                                        scores, errors))
+    return items
+
+def check_cache_keys() -> None:
+    """同じ評価から一括生成（batch_feedback.build_items）とアプリ（generate_feedback）が作る依頼のキャッシュキーが一致するか確認"""
+    settings = {**feedback.load_settings(), "cache": True}
+    for engine in scoring.TOTAL_WEIGHTS:
+        error_cols = [col for col, _ in feedback.ERROR_LABELS[engine]]
+        columns = ["task_type", "target_text", "transcription", "total_score", "rubric_version"]
+        columns += feedback.SCORE_KEYS[engine] + error_cols
+        conn = sqlite3.connect(":memory:")
+        conn.execute(f"CREATE TABLE assessments (id INTEGER PRIMARY KEY, datetime TEXT, {', '.join(columns)})")
+        expected = {}
+        for label, task in (("音読課題", "reading"), ("スピーチ課題", "speech")):
+            scores = {k: 72.4 for k in feedback.SCORE_KEYS[engine]}
+            errors = {col: "water(45点誤発音), /r/(right内, 40点)" for col in error_cols}
+            # アプリは reading/speech で採点・フィードバックし、DB には表示名を保存する
+            total = scoring.calc_total(scores, task, engine)
+            app_item = feedback.make_item("", engine, task, scoring.get_level_hint(total), DEFAULT_TEXT,
+                                          DEFAULT_TEXT, scores, errors, total)
+            row_id = conn.execute(
+                f"INSERT INTO assessments (datetime, {', '.join(columns)}) VALUES ('2025-04-01', {', '.join('?' * len(columns))})",
+                [label, DEFAULT_TEXT, DEFAULT_TEXT, total, scoring.DEFAULT_RUBRIC["version"]]
+                + [scores[k] for k in feedback.SCORE_KEYS[engine]] + [errors[col] for col in error_cols],
+            ).lastrowid
+            expected[row_id] = feedback._key(app_item, settings)
+        for item in batch_feedback.build_items(batch_feedback.select_rows(conn, engine), engine):
+            assert feedback._key(item, settings) == expected[item["key"]], \
+                f"{engine}/{item['task_type']}: 一括生成とアプリでキャッシュキーが不一致"
+        conn.close()
+    print("✅ 一括生成とアプリの応答キャッシュのキーは一致")
+
+class Counter(logging.Handler):
+    """feedback_tokens のログを数える（students > 1 がまとめたリクエスト）"""
+
+    def __init__(self):
+        super().__init__()
+        self.records: List[Dict[str, Any]] = []
+
+    def emit(self, record):
+        try:
+            self.records.append(json.loads(record.getMessage()))
+        except ValueError:
+            pass
+
+def run(mode: str, args, items: List[Dict[str, Any]]) -> Dict[str, Any]:
+    with StubServers(openai_latency_ms=args.latency_ms, jitter_ms=args.jitter_ms,
+                     malformed_rate=args.malformed_rate, seed=args.seed) as stubs, \
+            tempfile.TemporaryDirectory() as tmp:
+        client = OpenAI(api_key="bench", base_url=stubs.openai_url, max_retries=0)
+        db_path = str(Path(tmp) / "bench.db")
+        counter = Counter()
+        feedback.logger.addHandler(counter)
+        start = time.perf_counter()
+        try:
+            if mode == "single":
+                with ThreadPoolExecutor(max_workers=args.workers) as pool:
+                    texts = list(pool.map(lambda item: feedback.generate(client, db_path, item), items))
+            else:
+                texts = list(feedback.generate_batch(client, db_path, items, args.batch_size, args.workers,
+                                                     args.token_budget).values())
+        finally:
+            feedback.logger.removeHandler(counter)
+        elapsed = time.perf_counter() - start
+        stats = stubs.stats()["openai"]
+    calls = [r for r in counter.records if r.get("event") == "feedback_tokens" and not r["cache_hit"]]
+    return {
+        "mode": mode,
+        "students": len(items),
+        "seconds": round(elapsed, 2),
+        "students_per_sec": round(len(items) / elapsed, 2),
+        "requests": stats["requests"],
+        "fallback_requests": sum(1 for r in calls if r["students"] == 1) if mode == "batch" else 0,
+        "failed": sum(1 for t in texts if t.startswith("（")),
+        "tokens": stats["tokens"],
+        "uncached_prompt_tokens": stats["tokens"]["prompt"] - stats["tokens"]["cached"],
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="AIフィードバックの1人ずつ生成とまとめて生成の比較")
+    parser.add_argument("--students", type=int, default=100)
+    parser.add_argument("--batch-size", type=int, default=5)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--token-budget", type=int, default=60000)
+    parser.add_argument("--latency-ms", type=float, default=1500, help="スタブの応答時間（GPT-4o 相当）")
+    parser.add_argument("--jitter-ms", type=float, default=300)
+    parser.add_argument("--malformed-rate", type=float, default=0.0, help="まとめた応答を壊す割合")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", default=None, help="結果を保存するJSON")
+    args = parser.parse_args()
+
+    check_cache_keys()
+    feedback.logger.setLevel(logging.INFO)
+    feedback.logger.propagate = False  # 1件ごとの JSON ログは画面に出さずに数えるだけ
+    settings = {**feedback.load_settings(), "cache": False}
+    feedback.load_settings = lambda: settings
+    items = make_items(args.students, args.seed)
+    results = [run("single", args, items), run("batch", args, items)]
+
+    print(f"{'mode':8} {'秒':>8} {'人/秒':>8} {'req':>6} {'やり直し':>8} {'失敗':>5} {'prompt':>9} {'cached':>9} {'completion':>10}")
+    for r in results:
+        t = r["tokens"]
+        print(f"{r['mode']:8} {r['seconds']:8.2f} {r['students_per_sec']:8.2f} {r['requests']:6d} "
+              f"{r['fallback_requests']:8d} {r['failed']:5d} {t['prompt']:9d} {t['cached']:9d} {t['completion']:10d}")
+    if args.out:
+        Path(args.out).write_text(json.dumps({"args": vars(args), "results": results}, ensure_ascii=False, indent=2),
+                                  encoding="utf-8")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,60 @@
+# bench_phoneme_heatmap.py - 音素ヒートマップ用の集計クエリの計測
+# 使い方: python benchmarks/bench_phoneme_heatmap.py [単語数]
+#
+# 一時DBに合成データ（既定 100,000 単語、1単語あたり約3音素）を入れ、
+# ヒートマップページと同じ集計（クラス×音素、クラス別の苦手単語）の時間を測る。
+
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+import phoneme_store
+
+PHONEMES = ["r", "l", "th", "dh", "v", "b", "f", "s", "z", "sh", "ae", "ah", "iy", "ih", "uw", "uh",
+            "er", "ay", "ey", "ow", "n", "ng", "m", "t", "d", "k", "g", "p", "w", "y", "hh", "jh", "ch"]
+WORDS = ["really", "think", "the", "very", "light", "world", "through", "although", "three", "vision",
+         "rather", "clothes", "water", "girl", "library", "comfortable", "february", "rural", "thirty"]
+CLASSES = ["英語I", "英語II", "Academic English", "英語特定技能演習（発信）", "英語特定技能演習（受信）"]
+
+def make_words(rng: random.Random, n_words: int) -> list:
+    words = []
+    for i in range(n_words):
+        phonemes = [{"phoneme": rng.choice(PHONEMES), "offset_ms": i * 300 + j * 100, "duration_ms": 100,
+                     "accuracy": rng.uniform(20, 100)} for j in range(rng.randint(2, 4))]
+        words.append({"word": rng.choice(WORDS), "offset_ms": i * 300, "duration_ms": 300,
+                      "accuracy": rng.uniform(30, 100), "error_type": "None", "phonemes": phonemes})
+    return words
+
+def main(n_words: int):
+    rng = random.Random(0)
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = str(Path(tmp) / "bench.db")
+        conn = sqlite3.connect(db_path)
+        conn.execute("CREATE TABLE assessments (id TEXT PRIMARY KEY)")
+        phoneme_store.init_tables(conn)
+        words_per_assessment = 100
+        for a in range(n_words // words_per_assessment):
+            phoneme_store.save_scores(conn, f"a{a}", rng.choice(CLASSES), make_words(rng, words_per_assessment))
+        conn.commit()
+        n_phonemes = conn.execute("SELECT COUNT(*) FROM phoneme_scores").fetchone()[0]
+        conn.close()
+
+        t0 = time.perf_counter()
+        stats = phoneme_store.class_phoneme_stats(db_path)
+        pivot = stats.pivot(index="クラス", columns="音素", values="エラー率")
+        t_heatmap = time.perf_counter() - t0
+
+        t0 = time.perf_counter()
+        phoneme_store.class_problem_words(db_path, CLASSES[0])
+        t_words = time.perf_counter() - t0
+
+        print(f"{n_words:,}単語 / {n_phonemes:,}音素")
+        print(f"クラス×音素の集計: {t_heatmap * 1000:.0f}ms（{pivot.shape[0]}クラス × {pivot.shape[1]}音素）")
+        print(f"苦手単語の集計: {t_words * 1000:.0f}ms")
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 100_000)
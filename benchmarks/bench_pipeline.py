@@ -0,0 +1,251 @@
+# bench_pipeline.py - 評価パイプライン全体のオフライン・ベンチマーク（APIクレジットを使わない）
+# 使い方:
+#   python benchmarks/bench_pipeline.py --engine speechace
+#   python benchmarks/bench_pipeline.py --engine azure --lengths 10 30 120 --formats wav mp3 m4a webm \
+#       --latency-ms 400 --jitter-ms 150 --error-rate 0.05 --sessions 4 --out bench_azure.json
+#   python benchmarks/bench_pipeline.py --engine azure --compare bench_azure.json   # 前回結果との比較
+#   python benchmarks/bench_pipeline.py --batch 200 --feedback-cache off            # 応答キャッシュなしと比べる
+#
+# 一時ディレクトリで app_azure.py / app_speechace.py を読み込み（Streamlit は bare モード）、
+# Speechace / OpenAI はローカルのスタブサーバー、Azure は偽の認識器に差し替えて
+# 「WAV変換 → (Whisper) → 発音評価 → GPT-4o → DB保存」を実行する。ワークロードは3種類:
+#   single     長さ × 形式ごとに --repeat 回ずつ順番に実行
+#   batch      コーパス全体を --batch 件、1件ずつ順番に実行（スループット）
+#   concurrent 同じ件数を --sessions 個の同時セッションで実行
+# 結果（件数・エラー・p50/p95/p99・段階別 p50・スループット）は --out の JSON に保存する。
+# 最後に、アプリが保存した履歴DBの総合点をずらしてから rescore.py で再採点し、総合点・進捗サマリー・
+# クラス統計が元どおりに戻ることを確認する（実際の id・スキーマで総合点が変わる再採点を通す）。
+
+import argparse
+import importlib
+import json
+import os
+import platform
+import sqlite3
+import sys
+import tempfile
+import time
+import types
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+import streamlit.config
+import streamlit.logger
+
+BENCH_DIR = Path(__file__).resolve().parent
+sys.path.insert(0, str(BENCH_DIR.parent))
+sys.path.insert(0, str(BENCH_DIR))
+import fake_azure_speech
+import synth_audio
+from stub_servers import DEFAULT_TEXT, StubServers
+
+import feedback
+import progress
+import rescore
+import rollup
+import timing
+
+def load_app(engine: str, stubs: StubServers):
+    """スタブに向けた環境変数を設定してからアプリを読み込む（カレントディレクトリにDBが作られる）"""
+    os.environ.update({
+        "AZURE_SPEECH_REGION": "bench", "AZURE_SPEECH_KEY": "bench",
+        "SPEECHACE_API_KEY": "bench", "OPENAI_API_KEY": "bench",
+        "OPENAI_BASE_URL": stubs.openai_url,
+    })
+    # アプリは Streamlit の bare モードで動かすので、ScriptRunContext がないという警告などは出さない
+    streamlit.config.set_option("logger.level", "error")
+    streamlit.logger.set_log_level("error")
+    if engine == "azure":
+        try:
+            import azure.cognitiveservices.speech  # noqa: F401
+        except ImportError:
+            # SDK がない環境でも読み込めるように偽の認識器を登録する
+            azure = sys.modules.setdefault("azure", types.ModuleType("azure"))
+            azure.cognitiveservices = types.ModuleType("azure.cognitiveservices")
+            azure.cognitiveservices.speech = fake_azure_speech
+            sys.modules["azure.cognitiveservices"] = azure.cognitiveservices
+            sys.modules["azure.cognitiveservices.speech"] = fake_azure_speech
+        app = importlib.import_module("app_azure")
+        app.speechsdk = fake_azure_speech
+    else:
+        app = importlib.import_module("app_speechace")
+        app.SPEECHACE_API_URL = stubs.speechace_url
+    return app
+
+def run_one(app, item: Dict[str, Any], index: int) -> Dict[str, Any]:
+    """ファイルアップロード1件分（評価ボタン → ヘッダ確認・変換 → run_assessment）"""
+    timings = timing.start()
+    reading = index % 2 == 0  # 音読課題とスピーチ課題（目標テキストなし）を交互に
+    t0 = time.perf_counter()
+    error = None
+    try:
+        task_type = "音読課題" if reading else "スピーチ課題"
+        app.ensure_dir(app.DOWNLOADS_DIR)
+        wav = app.prepare_audio(item["path"], task_type)
+        app.run_assessment(wav, f"bench{index:05d}", "", "英語I", task_type, "", DEFAULT_TEXT if reading else "")
+    except Exception as e:
+        error = f"{type(e).__name__}: {e}"
+    return {"ms": (time.perf_counter() - t0) * 1000, "error": error, "stages": dict(timings.spans),
+            "seconds": item["seconds"], "format": item["format"]}
+
+RESCORE_TABLES = {
+    "assessments": "SELECT id, total_score, band, cefr, toefl, ielts FROM assessments ORDER BY id",
+    "student_progress": "SELECT student_id, task_type, dimension, n, ROUND(total, 3), ROUND(total_sq, 1), "
+                        "ROUND(total_xy, 1), min_value, max_value, first_value, last_value "
+                        "FROM student_progress ORDER BY student_id, task_type, dimension",
+    "class_rollup": "SELECT class_group, task_type, week, dimension, n, ROUND(total, 3), ROUND(total_sq, 1), "
+                    "min_value, max_value FROM class_rollup ORDER BY class_group, task_type, week, dimension",
+    "class_rollup_hist": "SELECT * FROM class_rollup_hist ORDER BY class_group, task_type, week, dimension, bin",
+}
+RESCORE_SHIFT = 7.3  # 古いルーブリックで採点された状態を作るためにずらす点数
+
+def check_rescore(db_path: str) -> None:
+    """総合点をずらした履歴DBを rescore.py で再採点し、総合点と進捗サマリー・クラス統計が元に戻るか確認"""
+    conn = sqlite3.connect(db_path)
+    try:
+        before = {name: conn.execute(sql).fetchall() for name, sql in RESCORE_TABLES.items()}
+        shifted = {i: (t, t + RESCORE_SHIFT) for i, t in conn.execute("SELECT id, total_score FROM assessments")}
+        with conn:
+            conn.executemany("UPDATE assessments SET total_score = ? WHERE id = ?",
+                             [(new, i) for i, (_, new) in shifted.items()])
+            progress.rescore(conn, "total_score", shifted)
+            rollup.rescore(conn, "total_score", shifted)
+    finally:
+        conn.close()
+    updates = rescore.rescore_history(db_path)
+    assert len(updates) == len(shifted), f"再採点の件数が不一致: {len(updates)} / {len(shifted)}"
+    conn = sqlite3.connect(db_path)
+    try:
+        for name, sql in RESCORE_TABLES.items():
+            assert conn.execute(sql).fetchall() == before[name], f"{name}: 再採点の後に元の値に戻りません"
+    finally:
+        conn.close()
+    print(f"✅ 再採点（{len(updates)}件）の後も総合点・進捗サマリー・クラス統計が一致")
+
+def summarize(runs: List[Dict[str, Any]], wall_seconds: Optional[float] = None) -> Dict[str, Any]:
+    ok = [r for r in runs if r["error"] is None]
+    ms = np.array([r["ms"] for r in ok]) if ok else np.array([0.0])
+    stages = sorted({s for r in ok for s in r["stages"]})
+    result = {
+        "n": len(runs),
+        "errors": len(runs) - len(ok),
+        "latency_ms": {"mean": round(float(ms.mean()), 1),
+                       **{f"p{q}": round(float(np.percentile(ms, q)), 1) for q in (50, 95, 99)}},
+        "stages_p50_ms": {s: round(float(np.median([r["stages"].get(s, 0) for r in ok])), 1) for s in stages},
+    }
+    if wall_seconds is not None:
+        result["wall_seconds"] = round(wall_seconds, 2)
+        result["throughput_per_min"] = round(len(ok) / wall_seconds * 60, 1) if wall_seconds else 0
+    errors = sorted({r["error"] for r in runs if r["error"]})
+    if errors:
+        result["error_samples"] = errors[:5]
+    return result
+
+def bench(args) -> Dict[str, Any]:
+    with tempfile.TemporaryDirectory() as tmp, StubServers(args.latency_ms, args.jitter_ms, args.error_rate,
+                                                           args.openai_latency_ms, args.seed) as stubs:
+        formats = synth_audio.available_formats(args.formats)
+        skipped = sorted(set(args.formats) - set(formats))
+        if skipped:
+            print(f"ffmpeg / ffprobe がないため {', '.join(skipped)} は省略します")
+        corpus = synth_audio.make_corpus(Path(tmp) / "corpus", args.lengths, formats, args.seed)
+
+        cwd = os.getcwd()
+        os.chdir(tmp)
+        try:
+            fake_azure_speech.configure(args.latency_ms, args.jitter_ms, args.error_rate, args.seed + 2)
+            app = load_app(args.engine, stubs)
+            settings = {**feedback.load_settings(), "cache": args.feedback_cache == "on"}
+            feedback.load_settings = lambda: settings
+            results: Dict[str, Any] = {"single": []}
+            index = 0
+
+            for item in corpus:
+                runs = []
+                for _ in range(args.repeat):
+                    runs.append(run_one(app, item, index))
+                    index += 1
+                results["single"].append({"seconds": item["seconds"], "format": item["format"], **summarize(runs)})
+                print(f"single  {item['seconds']:>5g}s {item['format']:<4} "
+                      f"p50={results['single'][-1]['latency_ms']['p50']:.0f}ms")
+
+            batch = [corpus[i % len(corpus)] for i in range(args.batch)]
+            t0 = time.perf_counter()
+            runs = [run_one(app, item, index + i) for i, item in enumerate(batch)]
+            results["batch"] = summarize(runs, time.perf_counter() - t0)
+            index += len(batch)
+            print(f"batch   {args.batch}件 {results['batch']['throughput_per_min']}件/分")
+
+            t0 = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=args.sessions) as pool:
+                runs = list(pool.map(lambda p: run_one(app, p[1], index + p[0]), enumerate(batch)))
+            results["concurrent"] = {"sessions": args.sessions, **summarize(runs, time.perf_counter() - t0)}
+            print(f"concurrent {args.sessions}セッション {results['concurrent']['throughput_per_min']}件/分")
+            check_rescore(app.DB_PATH)
+        finally:
+            os.chdir(cwd)
+
+        stub_stats = stubs.stats()
+        stub_stats["azure"] = {"requests": fake_azure_speech.config.requests, "errors": fake_azure_speech.config.errors}
+
+    return {
+        "created": datetime.now().isoformat(timespec="seconds"),
+        "engine": args.engine,
+        "config": {k: v for k, v in vars(args).items() if k not in ("out", "compare")},
+        "environment": {"python": platform.python_version(), "platform": platform.platform(),
+                        "ffmpeg": synth_audio.has_ffmpeg()},
+        "stubs": stub_stats,
+        "workloads": results,
+    }
+
+def compare(current: Dict[str, Any], baseline: Dict[str, Any]):
+    """p50 / p95 とスループットを前回結果と比べて表示する"""
+    print(f"\n前回（{baseline['created']}）との比較")
+    for name in ("batch", "concurrent"):
+        cur, base = current["workloads"].get(name), baseline["workloads"].get(name)
+        if not cur or not base:
+            continue
+        for key in ("p50", "p95"):
+            a, b = base["latency_ms"][key], cur["latency_ms"][key]
+            print(f"  {name:<10} {key}: {a:.0f}ms → {b:.0f}ms（{(b - a) / a * 100 if a else 0:+.1f}%）")
+        a, b = base["throughput_per_min"], cur["throughput_per_min"]
+        print(f"  {name:<10} throughput: {a} → {b}件/分")
+    a, b = baseline["stubs"]["openai"].get("tokens"), current["stubs"]["openai"].get("tokens")
+    if a and b:
+        print(f"  OpenAI tokens: 入力 {a['prompt']} → {b['prompt']}（うちキャッシュ {a['cached']} → {b['cached']}）"
+              f"、出力 {a['completion']} → {b['completion']}")
+
+def main():
+    parser = argparse.ArgumentParser(description="評価パイプラインのオフライン・ベンチマーク")
+    parser.add_argument("--engine", choices=["azure", "speechace"], default="speechace")
+    parser.add_argument("--lengths", type=float, nargs="+", default=[10, 30, 60, 120], help="音声の長さ（秒）")
+    parser.add_argument("--formats", nargs="+", default=["wav", "mp3", "m4a", "webm"])
+    parser.add_argument("--repeat", type=int, default=3, help="single の繰り返し回数")
+    parser.add_argument("--batch", type=int, default=20, help="batch / concurrent の件数")
+    parser.add_argument("--sessions", type=int, default=4, help="concurrent の同時セッション数")
+    parser.add_argument("--latency-ms", type=float, default=300, help="スタブの平均応答時間")
+    parser.add_argument("--jitter-ms", type=float, default=100, help="スタブの応答時間の標準偏差")
+    parser.add_argument("--openai-latency-ms", type=float, default=None, help="OpenAIスタブだけ別の応答時間にする")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="スタブがエラーを返す割合")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--feedback-cache", choices=["on", "off"], default="on", help="フィードバックの応答キャッシュ")
+    parser.add_argument("--out", default="bench_pipeline.json", help="結果のJSON")
+    parser.add_argument("--compare", default=None, help="比較する前回結果のJSON")
+    args = parser.parse_args()
+
+    baseline = None
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)
+    result = bench(args)
+    with open(args.out, "w", encoding="utf-8") as f:
+        json.dump(result, f, ensure_ascii=False, indent=2)
+    print(f"結果: {args.out}")
+    if baseline:
+        compare(result, baseline)
+
+if __name__ == "__main__":
+    main()
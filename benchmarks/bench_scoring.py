@@ -0,0 +1,79 @@
+# bench_scoring.py - スコア換算のスカラー版 / ベクトル化版の比較
+# 使い方: python benchmarks/bench_scoring.py [行数]
+#
+# 1. ランダム＋境界値のスコアで、ベクトル化版がスカラー版と完全に一致することを確認
+# 2. 指定行数（既定 1,000,000 行）で処理時間を比較
+
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+import scoring
+
+def make_frame(n: int, engine: str, seed: int = 0) -> pd.DataFrame:
+    """ランダムな構成スコア（0.1刻み）と境界値・端数を混ぜた DataFrame を作る"""
+    rng = np.random.default_rng(seed)
+    cols = list(scoring.TOTAL_WEIGHTS[engine]["speech"])
+    df = pd.DataFrame({c: np.round(rng.uniform(0, 100, n), 1) for c in cols})
+    # 境界値ちょうど・丸めで .x5 になりやすい値を混ぜる
+    edges = np.array([0, 39.99, 40, 50, 54.95, 55, 59.95, 60, 69.95, 70, 79.95, 80, 84.95, 85,
+                      89.95, 90, 99.95, 100, 0.15, 2.675, 37.45, 62.25, 71.35], dtype=np.float64)
+    k = min(n, 50_000)
+    for c in cols:
+        df.loc[: k - 1, c] = rng.choice(edges, k)
+    df["task_type"] = rng.choice(["音読課題", "スピーチ課題"], n)
+    return df
+
+def scalar_rescore(df: pd.DataFrame, engine: str, rubric=scoring.DEFAULT_RUBRIC) -> pd.DataFrame:
+    cols = list(rubric["weights"][engine]["speech"])
+    rows = df[cols].to_dict("records")
+    tasks = df["task_type"].tolist()
+    total = [scoring.calc_total(r, t, engine, rubric) for r, t in zip(rows, tasks)]
+    return pd.DataFrame({
+        "total_score": total,
+        "band": [scoring.get_band(s, rubric) for s in total],
+        "cefr": [scoring.get_cefr(s, rubric) for s in total],
+        "toefl": [scoring.get_toefl(s, rubric) for s in total],
+        "ielts": [scoring.get_ielts(s, rubric) for s in total],
+    })
+
+def check_equivalence(n: int = 200_000) -> None:
+    """スカラー版とベクトル化版の結果が全行で一致するか確認"""
+    for engine in scoring.TOTAL_WEIGHTS:
+        df = make_frame(n, engine, seed=1)
+        expected = scalar_rescore(df, engine)
+        actual = scoring.rescore_frame(df, engine, scoring.DEFAULT_RUBRIC)
+        for col in expected.columns:
+            mismatch = np.flatnonzero(expected[col].to_numpy() != actual[col].to_numpy())
+            assert len(mismatch) == 0, f"{engine}/{col}: {len(mismatch)}件不一致 (例: 行{mismatch[0]})"
+
+    # 換算関数だけを連続値（丸め前のスコア）でも確認
+    s = np.concatenate([np.linspace(-10, 110, 120_001), np.random.default_rng(2).uniform(-5, 105, 100_000)])
+    for scalar, vec in [(scoring.get_band, scoring.get_band_vec), (scoring.get_cefr, scoring.get_cefr_vec),
+                        (scoring.get_toefl, scoring.get_toefl_vec), (scoring.get_ielts, scoring.get_ielts_vec)]:
+        expected = np.array([scalar(v, scoring.DEFAULT_RUBRIC) for v in s.tolist()], dtype=object)
+        assert (expected == vec(s, scoring.DEFAULT_RUBRIC)).all(), f"{scalar.__name__}: 不一致あり"
+    print("✅ スカラー版とベクトル化版の結果は一致")
+
+def bench(n: int) -> None:
+    for engine in scoring.TOTAL_WEIGHTS:
+        df = make_frame(n, engine)
+
+        t0 = time.perf_counter()
+        scalar_rescore(df, engine)
+        t_scalar = time.perf_counter() - t0
+
+        t0 = time.perf_counter()
+        scoring.rescore_frame(df, engine, scoring.DEFAULT_RUBRIC)
+        t_vec = time.perf_counter() - t0
+
+        print(f"[{engine}] {n:,}行  スカラー: {t_scalar:.2f}秒  ベクトル化: {t_vec:.3f}秒  ({t_scalar / t_vec:.0f}倍)")
+
+if __name__ == "__main__":
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    check_equivalence()
+    bench(n)
@@ -0,0 +1,118 @@
+# fake_azure_speech.py - azure.cognitiveservices.speech の代わりに使う偽の認識器（ベンチマーク用）
+# app_azure.azure_assess が使う範囲（SpeechRecognizer.recognize_once と発音評価の結果JSON）だけを実装する。
+# 音声の長さに応じた単語数・音素数の NBest JSON を返すので、後段の解析・保存の負荷は本物に近い。
+
+import json
+import random
+import time
+import wave
+from types import SimpleNamespace
+
+from stub_servers import DEFAULT_TEXT, StubConfig
+
+TICKS_PER_MS = 10_000
+WORDS_PER_SECOND = 2.5
+
+config = StubConfig()  # configure() で応答時間・エラー率を設定する
+
+def configure(latency_ms: float = 0, jitter_ms: float = 0, error_rate: float = 0, seed: int = 0):
+    global config
+    config = StubConfig(latency_ms, jitter_ms, error_rate, seed)
+
+class ResultReason:
+    RecognizedSpeech = "RecognizedSpeech"
+    NoMatch = "NoMatch"
+
+class PronunciationAssessmentGradingSystem:
+    HundredMark = "HundredMark"
+
+class PronunciationAssessmentGranularity:
+    Phoneme = "Phoneme"
+
+class PropertyId:
+    SpeechServiceResponse_JsonResult = "SpeechServiceResponse_JsonResult"
+
+class SpeechConfig:
+    def __init__(self, subscription: str = "", region: str = ""):
+        self.subscription = subscription
+        self.region = region
+
+class _AudioConfig:
+    def __init__(self, filename: str):
+        self.filename = filename
+
+audio = SimpleNamespace(AudioConfig=_AudioConfig)
+
+class PronunciationAssessmentConfig:
+    def __init__(self, reference_text: str = "", grading_system=None, granularity=None, enable_miscue: bool = False):
+        self.reference_text = reference_text
+        self.prosody = False
+
+    def enable_prosody_assessment(self):
+        self.prosody = True
+
+    def apply_to(self, recognizer: "SpeechRecognizer"):
+        recognizer.pron_cfg = self
+
+def _duration(filename: str) -> float:
+    with wave.open(filename, "rb") as w:
+        return w.getnframes() / w.getframerate()
+
+def _nbest(text: str, seconds: float, rng: random.Random) -> dict:
+    words = text.split() or DEFAULT_TEXT.split()
+    n_words = max(1, int(seconds * WORDS_PER_SECOND))
+    word_ms = seconds * 1000 / n_words
+    result_words = []
+    for i in range(n_words):
+        word = words[i % len(words)].strip(".,!?")
+        offset = i * word_ms
+        letters = [c for c in word.lower() if c.isalpha()][:6] or ["ah"]
+        ph_ms = word_ms * 0.8 / len(letters)
+        phonemes = [{
+            "Phoneme": ch,
+            "Offset": int((offset + j * ph_ms) * TICKS_PER_MS),
+            "Duration": int(ph_ms * TICKS_PER_MS),
+            "PronunciationAssessment": {"AccuracyScore": round(rng.uniform(40, 100))},
+        } for j, ch in enumerate(letters)]
+        accuracy = round(rng.uniform(50, 100))
+        result_words.append({
+            "Word": word,
+            "Offset": int(offset * TICKS_PER_MS),
+            "Duration": int(word_ms * 0.8 * TICKS_PER_MS),
+            "PronunciationAssessment": {"AccuracyScore": accuracy,
+                                        "ErrorType": "Mispronunciation" if accuracy < 60 else "None"},
+            "Phonemes": phonemes,
+        })
+    return {"RecognitionStatus": "Success", "DisplayText": text, "NBest": [{"Display": text, "Words": result_words}]}
+
+class _Result:
+    def __init__(self, reason: str, text: str = "", raw: dict = None, scores: dict = None):
+        self.reason = reason
+        self.text = text
+        self.properties = {PropertyId.SpeechServiceResponse_JsonResult: json.dumps(raw or {})}
+        self.scores = scores or {}
+
+class SpeechRecognizer:
+    def __init__(self, speech_config: SpeechConfig = None, language: str = "en-US", audio_config: _AudioConfig = None):
+        self.audio_config = audio_config
+        self.pron_cfg = None
+
+    def recognize_once(self) -> _Result:
+        delay, fail, seed = config.draw()
+        time.sleep(delay)
+        if fail:
+            return _Result(ResultReason.NoMatch)
+        if self.pron_cfg is None:
+            return _Result(ResultReason.RecognizedSpeech, DEFAULT_TEXT)
+        rng = random.Random(seed)
+        text = self.pron_cfg.reference_text or DEFAULT_TEXT
+        raw = _nbest(text, _duration(self.audio_config.filename), rng)
+        scores = {name: round(rng.uniform(50, 98), 1) for name in ("accuracy", "fluency", "prosody", "completeness")}
+        return _Result(ResultReason.RecognizedSpeech, text, raw, scores)
+
+class PronunciationAssessmentResult:
+    def __init__(self, result: _Result):
+        self.accuracy_score = result.scores.get("accuracy", 0)
+        self.fluency_score = result.scores.get("fluency", 0)
+        self.prosody_score = result.scores.get("prosody", 0)
+        self.completeness_score = result.scores.get("completeness", 0)
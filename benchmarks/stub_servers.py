@@ -0,0 +1,208 @@
+# stub_servers.py - Speechace / OpenAI のローカルスタブ（ベンチマーク用）
+# 本物と同じ形のJSONを返す。応答時間（平均 + ゆらぎ）とエラー率（HTTP 500）を指定できる。
+#
+#   with StubServers(latency_ms=300, jitter_ms=100, error_rate=0.05) as stubs:
+#       stubs.speechace_url  # app_speechace.SPEECHACE_API_URL に設定する
+#       stubs.openai_url     # OPENAI_BASE_URL に設定する
+#
+# chat/completions の usage は本文の長さから見積もり、同じ system メッセージ（1024トークン以上）が
+# 2回目以降に来たら、その分を cached_tokens として返す（OpenAI のプロンプトキャッシュと同じ条件）。
+# response_format が json_object のとき（まとめて生成）は、渡された学生の key ごとのJSONを返す。
+# malformed_rate の割合で壊れたJSONや学生の抜けを返す（1人ずつのやり直しの確認用）。
+
+import json
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, Optional
+
+SPEECHACE_PATH = "/api/scoring/text/v9/json"
+DEFAULT_TEXT = "The quick brown fox jumps over the lazy dog while the students practice reading aloud."
+FEEDBACK_TEXT = "全体的にまあまあいい方です。もう少しリズムを意識して、ポーズの位置を整えましょう。"
+PROMPT_CACHE_MIN_TOKENS = 1024
+PROMPT_CACHE_BLOCK = 128
+
+class StubConfig:
+    def __init__(self, latency_ms: float = 0, jitter_ms: float = 0, error_rate: float = 0, seed: int = 0,
+                 malformed_rate: float = 0):
+        self.latency_ms = latency_ms
+        self.malformed_rate = malformed_rate
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.errors = 0
+        self.tokens = {"prompt": 0, "cached": 0, "completion": 0}
+        self._prefixes: set = set()
+
+    def draw(self) -> tuple:
+        """(待ち時間[秒], エラーにするか, 乱数生成器の種) を決める"""
+        with self._lock:
+            self.requests += 1
+            delay = max(0.0, self._rng.gauss(self.latency_ms, self.jitter_ms)) / 1000
+            fail = self._rng.random() < self.error_rate
+            if fail:
+                self.errors += 1
+            return delay, fail, self._rng.random()
+
+    def usage(self, messages: list, completion: str) -> Dict[str, Any]:
+        """トークン数の見積もり（UTF-8 で3バイト ≒ 1トークン）とプロンプトキャッシュの再現"""
+        prompt = sum(_tokens(m.get("content", "")) for m in messages)
+        cached = 0
+        if messages and messages[0].get("role") == "system":
+            head = _tokens(messages[0]["content"])
+            with self._lock:
+                if head >= PROMPT_CACHE_MIN_TOKENS and messages[0]["content"] in self._prefixes:
+                    cached = head // PROMPT_CACHE_BLOCK * PROMPT_CACHE_BLOCK
+                self._prefixes.add(messages[0]["content"])
+        completion_tokens = _tokens(completion)
+        with self._lock:
+            self.tokens["prompt"] += prompt
+            self.tokens["cached"] += cached
+            self.tokens["completion"] += completion_tokens
+        return {"prompt_tokens": prompt, "completion_tokens": completion_tokens,
+                "total_tokens": prompt + completion_tokens, "prompt_tokens_details": {"cached_tokens": cached}}
+
+def _tokens(text: str) -> int:
+    return max(1, len(text.encode("utf-8")) // 3)
+
+def _words(text: str) -> list:
+    return re.findall(r"[A-Za-z']+", text) or DEFAULT_TEXT.split()
+
+def speechace_response(text: str, seed: float) -> Dict[str, Any]:
+    """Speechace v9 の text スコアリングと同じ構造のレスポンス"""
+    rng = random.Random(seed)
+    word_list = []
+    pos = 0  # 10ミリ秒単位
+    for word in _words(text)[:200]:
+        phones = []
+        for ch in word.lower()[:6]:
+            length = rng.randint(5, 12)
+            phones.append({"phone": ch, "quality_score": round(rng.uniform(40, 100), 1), "extent": [pos, pos + length]})
+            pos += length
+        pos += rng.randint(2, 20)
+        word_list.append({"word": word, "quality_score": round(rng.uniform(45, 100)), "phone_score_list": phones})
+    pron = round(rng.uniform(55, 95), 1)
+    flu = round(rng.uniform(50, 95), 1)
+    return {
+        "status": "success",
+        "quota_remaining": -1,
+        "text_score": {
+            "text": text,
+            "word_score_list": word_list,
+            "speechace_score": {"pronunciation": pron, "fluency": flu},
+            "ielts_score": {"pronunciation": 6.5, "fluency": 6.0},
+            "fluency": {
+                "overall_score": flu,
+                "segment_metrics_list": [{
+                    "duration": pos / 100,
+                    "speechace_score": {"pronunciation": pron, "fluency": flu},
+                    "ielts_score": {"pronunciation": round(pron / 14, 1), "fluency": round(flu / 14, 1)},
+                }],
+            },
+        },
+    }
+
+def batch_feedback_content(messages: list, seed: float, malformed_rate: float) -> str:
+    """まとめて生成の応答本文（{"feedback": {key: 本文}}）。malformed_rate の割合で壊す"""
+    rng = random.Random(seed)
+    try:
+        keys = [s["key"] for s in json.loads(messages[-1]["content"])["students"]]
+    except (ValueError, KeyError, IndexError, TypeError):
+        keys = []
+    content = json.dumps({"feedback": {k: FEEDBACK_TEXT for k in keys}}, ensure_ascii=False)
+    if rng.random() < malformed_rate:
+        if rng.random() < 0.5 or len(keys) < 2:
+            return content[: len(content) // 2]  # 途中で切れたJSON
+        return json.dumps({"feedback": {k: FEEDBACK_TEXT for k in keys[1:]}}, ensure_ascii=False)  # 1人抜け
+    return content
+
+def _multipart_field(body: bytes, name: str) -> Optional[str]:
+    m = re.search(rb'name="' + name.encode() + rb'"\r\n\r\n(.*?)\r\n--', body, re.S)
+    return m.group(1).decode("utf-8", "replace") if m else None
+
+def _handler(speechace: StubConfig, openai: StubConfig):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, *args):  # アクセスログは出さない
+            pass
+
+        def _send(self, status: int, payload: Dict[str, Any]):
+            body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_POST(self):
+            body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+            path = self.path.split("?")[0]
+            config = speechace if path == SPEECHACE_PATH else openai
+            delay, fail, seed = config.draw()
+            time.sleep(delay)
+            if fail:
+                self._send(500, {"error": {"message": "stub: injected error", "type": "server_error"}})
+            elif path == SPEECHACE_PATH:
+                self._send(200, speechace_response(_multipart_field(body, "text") or DEFAULT_TEXT, seed))
+            elif path.endswith("/audio/transcriptions"):
+                self._send(200, {"text": DEFAULT_TEXT})
+            elif path.endswith("/chat/completions"):
+                request = json.loads(body or b"{}")
+                messages = request.get("messages", [])
+                if (request.get("response_format") or {}).get("type") == "json_object":
+                    content = batch_feedback_content(messages, seed, openai.malformed_rate)
+                else:
+                    content = FEEDBACK_TEXT
+                self._send(200, {
+                    "id": "chatcmpl-stub", "object": "chat.completion", "created": int(time.time()), "model": "gpt-4o",
+                    "choices": [{"index": 0, "finish_reason": "stop",
+                                 "message": {"role": "assistant", "content": content}}],
+                    "usage": openai.usage(messages, content),
+                })
+            else:
+                self._send(404, {"error": {"message": f"stub: unknown path {path}"}})
+
+    return Handler
+
+class StubServers:
+    """127.0.0.1 の空きポートで Speechace / OpenAI のスタブを1つのサーバーとして起動する"""
+
+    def __init__(self, latency_ms: float = 0, jitter_ms: float = 0, error_rate: float = 0,
+                 openai_latency_ms: Optional[float] = None, seed: int = 0, malformed_rate: float = 0):
+        self.speechace = StubConfig(latency_ms, jitter_ms, error_rate, seed)
+        self.openai = StubConfig(latency_ms if openai_latency_ms is None else openai_latency_ms,
+                                 jitter_ms, error_rate, seed + 1, malformed_rate)
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), _handler(self.speechace, self.openai))
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+
+    @property
+    def base_url(self) -> str:
+        return f"http://127.0.0.1:{self._server.server_address[1]}"
+
+    @property
+    def speechace_url(self) -> str:
+        return self.base_url + SPEECHACE_PATH
+
+    @property
+    def openai_url(self) -> str:
+        return self.base_url + "/v1"
+
+    def __enter__(self) -> "StubServers":
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "speechace": {"requests": self.speechace.requests, "errors": self.speechace.errors},
+            "openai": {"requests": self.openai.requests, "errors": self.openai.errors, "tokens": dict(self.openai.tokens)},
+        }
@@ -0,0 +1,70 @@
+# synth_audio.py - ベンチマーク用の合成音声
+# 発話に近い長さ・振幅の「音節」（倍音付きの短いトーン）とポーズを並べたWAVを作る。
+# mp3 / m4a / webm への変換は pydub（ffmpeg）を使うので、ffmpeg がない環境では wav だけ作る。
+
+import wave
+from pathlib import Path
+from typing import List
+
+import numpy as np
+
+FORMATS = {
+    # 拡張子: (pydub の format, codec)
+    "wav": ("wav", None),
+    "mp3": ("mp3", None),
+    "m4a": ("mp4", "aac"),
+    "webm": ("webm", "libopus"),
+}
+
+def has_ffmpeg() -> bool:
+    from pydub.utils import which
+    return which("ffmpeg") is not None and which("ffprobe") is not None
+
+def available_formats(requested: List[str]) -> List[str]:
+    """要求された形式のうち、この環境で作れるもの"""
+    if has_ffmpeg():
+        return [f for f in requested if f in FORMATS]
+    return [f for f in requested if f == "wav"]
+
+def speech_like(seconds: float, sample_rate: int = 44100, seed: int = 0) -> np.ndarray:
+    """音節（120〜250Hzの基本周波数 + 倍音、150〜350ms）とポーズを並べた int16 のモノラル信号"""
+    rng = np.random.default_rng(seed)
+    n = int(seconds * sample_rate)
+    signal = np.zeros(n, dtype=np.float32)
+    pos = 0
+    while pos < n:
+        length = int(rng.uniform(0.15, 0.35) * sample_rate)
+        t = np.arange(min(length, n - pos)) / sample_rate
+        f0 = rng.uniform(120, 250)
+        tone = sum(np.sin(2 * np.pi * f0 * k * t) / k for k in range(1, 5))
+        envelope = np.sin(np.pi * np.linspace(0, 1, len(t))) ** 2
+        signal[pos:pos + len(t)] = tone * envelope * rng.uniform(0.3, 0.8)
+        pos += len(t) + int(rng.uniform(0.03, 0.4) * sample_rate)  # 音節間・文間のポーズ
+    signal += rng.normal(0, 0.01, n).astype(np.float32)  # 環境ノイズ
+    return (np.clip(signal / 2.5, -1, 1) * 32767).astype(np.int16)
+
+def write_wav(path: Path, samples: np.ndarray, sample_rate: int = 44100):
+    with wave.open(str(path), "wb") as w:
+        w.setnchannels(1)
+        w.setsampwidth(2)
+        w.setframerate(sample_rate)
+        w.writeframes(samples.tobytes())
+
+def make_corpus(out_dir: Path, lengths: List[float], formats: List[str], seed: int = 0) -> List[dict]:
+    """長さ × 形式の組み合わせで音声ファイルを作り、[{path, seconds, format}] を返す"""
+    from pydub import AudioSegment
+
+    out_dir.mkdir(parents=True, exist_ok=True)
+    corpus = []
+    for i, seconds in enumerate(lengths):
+        wav_path = out_dir / f"speech_{seconds:g}s.wav"
+        write_wav(wav_path, speech_like(seconds, seed=seed + i))
+        for fmt in formats:
+            if fmt == "wav":
+                path = wav_path
+            else:
+                path = out_dir / f"speech_{seconds:g}s.{fmt}"
+                pydub_format, codec = FORMATS[fmt]
+                AudioSegment.from_wav(wav_path).export(path, format=pydub_format, codec=codec)
+            corpus.append({"path": path, "seconds": seconds, "format": fmt})
+    return corpus
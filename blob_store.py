@@ -0,0 +1,63 @@
+# blob_store.py - 内容アドレス方式の音声置き場（複数ノードから読める共有ディレクトリ）
+# アップロードされた音声を SHA-256 の名前で ASSESSMENT_BLOB_DIR に置き、ジョブにはキーだけを渡す。
+# 同じ内容のファイルは1つしか保存されず、書き込みは一時ファイル → rename なので、
+# 他のノードが書きかけのファイルを読むことはない。
+#   <ASSESSMENT_BLOB_DIR>/ab/abcdef0123....mp3
+
+import hashlib
+import os
+import re
+import shutil
+import tempfile
+from pathlib import Path
+from typing import Optional
+
+BLOCK_SIZE = 1024 * 1024
+KEY_PATTERN = re.compile(r"^[0-9a-f]{64}(\.[0-9a-z]{1,5})?$")
+
+def blob_dir() -> Optional[Path]:
+    """共有の置き場所（未設定なら None。その場合アプリはローカルのパスをそのまま渡す）"""
+    d = os.getenv("ASSESSMENT_BLOB_DIR", "")
+    return Path(d) if d else None
+
+def _root(root: Optional[Path]) -> Path:
+    root = root or blob_dir()
+    if root is None:
+        raise ValueError("ASSESSMENT_BLOB_DIR が設定されていません")
+    return Path(root)
+
+def _hash(path: Path) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(BLOCK_SIZE), b""):
+            h.update(block)
+    return h.hexdigest()
+
+def put(src: Path, root: Optional[Path] = None) -> str:
+    """ファイルを置き場所にコピーしてキー（SHA-256 + 拡張子）を返す。同じ内容があればコピーしない"""
+    src = Path(src)
+    suffix = src.suffix.lower()
+    key = _hash(src) + (suffix if re.fullmatch(r"\.[0-9a-z]{1,5}", suffix) else "")
+    dest = _root(root) / key[:2] / key
+    if dest.exists():
+        return key
+    dest.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=dest.parent, prefix=".tmp_")
+    try:
+        with os.fdopen(fd, "wb") as out, open(src, "rb") as f:
+            shutil.copyfileobj(f, out, BLOCK_SIZE)
+        os.replace(tmp, dest)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.unlink(tmp)
+        raise
+    return key
+
+def path(key: str, root: Optional[Path] = None) -> Path:
+    """キーからファイルのパス（キーの形式が違う・ファイルがない場合は ValueError）"""
+    if not KEY_PATTERN.match(key):
+        raise ValueError(f"音声のキーが不正です: {key}")
+    p = _root(root) / key[:2] / key
+    if not p.exists():
+        raise ValueError(f"共有の置き場所に音声がありません: {key}")
+    return p
@@ -0,0 +1,17 @@
+# db_utils.py - SQLite 履歴DBの共通ヘルパー（Azure版 / Speechace版 共通）
+
+import sqlite3
+from typing import Dict, Any
+
+def ensure_columns(conn: sqlite3.Connection, table: str, columns: Dict[str, str]):
+    """既存DBに足りない列を追加する（CREATE TABLE IF NOT EXISTS では列が増えないため）"""
+    existing = {row[1] for row in conn.execute(f"PRAGMA table_info({table})")}
+    for name, col_type in columns.items():
+        if name not in existing:
+            conn.execute(f"ALTER TABLE {table} ADD COLUMN {name} {col_type}")
+
+def insert_row(conn: sqlite3.Connection, table: str, row: Dict[str, Any]):
+    """列名を指定して1行追加する"""
+    cols = ", ".join(row)
+    marks = ", ".join("?" for _ in row)
+    conn.execute(f"INSERT INTO {table} ({cols}) VALUES ({marks})", tuple(row.values()))
@@ -0,0 +1,522 @@
+# feedback.py - GPT-4o フィードバックのプロンプト・キャッシュ・トークン記録（Azure版 / Speechace版 共通）
+# プロンプトは
+#   system … 教員の役割・禁止事項・サンプルコメント・構成・発音の参考表・条件（毎回まったく同じ文字列）
+#   user   … 学生ごとの評価データだけ
+# の順に分ける。先頭が毎回同じなので、OpenAI 側のプロンプトキャッシュ（1024トークン以上の共通の先頭）が効き、
+# 2件目以降は system 部分の入力トークンが割引・高速化される。
+#
+# さらに、丸めたスコア・エラーの集合・レベル判定が同じ学生には、履歴DBの feedback_cache に保存した
+# 応答をそのまま返す（APIを呼ばない）。設定は class_config.json の feedback:
+#   "feedback": {"cache": true, "cache_step": 5}
+# 呼び出しごとに入力・キャッシュ済み・出力のトークン数を JSON 形式のログに1行出力する。
+#
+# local_feedback は API を使わずに、レベル判定・誤発音の単語と音素・発音の参考表から
+# サンプルのトーンのコメントを組み立てる（ネットワークなし・決定的）。
+#   "feedback": {"engine": "local", "gpt_tasks": ["中間", "期末"]}
+# にすると普段の練習はローカル、課題名に gpt_tasks のどれかを含む（成績を付ける）課題だけ GPT-4o を使う。
+# GPT-4o を使う設定でも、APIキーがない・API がエラーのときはローカルのコメントに FALLBACK_NOTE を付けて返す。
+
+import asyncio
+import hashlib
+import json
+import logging
+import re
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+from app_config import load_config
+
+logger = logging.getLogger(__name__)
+
+MODEL = "gpt-4o"
+PROMPT_VERSION = "fb1"  # SYSTEM_PROMPT を変えたら上げる（古いキャッシュを使わないため）
+DEFAULT_SETTINGS = {"cache": True, "cache_step": 5, "engine": "gpt", "gpt_tasks": []}
+
+# エンジンごとの評価データの項目（キャッシュのキーと【学生の評価データ】の両方に使う）
+SCORE_KEYS = {
+    "azure": ["accuracy", "fluency", "prosody", "completeness"],
+    "speechace": ["pronunciation", "fluency", "prosody"],
+}
+SCORE_LABELS = {
+    "azure": [("accuracy", "発音精度"), ("fluency", "流暢さ"), ("prosody", "プロソディ")],
+    "speechace": [("pronunciation", "発音"), ("fluency", "流暢さ")],
+}
+ERROR_LABELS = {
+    "azure": [("mispronounced_words", "誤発音単語"), ("phoneme_errors", "音素エラー")],
+    "speechace": [("problem_words", "問題のある単語")],
+}
+
+# 日本語話者によくある発音の課題（音素記号は Azure / Speechace の表記。プロンプトの参考表として使う）
+PHONEME_TIPS = [
+    (("r",), "/r/", "舌先をどこにも付けずに少し奥に引き、唇を軽く丸める。日本語のラ行にならないように"),
+    (("l",), "/l/", "舌先を上の歯ぐきにしっかり付けたまま声を出す。/r/ との区別を意識"),
+    (("th",), "/θ/", "舌先を上下の歯で軽くはさんで息を出す。/s/ にならないように"),
+    (("dh",), "/ð/", "/θ/ と同じ舌の位置で声を出す。the, this が /z/ や /d/ にならないように"),
+    (("v",), "/v/", "下唇に上の歯を軽く当てて声を出す。/b/ にならないように"),
+    (("f",), "/f/", "下唇に上の歯を当てて息を出す。日本語のフ（両唇）にならないように"),
+    (("w",), "/w/", "唇をしっかり丸めてから開く。wood, would の語頭を弱くしない"),
+    (("ae",), "/æ/", "口を横に開いて「エ」と「ア」の中間。cat, map を「キャット」にしない"),
+    (("ah", "ax"), "/ʌ/・/ə/", "口をあまり開けずに短く弱く。強勢のない母音は曖昧にしてリズムを作る"),
+    (("er", "axr"), "/ɝ/", "舌を奥に引いたまま「アー」。bird, work を「バード」「ワーク」にしない"),
+    (("iy", "ih"), "/iː/・/ɪ/", "長さと緊張で区別する。sheep と ship、leave と live"),
+    (("uw", "uh"), "/uː/・/ʊ/", "唇の丸めと長さで区別する。pool と pull"),
+    (("s", "sh"), "/s/・/ʃ/", "sea と she を区別する。/si/ が「シ」にならないように"),
+    (("z",), "/z/", "語末の s（is, was, plays）を濁らせる。「ズ」に母音を付けない"),
+    (("ng",), "/ŋ/", "語末の -ing で「グ」を付けない。鼻に抜けて終わる"),
+    (("t", "d", "k", "g", "p", "b"), "語末の子音", "語末の子音に母音を足さない（good が「グッド」にならないように）"),
+]
+RHYTHM_TIPS = [
+    "内容語（名詞・動詞・形容詞・副詞）を強く長く、機能語（冠詞・前置詞・代名詞）は弱く短く",
+    "意味のまとまり（句や節）ごとにポーズを置き、途中で区切らない",
+    "文末は平叙文なら下げ、Yes/No 疑問文なら上げる",
+    "単語と単語をつなげて読む（リンキング）。一語ずつ区切って読まない",
+    "スピードは一定にせず、大事な情報の前で少しゆっくりにする",
+]
+
+def _tips_text() -> str:
+    lines = [f"- {label}: {tip}" for _, label, tip in PHONEME_TIPS]
+    lines += [f"- リズム: {tip}" for tip in RHYTHM_TIPS]
+    return "\n".join(lines)
+
+SYSTEM_PROMPT = """あなたは日本の大学で英語を教える教員です。以下のサンプルのトーンを厳密に真似して、学生の音読・スピーキングへのフィードバックを書いてください。評価データは次のメッセージで渡します。
+
+【絶対禁止】
+- 「素晴らしい！」「頑張ってください！」「この調子で！」のような過度に褒める表現
+- 「！」の多用
+- 学生を持ち上げすぎる表現
+
+【サンプルコメント（このトーンを真似すること）】
+1. 「もう少しリズムを掴む練習をしましょう。発音よりも、先ずはそこ。リズム、どこでポーズするか、スピードの強弱（単に速く読めって感じではない）、イントネーションを掴むといい。単語の発音も重要なんだけれど、日本語的でもそこが抑えられていれば、伝わる感じになる。」
+
+2. 「なかなかいい方です。大幅に直すところは今のところないですが、次の段階にいきましょう。可能な範囲で読んでいる感をなくしていき、スピーチ原稿を確認しながら話しているような感じを目指して音読の練習をしてください。」
+
+3. 「基本は掴んでいて、まあまあいい方だと思います。もう少しスピードの強弱をつけること、リズムを意識してください。余裕があるようであれば、単語レベルでの発音、特に子音の音を明瞭にすることも意識すると質の向上につながります。」
+
+4. 「最初よりいいという気がしますが、つっかかてるところがあるので、そこはなるべく減らしていきましょう。」
+
+5. 「伸び代があんまりでそうにないけれど、ここからのレベルは、場数を踏んで質をあげていくという感じなので、この調子で練習してください。」
+
+【フィードバックの構成】
+1. 全体的な印象（サンプルのトーンで。「まあまあいい方」「もう少しリズムを」など率直に）
+2. 良かった箇所があれば軽く触れる（大げさに褒めない）
+3. 改善点：誤発音・問題のある単語や音素エラーを具体的に指摘（「〜の発音に注意。/r/の音を意識して」など）
+4. 練習のアドバイス（リズム、イントネーション、スピードの強弱、ポーズ位置など）
+
+【日本語話者によくある発音の課題（改善点を書くときの参考。該当するものだけ使う）】
+""" + _tips_text() + """
+
+【条件】
+- 300〜500字程度
+- サンプルのトーンを厳守（率直、実践的、過度に褒めない、「！」を使わない）
+- 「ですます調」と「だ・である調」混在OK
+- 評価データの「レベル判定」に合った内容にする"""
+
+def load_settings() -> Dict[str, Any]:
+    return {**DEFAULT_SETTINGS, **load_config().get("feedback", {})}
+
+# ============================================
+# プロンプト
+# ============================================
+
+def make_item(key: str, engine: str, task_type: str, level_hint: str, target_text: str, transcription: str,
+              scores: Dict[str, float], errors: Dict[str, str], total: Optional[float] = None) -> Dict[str, Any]:
+    """1人分のフィードバック依頼（errors は列名 → 「word(72点誤発音), ...」の文字列）"""
+    data_lines: List[Tuple[str, Any]] = [("目標テキスト", (target_text or "")[:300]), ("学生の発話", (transcription or "")[:300])]
+    data_lines += [(label, f"{scores[col]}/100") for col, label in SCORE_LABELS[engine]]
+    data_lines += [(label, errors.get(col, "")) for col, label in ERROR_LABELS[engine]]
+    data_lines.append(("レベル判定", level_hint))
+    return {
+        "key": key,
+        "engine": engine,
+        "task_type": task_type,
+        "level_hint": level_hint,
+        "scores": {k: scores[k] for k in SCORE_KEYS[engine] if k in scores},
+        "errors": [e for col, _ in ERROR_LABELS[engine] for e in split_errors(errors.get(col, ""))],
+        "data_lines": data_lines,
+        "raw_errors": {col: errors.get(col, "") for col, _ in ERROR_LABELS[engine]},
+        "total": total,
+    }
+
+def user_prompt(data_lines: List[Tuple[str, Any]]) -> str:
+    """学生ごとに変わる部分（【学生の評価データ】）"""
+    return "【学生の評価データ】\n" + "\n".join(f"- {label}: {value}" for label, value in data_lines)
+
+def build_messages(data_lines: List[Tuple[str, Any]]) -> List[Dict[str, str]]:
+    return [
+        {"role": "system", "content": SYSTEM_PROMPT},
+        {"role": "user", "content": user_prompt(data_lines)},
+    ]
+
+def estimate_tokens(text: str) -> int:
+    """トークン数の目安（日本語は1文字 ≒ 1トークン、英語は4文字 ≒ 1トークン → UTF-8 で3バイト ≒ 1トークン）"""
+    return max(1, len(text.encode("utf-8")) // 3)
+
+# ============================================
+# 応答キャッシュ
+# ============================================
+
+def split_errors(text: str) -> List[str]:
+    """「word(72点誤発音), /r/(word内, 40点)」からスコアを除いた項目（word誤発音, /r/word内）を取り出す"""
+    return [name + re.sub(r"\d+点|[,\s]", "", inside) for name, inside in re.findall(r"([^,\s(]+)\(([^)]*)\)", text or "")]
+
+def cache_key(engine: str, task_type: str, scores: Dict[str, float], errors: Iterable[str],
+              level_hint: str, step: float) -> str:
+    """PROMPT_VERSION・エンジン・課題タイプ・丸めたスコア・エラーの集合・レベル判定から作るキー"""
+    rounded = {k: int(round(float(v) / step) * step) for k, v in sorted(scores.items())}
+    body = json.dumps([PROMPT_VERSION, MODEL, engine, task_type, rounded, sorted(set(errors)), level_hint],
+                      ensure_ascii=False)
+    return hashlib.sha256(body.encode("utf-8")).hexdigest()
+
+def init_table(conn: sqlite3.Connection):
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS feedback_cache (
+            key TEXT PRIMARY KEY,
+            feedback TEXT NOT NULL,
+            model TEXT,
+            created_at TEXT,
+            hits INTEGER NOT NULL DEFAULT 0
+        )
+    ''')
+
+def cache_get(db_path: str, key: str) -> Optional[str]:
+    conn = sqlite3.connect(db_path)
+    try:
+        row = conn.execute("SELECT feedback FROM feedback_cache WHERE key = ?", (key,)).fetchone()
+        if row:
+            conn.execute("UPDATE feedback_cache SET hits = hits + 1 WHERE key = ?", (key,))
+            conn.commit()
+        return row[0] if row else None
+    finally:
+        conn.close()
+
+def cache_put(db_path: str, key: str, text: str):
+    conn = sqlite3.connect(db_path)
+    try:
+        conn.execute("INSERT OR REPLACE INTO feedback_cache (key, feedback, model, created_at) VALUES (?,?,?,?)",
+                     (key, text, MODEL, datetime.now().strftime("%Y-%m-%d %H:%M:%S")))
+        conn.commit()
+    finally:
+        conn.close()
+
+# ============================================
+# 呼び出し
+# ============================================
+
+def log_usage(engine: str, usage: Any, ms: float, cache_hit: bool = False, students: int = 1):
+    """1回分のトークン数を JSON 形式で1行ログに出す（usage は OpenAI の応答の usage）"""
+    details = getattr(usage, "prompt_tokens_details", None) if usage else None
+    logger.info(json.dumps({
+        "event": "feedback_tokens",
+        "engine": engine,
+        "model": MODEL,
+        "students": students,
+        "cache_hit": cache_hit,
+        "prompt_tokens": getattr(usage, "prompt_tokens", 0) if usage else 0,
+        "cached_tokens": (getattr(details, "cached_tokens", 0) or 0) if details else 0,
+        "completion_tokens": getattr(usage, "completion_tokens", 0) if usage else 0,
+        "ms": round(ms, 1),
+    }, ensure_ascii=False))
+
+def _key(item: Dict[str, Any], settings: Dict[str, Any]) -> Optional[str]:
+    if not settings["cache"]:
+        return None
+    return cache_key(item["engine"], item["task_type"], item["scores"], item["errors"], item["level_hint"],
+                     settings["cache_step"])
+
+def _request(client, item: Dict[str, Any]) -> str:
+    t0 = time.perf_counter()
+    res = client.chat.completions.create(
+        model=MODEL,
+        temperature=0.7,
+        max_tokens=1000,
+        messages=build_messages(item["data_lines"]),
+    )
+    log_usage(item["engine"], res.usage, (time.perf_counter() - t0) * 1000)
+    return res.choices[0].message.content.strip()
+
+def generate(client, db_path: str, item: Dict[str, Any]) -> str:
+    """キャッシュになければ GPT-4o を呼ぶ。失敗時は例外（呼び出し側でメッセージにする）"""
+    settings = load_settings()
+    key = _key(item, settings)
+    if key:
+        cached = cache_get(db_path, key)
+        if cached is not None:
+            log_usage(item["engine"], None, 0.0, cache_hit=True)
+            return cached
+    text = _request(client, item)
+    if key:
+        cache_put(db_path, key, text)
+    return text
+
+async def _request_async(client, item: Dict[str, Any]) -> str:
+    t0 = time.perf_counter()
+    res = await client.chat.completions.create(
+        model=MODEL,
+        temperature=0.7,
+        max_tokens=1000,
+        messages=build_messages(item["data_lines"]),
+    )
+    log_usage(item["engine"], res.usage, (time.perf_counter() - t0) * 1000)
+    return res.choices[0].message.content.strip()
+
+async def generate_async(client, db_path: str, item: Dict[str, Any]) -> str:
+    """generate の非同期版（AsyncOpenAI を渡し、async_engine の共有ループで待つ）
+
+    キャッシュの読み書き（sqlite3）は別スレッドで行う。DB がロックされていても共有ループの
+    ほかの処理（チャンクの評価など）を止めないため。
+    """
+    settings = load_settings()
+    key = _key(item, settings)
+    if key:
+        cached = await asyncio.to_thread(cache_get, db_path, key)
+        if cached is not None:
+            log_usage(item["engine"], None, 0.0, cache_hit=True)
+            return cached
+    text = await _request_async(client, item)
+    if key:
+        await asyncio.to_thread(cache_put, db_path, key, text)
+    return text
+
+# ============================================
+# まとめて生成（一括処理用）
+# ============================================
+# N人分の評価データを1回のリクエストに詰め、学生の key ごとの JSON で受け取る。
+# 先頭の SYSTEM_PROMPT は1人ずつの場合と同じなので、プロンプトキャッシュも共有される。
+# JSON が壊れていた・足りない学生がいた場合は、その学生だけ1人ずつのリクエストでやり直す。
+
+BATCH_INSTRUCTIONS = """これから複数の学生の評価データを JSON で渡します。学生ごとに、上の構成と条件どおりのフィードバックを別々に書いてください。
+他の学生と比較する表現は使わないこと。
+出力は次の形の JSON だけにすること（key は渡された key をそのまま使い、全員分を含める）:
+{"feedback": {"<key>": "<フィードバック本文>", ...}}"""
+COMPLETION_TOKENS_PER_STUDENT = 800  # 300〜500字 + JSON の分
+
+class TokenBudget:
+    """送信中のリクエストの見積もりトークン数（入力 + 出力の上限）の合計を limit 以下に保つ"""
+
+    def __init__(self, limit: int):
+        self.limit = limit
+        self.used = 0
+        self.cond = threading.Condition()
+
+    @contextmanager
+    def reserve(self, tokens: int):
+        with self.cond:
+            # 1件で上限を超える場合も、他に送信中がなければ通す
+            while self.used and self.used + tokens > self.limit:
+                self.cond.wait()
+            self.used += tokens
+        try:
+            yield
+        finally:
+            with self.cond:
+                self.used -= tokens
+                self.cond.notify_all()
+
+def batch_messages(items: List[Dict[str, Any]]) -> List[Dict[str, str]]:
+    students = [{"key": item["key"], "data": {label: value for label, value in item["data_lines"]}} for item in items]
+    return [
+        {"role": "system", "content": SYSTEM_PROMPT},
+        {"role": "system", "content": BATCH_INSTRUCTIONS},
+        {"role": "user", "content": json.dumps({"students": students}, ensure_ascii=False)},
+    ]
+
+def _request_batch(client, items: List[Dict[str, Any]]) -> Dict[str, str]:
+    """1回のリクエストで items 全員分を生成する。読めた学生の分だけ返す"""
+    t0 = time.perf_counter()
+    res = client.chat.completions.create(
+        model=MODEL,
+        temperature=0.7,
+        max_tokens=COMPLETION_TOKENS_PER_STUDENT * len(items),
+        response_format={"type": "json_object"},
+        messages=batch_messages(items),
+    )
+    log_usage(items[0]["engine"], res.usage, (time.perf_counter() - t0) * 1000, students=len(items))
+    try:
+        texts = json.loads(res.choices[0].message.content)["feedback"]
+    except (TypeError, ValueError, KeyError):
+        logger.warning("まとめて生成した応答を JSON として読めませんでした（%d人分を1人ずつやり直します）", len(items))
+        return {}
+    if not isinstance(texts, dict):
+        return {}
+    keys = {item["key"] for item in items}
+    return {k: v.strip() for k, v in texts.items() if k in keys and isinstance(v, str) and v.strip()}
+
+def generate_batch(client, db_path: str, items: List[Dict[str, Any]], batch_size: int = 5,
+                   max_workers: int = 4, token_budget: int = 60000,
+                   on_done: Optional[Callable[[Dict[str, str]], None]] = None) -> Dict[str, str]:
+    """items（make_item の key は一意にする）のフィードバックを key → 本文 で返す
+
+    キャッシュにある学生は API を呼ばない。残りを batch_size 人ずつ max_workers 並列で送り、
+    送信中の見積もりトークン数が token_budget を超えないように待つ。
+    失敗した学生は「（フィードバック生成エラー: ...）」になる。on_done はまとまりごとに呼ばれる。
+    """
+    settings = load_settings()
+    results: Dict[str, str] = {}
+    pending = []
+    for item in items:
+        key = _key(item, settings)
+        cached = cache_get(db_path, key) if key else None
+        if cached is not None:
+            log_usage(item["engine"], None, 0.0, cache_hit=True)
+            results[item["key"]] = cached
+        else:
+            pending.append(item)
+    if results and on_done:
+        on_done(dict(results))
+
+    budget = TokenBudget(token_budget)
+    lock = threading.Lock()
+
+    def run(batch: List[Dict[str, Any]]) -> Dict[str, str]:
+        tokens = sum(estimate_tokens(m["content"]) for m in batch_messages(batch)) + COMPLETION_TOKENS_PER_STUDENT * len(batch)
+        with budget.reserve(tokens):
+            try:
+                texts = _request_batch(client, batch) if len(batch) > 1 else {}
+            except Exception as e:
+                logger.warning("まとめて生成できませんでした（%s）。1人ずつやり直します", e)
+                texts = {}
+            failed = set()
+            for item in batch:
+                if item["key"] in texts:
+                    continue
+                try:
+                    texts[item["key"]] = _request(client, item)
+                except Exception as e:
+                    texts[item["key"]] = f"（フィードバック生成エラー: {str(e)}）"
+                    failed.add(item["key"])
+        for item in batch:
+            key = _key(item, settings)
+            if key and item["key"] not in failed:
+                cache_put(db_path, key, texts[item["key"]])
+        if on_done:
+            with lock:
+                on_done(texts)
+        return texts
+
+    batches = [pending[i:i + batch_size] for i in range(0, len(pending), max(1, batch_size))]
+    with ThreadPoolExecutor(max_workers=max(1, max_workers)) as pool:
+        for texts in pool.map(run, batches):
+            results.update(texts)
+    return results
+
+# ============================================
+# ローカルのテンプレート生成（APIを使わない）
+# ============================================
+
+FALLBACK_NOTE = "\n\n（AIフィードバックを生成できなかったため、評価データから作った簡易コメントです）"
+
+# 総合点ごとの書き出し（サンプルコメントのトーン）。同じ点数帯の学生でも文面が揃いすぎないように2通りずつ
+OPENINGS = [
+    (85, ["なかなかいい方です。大幅に直すところは今のところないですが、次の段階にいきましょう。",
+          "全体的によく読めています。ここからは読んでいる感をなくしていく段階です。"]),
+    (70, ["基本は掴んでいて、まあまあいい方だと思います。",
+          "まあまあいい方です。伝わる読み方にはなっているので、あとは質を上げていきましょう。"]),
+    (55, ["基本は掴んでいますが、まだ日本語的なリズムが残っています。",
+          "大まかには読めていますが、つっかかるところがあるので、そこはなるべく減らしていきましょう。"]),
+    (None, ["もう少しリズムを掴む練習をしましょう。発音よりも、先ずはそこ。",
+            "まずはリズムとポーズの位置を掴むところから始めましょう。単語の発音はその後で十分です。"]),
+]
+# いちばん低い観点ごとの練習のアドバイス
+WEAK_POINT_ADVICE = {
+    "accuracy": "単語レベルでの発音、特に子音の音を明瞭にすることを意識すると質の向上につながります。",
+    "pronunciation": "単語レベルでの発音、特に子音の音を明瞭にすることを意識すると質の向上につながります。",
+    "fluency": "途中で止まったり言い直したりするところを減らしましょう。" + RHYTHM_TIPS[1] + "。",
+    "prosody": "スピードの強弱とイントネーションを意識してください。" + RHYTHM_TIPS[0] + "。",
+    "completeness": "読み飛ばしている箇所があるので、目標テキストを最後まで通して読む練習をしてください。",
+}
+# 音素のデータがない単語（Speechace版の問題のある単語）は綴りから当たりを付ける
+SPELLING_RULES = [
+    (r"th", "th"), (r"v", "v"), (r"f|ph", "f"), (r"^wh?", "w"), (r"r", "r"), (r"l", "l"),
+    (r"ing$", "ng"), (r"er$|ir|ur|or$", "er"), (r"[bdgkpt]$", "t"), (r"s$", "z"), (r"sh|si|ci", "sh"),
+]
+_WORD_ERROR = re.compile(r"([A-Za-z'\-]+)\((\d+)点[^)]*\)")
+_PHONEME_ERROR = re.compile(r"/([a-z]+)/\(([^,()]+)内, (\d+)点\)")
+
+def choose_engine(task_name: str = "", settings: Optional[Dict[str, Any]] = None) -> str:
+    """"gpt" または "local"（課題名に gpt_tasks のどれかを含む課題は常に GPT-4o）"""
+    settings = settings or load_settings()
+    if any(name and name in (task_name or "") for name in settings["gpt_tasks"]):
+        return "gpt"
+    return "local" if settings["engine"] == "local" else "gpt"
+
+def _tip(phone: str) -> Optional[Tuple[str, str]]:
+    for keys, label, tip in PHONEME_TIPS:
+        if phone in keys:
+            return label, tip
+    return None
+
+def _problem_sounds(raw_errors: Dict[str, str], limit: int = 2) -> List[Tuple[str, List[str], str]]:
+    """点数の低い順に (音の表記, 単語, コツ) を limit 件。音素のエラーを優先し、なければ単語の綴りから"""
+    found: List[Tuple[int, str, str]] = []  # (点数, 音素記号, 単語)
+    for text in raw_errors.values():
+        for phone, word, score in _PHONEME_ERROR.findall(text or ""):
+            found.append((int(score), phone, word.strip()))
+    if not found:
+        for text in raw_errors.values():
+            for word, score in _WORD_ERROR.findall(text or ""):
+                for pattern, phone in SPELLING_RULES:
+                    if re.search(pattern, word.lower()):
+                        found.append((int(score), phone, word))
+                        break
+    sounds: Dict[str, Tuple[str, List[str], str]] = {}
+    for _, phone, word in sorted(found):
+        tip = _tip(phone)
+        if tip is None:
+            continue
+        label, text = tip
+        if label not in sounds:
+            if len(sounds) >= limit:
+                continue
+            sounds[label] = (label, [], text)
+        if word not in sounds[label][1] and len(sounds[label][1]) < 3:
+            sounds[label][1].append(word)
+    return list(sounds.values())
+
+def _problem_words(raw_errors: Dict[str, str], limit: int = 3) -> List[str]:
+    words = []
+    for text in raw_errors.values():
+        words += [(int(score), word) for word, score in _WORD_ERROR.findall(text or "")]
+    out: List[str] = []
+    for _, word in sorted(words):
+        if word not in out:
+            out.append(word)
+    return out[:limit]
+
+def local_feedback(item: Dict[str, Any]) -> str:
+    """make_item の依頼から、API を使わずにフィードバックを組み立てる（同じ入力なら同じ文面）"""
+    scores = {k: float(v) for k, v in item["scores"].items() if k != "completeness" or v < 90}
+    total = item.get("total")
+    if total is None:
+        total = sum(item["scores"].values()) / max(1, len(item["scores"]))
+    seed = int(hashlib.md5(json.dumps(item["errors"], ensure_ascii=False).encode("utf-8")).hexdigest(), 16)
+    variants = next(v for cutoff, v in OPENINGS if cutoff is None or total >= cutoff)
+    parts = [variants[seed % len(variants)]]
+
+    labels = dict(SCORE_LABELS[item["engine"]])
+    shown = {k: v for k, v in item["scores"].items() if k in labels}
+    if shown:
+        best = max(shown, key=shown.get)
+        if shown[best] >= 70:
+            parts.append(f"{labels[best]}は比較的安定しています。")
+
+    words = _problem_words(item["raw_errors"])
+    if words:
+        parts.append(f"{', '.join(words)} の発音に注意してください。")
+    for label, sound_words, tip in _problem_sounds(item["raw_errors"]):
+        parts.append(f"{label}（{', '.join(sound_words)}）は、{tip}。")
+
+    if scores:
+        weakest = min(scores, key=scores.get)
+        parts.append(WEAK_POINT_ADVICE[weakest])
+    parts.append(item["level_hint"])
+    return "".join(parts)
+
+def fallback(item: Dict[str, Any], reason: str) -> str:
+    """GPT-4o が使えないときの代わり（ローカルのコメント + FALLBACK_NOTE）"""
+    logger.warning("AIフィードバックの代わりにローカルのコメントを返します（%s）", reason)
+    return local_feedback(item) + FALLBACK_NOTE
@@ -0,0 +1,115 @@
+# live_progress.py - 評価の途中経過（チャンクの進み具合・途中の平均スコア・問題のある単語）を画面に少しずつ出す
+# 長い音声の Speechace 評価は40秒ごとのチャンクを並列に評価するが、これまでは全部終わるまで
+# st.spinner("評価中...") しか出ず、どこまで進んだか、止まっているチャンクがあるかが分からなかった。
+# 評価の処理は途中経過をここに記録し、画面側は st.empty() のプレースホルダーに描き直す。
+#
+#   tracker = live_progress.start(render)     # 評価ボタンの処理ごとに1回（timing.start() の後）
+#   tracker.set_chunks(n)                     # チャンク数が決まったとき
+#   tracker.chunk_started(i) / tracker.chunk_done(i, segments, problem_words)   # 無音などで省いたら skipped=True
+#   async_engine.run(coro, poll=live_progress.flush)   # 待っている間も経過秒数を描き直す
+#
+# 段階（ダウンロード・変換・発音評価API・GPT-4o など）は timing の span() の開始で自動的に切り替わる。
+# Streamlit の要素は画面のスレッドからしか更新できないので、イベントループなど他のスレッドからの記録は
+# 溜めておき、画面のスレッドで flush() したときにまとめて描く。start() していなければ記録するだけ
+# （評価サーバーのワーカーなど、画面がない場合）。
+
+import threading
+import time
+from contextvars import ContextVar
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+import timing
+
+SLOW_SECONDS = 30  # これより長く返ってこないチャンクは画面で目立たせる
+
+class Progress:
+    """1回の評価の途中経過。記録はどのスレッドからでもよく、on_update は start() したスレッドでだけ呼ぶ"""
+
+    def __init__(self, on_update: Optional[Callable[[Dict[str, Any]], None]] = None):
+        self.on_update = on_update
+        self.owner = threading.get_ident()
+        self.lock = threading.Lock()
+        self.started = time.perf_counter()
+        self.stage_name = ""
+        self.total = 0
+        self.running: Dict[int, float] = {}     # チャンク番号 → 評価を始めた時刻
+        self.errors: Dict[int, str] = {}        # チャンク番号 → エラー
+        self.skipped = 0                        # 評価するものがなく省いたチャンク（失敗には数えない）
+        self.done = 0
+        self.sums: Dict[str, float] = {}
+        self.counts: Dict[str, int] = {}
+        self.words: Dict[int, List[str]] = {}   # チャンク番号 → 問題のある単語（チャンクの順に並べて出す）
+
+    def stage(self, name: str):
+        with self.lock:
+            self.stage_name = name
+        self.flush()
+
+    def set_chunks(self, total: int):
+        with self.lock:
+            self.total = total
+        self.flush()
+
+    def chunk_started(self, index: int):
+        with self.lock:
+            self.running[index] = time.perf_counter()
+        self.flush()
+
+    def chunk_done(self, index: int, segments: Sequence[Dict[str, float]] = (),
+                   problem_words: Sequence[str] = (), error: str = "", skipped: bool = False):
+        """チャンク1つ分の結果。segments の各スコアを途中の平均に加える"""
+        with self.lock:
+            self.running.pop(index, None)
+            self.done += 1
+            if error:
+                self.errors[index] = error
+            elif skipped:
+                self.skipped += 1
+            for seg in segments:
+                for key, value in seg.items():
+                    self.sums[key] = self.sums.get(key, 0.0) + value
+                    self.counts[key] = self.counts.get(key, 0) + 1
+            self.words[index] = list(problem_words)
+        self.flush()
+
+    def snapshot(self) -> Dict[str, Any]:
+        now = time.perf_counter()
+        with self.lock:
+            return {
+                "stage": self.stage_name,
+                "stage_label": timing.STAGE_LABELS.get(self.stage_name, self.stage_name),
+                "elapsed": now - self.started,
+                "total": self.total,
+                "done": self.done,
+                "failed": len(self.errors),
+                "skipped": self.skipped,
+                "averages": {key: round(self.sums[key] / self.counts[key], 1) for key in self.sums},
+                "problem_words": [w for i in sorted(self.words) for w in self.words[i]],
+                "running": [(i, now - t) for i, t in sorted(self.running.items())],
+            }
+
+    def flush(self):
+        """start() したスレッドなら画面を描き直す（それ以外のスレッドでは何もしない）"""
+        if self.on_update and threading.get_ident() == self.owner:
+            self.on_update(self.snapshot())
+
+_current: ContextVar[Optional[Progress]] = ContextVar("live_progress", default=None)
+
+def start(on_update: Optional[Callable[[Dict[str, Any]], None]] = None) -> Progress:
+    """新しい途中経過を始め、計測中の timing の段階の切り替わりも受け取る"""
+    progress = Progress(on_update)
+    timings = timing.current()
+    progress.started = timings.started  # 経過秒数はダウンロードから通しで数える
+    _current.set(progress)
+    timings.on_stage = progress.stage
+    progress.flush()
+    return progress
+
+def current() -> Progress:
+    """記録中の Progress。start() されていなければ記録するだけの使い捨て（評価サーバーのワーカーなど）"""
+    return _current.get() or Progress()
+
+def flush():
+    progress = _current.get()
+    if progress:
+        progress.flush()
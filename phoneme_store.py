@@ -0,0 +1,194 @@
+# phoneme_store.py - 単語・音素スコアの正規化テーブル（Azure版 / Speechace版 共通）
+# mispronounced_words / phoneme_errors の文字列を正規表現で解析しなくても、
+# 「クラスXはどの音素が苦手か」をインデックス付きの集計クエリで取得できるようにする。
+
+import sqlite3
+from typing import Any, Dict, List, Optional
+
+import pandas as pd
+
+import raw_store
+
+def init_tables(conn: sqlite3.Connection):
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS word_scores (
+            assessment_id TEXT NOT NULL,
+            class_group TEXT,
+            word_index INTEGER,
+            word TEXT,
+            offset_ms INTEGER,
+            duration_ms INTEGER,
+            accuracy REAL,
+            error_type TEXT
+        )
+    ''')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS phoneme_scores (
+            assessment_id TEXT NOT NULL,
+            class_group TEXT,
+            word_index INTEGER,
+            phoneme_index INTEGER,
+            phoneme TEXT,
+            word TEXT,
+            offset_ms INTEGER,
+            duration_ms INTEGER,
+            accuracy REAL
+        )
+    ''')
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_word_scores_assessment ON word_scores (assessment_id)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_word_scores_class_word ON word_scores (class_group, word, accuracy)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_phoneme_scores_assessment ON phoneme_scores (assessment_id)")
+    # クラス×音素の集計がインデックスだけで完結するように accuracy まで含める
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_phoneme_scores_class_phoneme ON phoneme_scores (class_group, phoneme, accuracy)")
+    conn.execute('''
+        CREATE TRIGGER IF NOT EXISTS word_scores_cleanup AFTER DELETE ON assessments
+        BEGIN
+            DELETE FROM word_scores WHERE assessment_id = old.id;
+            DELETE FROM phoneme_scores WHERE assessment_id = old.id;
+        END
+    ''')
+
+# ============================================
+# エンジンの生レスポンス → 単語・音素リスト
+# ============================================
+
+def _ticks_to_ms(ticks) -> Optional[int]:
+    """Azureの Offset/Duration（100ナノ秒単位）をミリ秒に変換"""
+    return int(ticks) // 10000 if ticks is not None else None
+
+def azure_words(raw: Dict) -> List[Dict[str, Any]]:
+    """Azureの NBest JSON から単語・音素スコアを取り出す"""
+    words = []
+    for w in raw.get("NBest", [{}])[0].get("Words", []):
+        pa = w.get("PronunciationAssessment", {})
+        phonemes = []
+        for ph in w.get("Phonemes", []):
+            phonemes.append({
+                "phoneme": ph.get("Phoneme", ""),
+                "offset_ms": _ticks_to_ms(ph.get("Offset")),
+                "duration_ms": _ticks_to_ms(ph.get("Duration")),
+                "accuracy": ph.get("PronunciationAssessment", {}).get("AccuracyScore", 100),
+            })
+        words.append({
+            "word": w.get("Word", ""),
+            "offset_ms": _ticks_to_ms(w.get("Offset")),
+            "duration_ms": _ticks_to_ms(w.get("Duration")),
+            "accuracy": pa.get("AccuracyScore", 100),
+            "error_type": pa.get("ErrorType", "None"),
+            "phonemes": phonemes,
+        })
+    return words
+
+def speechace_words(raw: Dict, problem_threshold: float = 70) -> List[Dict[str, Any]]:
+    """Speechace のチャンク別レスポンスから単語・音素スコアを取り出す
+
+    extent は10ミリ秒単位のチャンク内位置なので、チャンクの開始位置を足して録音全体の位置にする
+    （chunk_offsets_ms があればそれを、なければ chunk_seconds ごとの位置を使う）。
+    """
+    words = []
+    chunk_ms = raw.get("chunk_seconds", 40) * 1000
+    offsets = raw.get("chunk_offsets_ms")  # 静かな位置で区切った場合のチャンクの開始位置
+    for i, res in enumerate(raw.get("chunks", [])):
+        if res.get("status") != "success":
+            continue
+        base_ms = offsets[i] if offsets else i * chunk_ms
+        for ws in res.get("text_score", {}).get("word_score_list", []):
+            phonemes = []
+            for ph in ws.get("phone_score_list", []):
+                extent = ph.get("extent") or [None, None]
+                start = base_ms + extent[0] * 10 if extent[0] is not None else None
+                phonemes.append({
+                    "phoneme": ph.get("phone", ""),
+                    "offset_ms": start,
+                    "duration_ms": (extent[1] - extent[0]) * 10 if extent[1] is not None and extent[0] is not None else None,
+                    "accuracy": ph.get("quality_score", 100),
+                })
+            starts = [p["offset_ms"] for p in phonemes if p["offset_ms"] is not None]
+            ends = [p["offset_ms"] + p["duration_ms"] for p in phonemes
+                    if p["offset_ms"] is not None and p["duration_ms"] is not None]
+            quality = ws.get("quality_score", 100)
+            words.append({
+                "word": ws.get("word", ""),
+                "offset_ms": min(starts) if starts else None,
+                "duration_ms": max(ends) - min(starts) if starts and ends else None,
+                "accuracy": quality,
+                "error_type": "Mispronunciation" if quality < problem_threshold else "None",
+                "phonemes": phonemes,
+            })
+    return words
+
+def words_from_raw(engine: str, raw: Dict) -> List[Dict[str, Any]]:
+    return azure_words(raw) if engine == "azure" else speechace_words(raw)
+
+# ============================================
+# 保存
+# ============================================
+
+def save_scores(conn: sqlite3.Connection, assessment_id: str, class_group: str, words: List[Dict[str, Any]]):
+    """save_assessment と同じトランザクション内で呼ぶ"""
+    word_rows = []
+    phoneme_rows = []
+    for wi, w in enumerate(words):
+        word_rows.append((assessment_id, class_group, wi, w["word"], w["offset_ms"], w["duration_ms"],
+                          w["accuracy"], w["error_type"]))
+        for pi, ph in enumerate(w["phonemes"]):
+            phoneme_rows.append((assessment_id, class_group, wi, pi, ph["phoneme"], w["word"],
+                                 ph["offset_ms"], ph["duration_ms"], ph["accuracy"]))
+    conn.executemany("INSERT INTO word_scores VALUES (?,?,?,?,?,?,?,?)", word_rows)
+    conn.executemany("INSERT INTO phoneme_scores VALUES (?,?,?,?,?,?,?,?,?)", phoneme_rows)
+
+def rebuild_from_raw(db_path: str, engine: str) -> int:
+    """assessment_raw に保存済みの生データから単語・音素テーブルを作り直す（APIは呼ばない）"""
+    conn = sqlite3.connect(db_path)
+    try:
+        classes = dict(conn.execute("SELECT id, class_group FROM assessments").fetchall())
+        with conn:
+            conn.execute("DELETE FROM word_scores")
+            conn.execute("DELETE FROM phoneme_scores")
+            count = 0
+            for rec in raw_store.iter_raw_conn(conn, engine):
+                if rec.assessment_id in classes:
+                    save_scores(conn, rec.assessment_id, classes[rec.assessment_id], words_from_raw(engine, rec.data))
+                    count += 1
+        return count
+    finally:
+        conn.close()
+
+# ============================================
+# 集計クエリ
+# ============================================
+
+def class_phoneme_stats(db_path: str, error_threshold: float = 60, min_count: int = 5) -> pd.DataFrame:
+    """クラス×音素ごとの件数・平均スコア・エラー率（accuracy < error_threshold の割合）"""
+    conn = sqlite3.connect(db_path)
+    df = pd.read_sql_query('''
+        SELECT class_group AS クラス, phoneme AS 音素,
+               COUNT(*) AS 件数,
+               ROUND(AVG(accuracy), 1) AS 平均スコア,
+               ROUND(100.0 * SUM(accuracy < ?) / COUNT(*), 1) AS エラー率
+        FROM phoneme_scores
+        WHERE class_group != '' AND phoneme != ''
+        GROUP BY class_group, phoneme
+        HAVING COUNT(*) >= ?
+    ''', conn, params=(error_threshold, min_count))
+    conn.close()
+    return df
+
+def class_problem_words(db_path: str, class_group: str, error_threshold: float = 70,
+                        limit: int = 20) -> pd.DataFrame:
+    """クラス内でスコアが低くなりやすい単語"""
+    conn = sqlite3.connect(db_path)
+    df = pd.read_sql_query('''
+        SELECT LOWER(word) AS 単語,
+               COUNT(*) AS 件数,
+               ROUND(AVG(accuracy), 1) AS 平均スコア,
+               SUM(accuracy < ?) AS 低スコア回数
+        FROM word_scores
+        WHERE class_group = ?
+        GROUP BY LOWER(word)
+        HAVING SUM(accuracy < ?) > 0
+        ORDER BY 低スコア回数 DESC, 平均スコア ASC
+        LIMIT ?
+    ''', conn, params=(error_threshold, class_group, error_threshold, limit))
+    conn.close()
+    return df
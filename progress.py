@@ -0,0 +1,197 @@
+# progress.py - 学生ごとの進捗サマリー（student_progress）
+# save_assessment のトランザクション内で件数・合計・二乗和・最小・最大・初回/最新値を差分更新するので、
+# 進捗ダッシュボードは履歴全体を走査せず、学生数に比例する行だけ読めばよい。
+# 履歴が MAX_HISTORY やアーカイブで削除されてもサマリーは減らさない（初回からの通算）。
+# 再採点も rebuild() ではなく rescore() で、残っている評価の値だけを差し替える（削除済みの分の件数は残る）。
+
+import math
+import sqlite3
+from typing import Any, Dict, List, Optional, Tuple
+
+import pandas as pd
+
+ALL_TASKS = "*"  # 課題タイプを問わない通算の行
+
+DIMENSION_LABELS = {
+    "total_score": "総合",
+    "accuracy": "発音精度",
+    "pronunciation": "発音",
+    "fluency": "流暢さ",
+    "prosody": "プロソディ",
+    "completeness": "完全性",
+}
+
+def init_table(conn: sqlite3.Connection, dimensions: List[str]):
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS student_progress (
+            student_id TEXT NOT NULL,
+            task_type TEXT NOT NULL,
+            dimension TEXT NOT NULL,
+            student_name TEXT,
+            class_group TEXT,
+            n INTEGER NOT NULL,
+            total REAL NOT NULL,
+            total_sq REAL NOT NULL,
+            total_xy REAL NOT NULL,
+            min_value REAL,
+            max_value REAL,
+            first_value REAL,
+            first_at TEXT,
+            last_value REAL,
+            last_at TEXT,
+            PRIMARY KEY (student_id, task_type, dimension)
+        )
+    ''')
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_student_progress_class ON student_progress (class_group, dimension, task_type)")
+    # この機能より前の履歴から作る
+    if conn.execute("SELECT COUNT(*) FROM student_progress").fetchone()[0] == 0:
+        rebuild(conn, dimensions)
+
+def update(conn: sqlite3.Connection, data: Dict[str, Any], dimensions: List[str], at: str):
+    """1件分の評価をサマリーに反映する（save_assessment と同じトランザクション内で呼ぶ）
+
+    total_xy は「何回目か × 値」の累計で、回数に対する傾き（伸び）の計算に使う。
+    """
+    rows = []
+    for task in (data.get("task_type", ""), ALL_TASKS):
+        for dim in dimensions:
+            v = float(data.get(dim) or 0)
+            rows.append((data.get("student_id", ""), task, dim, data.get("student_name", ""),
+                         data.get("class_group", ""), v, v * v, v, v, v, v, at, v, at))
+    conn.executemany('''
+        INSERT INTO student_progress (student_id, task_type, dimension, student_name, class_group,
+                                      n, total, total_sq, total_xy, min_value, max_value,
+                                      first_value, first_at, last_value, last_at)
+        VALUES (?, ?, ?, ?, ?, 1, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ON CONFLICT (student_id, task_type, dimension) DO UPDATE SET
+            student_name = CASE WHEN excluded.student_name != '' THEN excluded.student_name ELSE student_name END,
+            class_group = CASE WHEN excluded.class_group != '' THEN excluded.class_group ELSE class_group END,
+            total_xy = total_xy + (n + 1) * excluded.total,
+            n = n + 1,
+            total = total + excluded.total,
+            total_sq = total_sq + excluded.total_sq,
+            min_value = min(min_value, excluded.min_value),
+            max_value = max(max_value, excluded.max_value),
+            last_value = excluded.last_value,
+            last_at = excluded.last_at
+    ''', rows)
+
+def rebuild(conn: sqlite3.Connection, dimensions: List[str]):
+    """assessments から作り直す（この機能より前の履歴から作るとき。削除済みの評価は数えられない）"""
+    conn.execute("DELETE FROM student_progress")
+    cols = ", ".join(["student_id", "student_name", "class_group", "task_type", "datetime"] + dimensions)
+    cur = conn.execute(f"SELECT {cols} FROM assessments ORDER BY datetime ASC")
+    names = [d[0] for d in cur.description]
+    for row in cur.fetchall():
+        data = dict(zip(names, row))
+        update(conn, data, dimensions, data["datetime"])
+
+def rescore(conn: sqlite3.Connection, dimension: str, changes: Dict[str, Tuple[float, float]]):
+    """再採点で dimension の値が変わった評価（id → (前の値, 新しい値)）をサマリーに反映する
+
+    assessments を UPDATE した後、同じトランザクション内で呼ぶ。件数は変えずに合計・二乗和・total_xy を
+    差分で直すので、削除済みの評価の分も通算に残る。削除済みの評価の値は分からないため、
+    その学生の評価が削除されている場合、最低・最高は新しい値で広げるだけで、初回の値は記録したときのまま。
+    """
+    if not changes:
+        return
+    students = {row[0] for row in conn.execute(
+        f"SELECT DISTINCT student_id FROM assessments WHERE id IN ({', '.join('?' * len(changes))})", list(changes)
+    )}
+    # 学生 × 課題タイプごとの残っている評価（保存した順に何回目かを数える。同じ秒の評価は rowid の順）
+    groups: Dict[Tuple[str, str], List[Tuple[str, float]]] = {}
+    cur = conn.execute(f"SELECT id, student_id, task_type, {dimension} FROM assessments ORDER BY datetime ASC, rowid ASC")
+    for id_, student, task, value in cur:
+        if student in students:
+            for t in (task, ALL_TASKS):
+                groups.setdefault((student, t), []).append((id_, float(value or 0)))
+
+    for (student, task), rows in groups.items():
+        if not any(id_ in changes for id_, _ in rows):
+            continue
+        key = (student, task, dimension)
+        summary = conn.execute('''
+            SELECT n, min_value, max_value, first_value FROM student_progress
+            WHERE student_id = ? AND task_type = ? AND dimension = ?
+        ''', key).fetchone()
+        if summary is None:
+            continue
+        n, min_value, max_value, first_value = summary
+        pruned = max(0, n - len(rows))
+        d_total = d_sq = d_xy = 0.0
+        for i, (id_, _) in enumerate(rows, start=1):
+            if id_ in changes:
+                old, new = changes[id_]
+                d_total += new - old
+                d_sq += new * new - old * old
+                d_xy += (pruned + i) * (new - old)
+        values = [v for _, v in rows]
+        if pruned == 0:
+            min_value, max_value, first_value = min(values), max(values), values[0]
+        else:
+            min_value, max_value = min(min_value, *values), max(max_value, *values)
+        conn.execute('''
+            UPDATE student_progress SET total = total + ?, total_sq = total_sq + ?, total_xy = total_xy + ?,
+                                        min_value = ?, max_value = ?, first_value = ?, last_value = ?
+            WHERE student_id = ? AND task_type = ? AND dimension = ?
+        ''', (d_total, d_sq, d_xy, min_value, max_value, first_value, values[-1]) + key)
+
+# ============================================
+# 集計（サマリーの行から計算するだけ）
+# ============================================
+
+def _stats(row: Dict[str, Any]) -> Dict[str, Any]:
+    n = row["n"]
+    mean = row["total"] / n
+    var = max(0.0, row["total_sq"] / n - mean * mean)
+    # 回数 x=1..n に対する最小二乗の傾き（1回あたりの伸び）
+    sx = n * (n + 1) / 2
+    sxx = n * (n + 1) * (2 * n + 1) / 6
+    denom = n * sxx - sx * sx
+    slope = (n * row["total_xy"] - sx * row["total"]) / denom if denom else 0.0
+    return {
+        "回数": n,
+        "平均": round(mean, 1),
+        "標準偏差": round(math.sqrt(var), 1),
+        "最低": row["min_value"],
+        "最高": row["max_value"],
+        "初回": row["first_value"],
+        "最新": row["last_value"],
+        "初回→最新": round(row["last_value"] - row["first_value"], 1),
+        "伸び/回": round(slope, 2),
+        "最終評価日時": row["last_at"],
+    }
+
+def _query(db_path: str, sql: str, params: tuple) -> List[Dict[str, Any]]:
+    conn = sqlite3.connect(db_path)
+    conn.row_factory = sqlite3.Row
+    try:
+        return [dict(r) for r in conn.execute(sql, params)]
+    finally:
+        conn.close()
+
+def student_summary(db_path: str, student_id: str) -> pd.DataFrame:
+    """1人の学生の観点別・課題タイプ別サマリー"""
+    rows = _query(db_path, "SELECT * FROM student_progress WHERE student_id = ? ORDER BY task_type, dimension",
+                  (student_id,))
+    records = []
+    for r in rows:
+        records.append({
+            "課題タイプ": "全体" if r["task_type"] == ALL_TASKS else r["task_type"],
+            "観点": DIMENSION_LABELS.get(r["dimension"], r["dimension"]),
+            **_stats(r),
+        })
+    return pd.DataFrame(records)
+
+def course_progress(db_path: str, dimension: str = "total_score", class_group: Optional[str] = None,
+                    task_type: str = ALL_TASKS) -> pd.DataFrame:
+    """クラス（または全体）の学生一覧。1学生1行"""
+    sql = "SELECT * FROM student_progress WHERE dimension = ? AND task_type = ?"
+    params = [dimension, task_type]
+    if class_group:
+        sql += " AND class_group = ?"
+        params.append(class_group)
+    rows = _query(db_path, sql + " ORDER BY student_id", tuple(params))
+    records = [{"学籍番号": r["student_id"], "氏名": r["student_name"], "クラス": r["class_group"], **_stats(r)}
+               for r in rows]
+    return pd.DataFrame(records)
@@ -0,0 +1,112 @@
+# raw_store.py - エンジンの生レスポンス（JSON）を圧縮して保存する
+# assessments には整形済みの一部（word_scores[:15] など）しか残らないため、
+# 生レスポンスを assessment_raw テーブルに圧縮BLOBで保存し、APIを呼ばずに再分析できるようにする。
+#
+# 再分析の例（Azure版）:
+#   for rec in iter_raw("history_azure.db", engine="azure"):
+#       mispronounced, phoneme_err = analyze_errors(rec.data)
+
+import gzip
+import json
+import sqlite3
+from functools import cached_property
+from typing import Any, Iterator, Optional
+
+try:
+    import zstandard
+except ImportError:  # zstandard がなければ gzip で保存
+    zstandard = None
+
+def init_table(conn: sqlite3.Connection):
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS assessment_raw (
+            assessment_id TEXT PRIMARY KEY,
+            engine TEXT,
+            codec TEXT,
+            raw_size INTEGER,
+            payload BLOB
+        )
+    ''')
+    # 履歴が削除されたら生データも消す
+    conn.execute('''
+        CREATE TRIGGER IF NOT EXISTS assessment_raw_cleanup AFTER DELETE ON assessments
+        BEGIN
+            DELETE FROM assessment_raw WHERE assessment_id = old.id;
+        END
+    ''')
+
+def encode(raw: Any) -> tuple:
+    """JSONを圧縮して (codec, 元サイズ, BLOB) を返す"""
+    data = json.dumps(raw, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    if zstandard is not None:
+        return "zstd", len(data), zstandard.ZstdCompressor(level=10).compress(data)
+    return "gzip", len(data), gzip.compress(data, compresslevel=6, mtime=0)
+
+def decode(codec: str, payload: bytes) -> Any:
+    if codec == "zstd":
+        if zstandard is None:
+            raise ValueError("zstd形式の生データを読むには zstandard が必要です: pip install zstandard")
+        data = zstandard.ZstdDecompressor().decompress(payload)
+    elif codec == "gzip":
+        data = gzip.decompress(payload)
+    else:
+        raise ValueError(f"未対応の圧縮形式: {codec}")
+    return json.loads(data)
+
+def save_raw(conn: sqlite3.Connection, assessment_id: str, engine: str, raw: Any):
+    """save_assessment と同じトランザクション内で呼ぶ"""
+    if raw is None:
+        return
+    codec, size, payload = encode(raw)
+    conn.execute(
+        "INSERT OR REPLACE INTO assessment_raw (assessment_id, engine, codec, raw_size, payload) VALUES (?,?,?,?,?)",
+        (assessment_id, engine, codec, size, payload)
+    )
+
+class RawRecord:
+    """生データ1件。data に初めてアクセスしたときだけ展開する"""
+
+    def __init__(self, assessment_id: str, engine: str, codec: str, raw_size: int, payload: bytes):
+        self.assessment_id = assessment_id
+        self.engine = engine
+        self.codec = codec
+        self.raw_size = raw_size
+        self.payload = payload
+
+    @cached_property
+    def data(self) -> Any:
+        return decode(self.codec, self.payload)
+
+def load_raw(db_path: str, assessment_id: str) -> Optional[RawRecord]:
+    conn = sqlite3.connect(db_path)
+    try:
+        row = conn.execute(
+            "SELECT assessment_id, engine, codec, raw_size, payload FROM assessment_raw WHERE assessment_id = ?",
+            (assessment_id,)
+        ).fetchone()
+    finally:
+        conn.close()
+    return RawRecord(*row) if row else None
+
+def iter_raw_conn(conn: sqlite3.Connection, engine: Optional[str] = None,
+                  batch_size: int = 500) -> Iterator[RawRecord]:
+    """既存の接続から全件を少しずつ読み出す（メモリに載るのは batch_size 件分の圧縮データだけ）"""
+    sql = "SELECT assessment_id, engine, codec, raw_size, payload FROM assessment_raw"
+    params = ()
+    if engine:
+        sql += " WHERE engine = ?"
+        params = (engine,)
+    cur = conn.execute(sql, params)
+    while True:
+        rows = cur.fetchmany(batch_size)
+        if not rows:
+            break
+        for row in rows:
+            yield RawRecord(*row)
+
+def iter_raw(db_path: str, engine: Optional[str] = None, batch_size: int = 500) -> Iterator[RawRecord]:
+    conn = sqlite3.connect(db_path)
+    try:
+        yield from iter_raw_conn(conn, engine, batch_size)
+    finally:
+        conn.close()
@@ -0,0 +1,85 @@
+# rescore.py - 保存済み履歴の一括再採点
+# ルーブリック変更後に、保存済みの構成スコア（発音・流暢さ等）から
+# total_score / band / cefr / toefl / ielts を再計算する。APIは呼ばない。
+#
+# 使い方:
+#   python rescore.py history_azure.db                 # 現在のルーブリック（class_config.json の rubric_version）
+#   python rescore.py history_speechace.db --rubric v2 # バージョン指定
+#   python rescore.py history_azure.db --dry-run       # 書き込まずに変更件数だけ表示
+
+import argparse
+import sqlite3
+import time
+from typing import Optional
+
+import pandas as pd
+
+import progress
+import rollup
+import scoring
+from db_utils import ensure_columns
+
+RESULT_COLUMNS = ["total_score", "band", "cefr", "toefl", "ielts", "rubric_version"]
+
+def detect_engine(conn: sqlite3.Connection) -> str:
+    """列構成からエンジンを判定（Azure版は accuracy 列を持つ）"""
+    cols = {row[1] for row in conn.execute("PRAGMA table_info(assessments)")}
+    return "azure" if "accuracy" in cols else "speechace"
+
+def rescore_history(db_path: str, rubric_version: Optional[str] = None,
+                    engine: Optional[str] = None, dry_run: bool = False) -> pd.DataFrame:
+    """履歴DB全体を指定ルーブリックで再採点し、変更のあった行を返す"""
+    rubric = scoring.load_rubric(rubric_version)
+    conn = sqlite3.connect(db_path)
+    try:
+        ensure_columns(conn, "assessments", {"rubric_version": "TEXT"})
+        engine = engine or detect_engine(conn)
+        weights = rubric["weights"][engine]
+        components = list({**weights["reading"], **weights["speech"]})
+        df = pd.read_sql_query(
+            f"SELECT id, task_type, {', '.join(components + RESULT_COLUMNS)} FROM assessments", conn
+        )
+        if len(df) == 0:
+            return df
+
+        rescored = scoring.rescore_frame(df, engine, rubric)
+        changed = pd.Series(False, index=df.index)
+        for col in RESULT_COLUMNS:
+            changed |= df[col].astype(str) != rescored[col].astype(str)
+        updates = rescored.loc[changed, RESULT_COLUMNS + ["id"]]
+
+        if not dry_run and len(updates) > 0:
+            with conn:
+                conn.executemany(
+                    f"UPDATE assessments SET {', '.join(c + ' = ?' for c in RESULT_COLUMNS)} WHERE id = ?",
+                    updates.itertuples(index=False, name=None)
+                )
+                # 進捗サマリー・クラス統計の総合点も再採点後の値に差し替える（削除済みの評価の件数は残す）
+                totals = {
+                    i: (float(old or 0), float(new or 0))
+                    for i, old, new in zip(df["id"], df["total_score"].fillna(0), rescored["total_score"].fillna(0))
+                    if old != new
+                }
+                if conn.execute("SELECT name FROM sqlite_master WHERE name = 'student_progress'").fetchone():
+                    progress.rescore(conn, "total_score", totals)
+                if conn.execute("SELECT name FROM sqlite_master WHERE name = 'class_rollup'").fetchone():
+                    rollup.rescore(conn, "total_score", totals)
+        return updates
+    finally:
+        conn.close()
+
+def main():
+    parser = argparse.ArgumentParser(description="保存済み履歴をルーブリックで一括再採点")
+    parser.add_argument("db_path", help="履歴DB（history_azure.db / history_speechace.db）")
+    parser.add_argument("--rubric", default=None, help="ルーブリックのバージョン（省略時は rubric_version）")
+    parser.add_argument("--engine", choices=["azure", "speechace"], default=None, help="省略時は列構成から判定")
+    parser.add_argument("--dry-run", action="store_true", help="書き込まずに変更件数だけ表示")
+    args = parser.parse_args()
+
+    start = time.time()
+    updates = rescore_history(args.db_path, args.rubric, args.engine, args.dry_run)
+    action = "変更予定" if args.dry_run else "更新"
+    print(f"{len(updates)}件を{action}（{time.time() - start:.2f}秒）")
+
+if __name__ == "__main__":
+    main()
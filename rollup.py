@@ -0,0 +1,247 @@
+# rollup.py - クラス統計用の集計テーブル（クラス × 課題タイプ × ISO週 × 観点）
+# save_assessment のトランザクション内で件数・合計・二乗和・最小・最大と
+# 1点刻みのヒストグラムを差分更新する。クラス統計ページはこの集計テーブルだけを読むので、
+# 履歴が増えても表示時間は変わらない。パーセンタイルはヒストグラムからの近似（誤差は最大1点）。
+# progress.py と同じく、MAX_HISTORY やアーカイブで履歴が削除されても集計は減らさない（通算）。
+# 再採点は rescore() で、残っている評価の分だけ合計とヒストグラムのビンを差し替える。
+
+import math
+import sqlite3
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+import pandas as pd
+
+HIST_BINS = 101  # 0〜100点を1点刻み（100点は最後のビン）
+PERCENTILES = [25, 50, 75, 90]
+
+def iso_week(at: str) -> str:
+    """'2025-01-06 10:00:00' -> '2025-W02'"""
+    year, week, _ = datetime.strptime(at[:10], "%Y-%m-%d").isocalendar()
+    return f"{year}-W{week:02d}"
+
+def _bin(v: float) -> int:
+    return min(HIST_BINS - 1, max(0, int(v)))
+
+def init_tables(conn: sqlite3.Connection, dimensions: List[str]):
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS class_rollup (
+            class_group TEXT NOT NULL,
+            task_type TEXT NOT NULL,
+            week TEXT NOT NULL,
+            dimension TEXT NOT NULL,
+            n INTEGER NOT NULL,
+            total REAL NOT NULL,
+            total_sq REAL NOT NULL,
+            min_value REAL,
+            max_value REAL,
+            PRIMARY KEY (class_group, task_type, week, dimension)
+        )
+    ''')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS class_rollup_hist (
+            class_group TEXT NOT NULL,
+            task_type TEXT NOT NULL,
+            week TEXT NOT NULL,
+            dimension TEXT NOT NULL,
+            bin INTEGER NOT NULL,
+            count INTEGER NOT NULL,
+            PRIMARY KEY (class_group, task_type, week, dimension, bin)
+        )
+    ''')
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_class_rollup_dim ON class_rollup (dimension, week)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_class_rollup_hist_dim ON class_rollup_hist (dimension, week)")
+    # この機能より前の履歴から作る
+    if conn.execute("SELECT COUNT(*) FROM class_rollup").fetchone()[0] == 0:
+        rebuild(conn, dimensions)
+
+def update(conn: sqlite3.Connection, data: Dict[str, Any], dimensions: List[str], at: str):
+    """1件分の評価を集計に反映する（save_assessment と同じトランザクション内で呼ぶ）"""
+    key = (data.get("class_group", ""), data.get("task_type", ""), iso_week(at))
+    rows, hist = [], []
+    for dim in dimensions:
+        v = float(data.get(dim) or 0)
+        rows.append(key + (dim, v, v * v, v, v))
+        hist.append(key + (dim, _bin(v)))
+    conn.executemany('''
+        INSERT INTO class_rollup (class_group, task_type, week, dimension, n, total, total_sq, min_value, max_value)
+        VALUES (?, ?, ?, ?, 1, ?, ?, ?, ?)
+        ON CONFLICT (class_group, task_type, week, dimension) DO UPDATE SET
+            n = n + 1,
+            total = total + excluded.total,
+            total_sq = total_sq + excluded.total_sq,
+            min_value = min(min_value, excluded.min_value),
+            max_value = max(max_value, excluded.max_value)
+    ''', rows)
+    conn.executemany('''
+        INSERT INTO class_rollup_hist (class_group, task_type, week, dimension, bin, count)
+        VALUES (?, ?, ?, ?, ?, 1)
+        ON CONFLICT (class_group, task_type, week, dimension, bin) DO UPDATE SET count = count + 1
+    ''', hist)
+
+def rebuild(conn: sqlite3.Connection, dimensions: List[str]):
+    """assessments から作り直す（この機能より前の履歴から作るとき。削除済みの評価は数えられない）"""
+    conn.execute("DELETE FROM class_rollup")
+    conn.execute("DELETE FROM class_rollup_hist")
+    cols = ", ".join(["class_group", "task_type", "datetime"] + dimensions)
+    cur = conn.execute(f"SELECT {cols} FROM assessments")
+    names = [d[0] for d in cur.description]
+    for row in cur.fetchall():
+        data = dict(zip(names, row))
+        update(conn, data, dimensions, data["datetime"] or datetime.now().strftime("%Y-%m-%d"))
+
+def rescore(conn: sqlite3.Connection, dimension: str, changes: Dict[str, Tuple[float, float]]):
+    """再採点で dimension の値が変わった評価（id → (前の値, 新しい値)）を集計に反映する
+
+    assessments を UPDATE した後、同じトランザクション内で呼ぶ。件数は変えずに合計・二乗和と
+    ヒストグラムのビンを差分で直すので、削除済みの評価の分も通算に残る。その週の評価が削除されている
+    場合、最低・最高は新しい値で広げるだけ（削除済みの評価の値は分からないため）。
+    """
+    if not changes:
+        return
+    today = datetime.now().strftime("%Y-%m-%d")
+    groups: Dict[Tuple[str, str, str], List[Tuple[str, float]]] = {}
+    cur = conn.execute(f"SELECT id, class_group, task_type, datetime, {dimension} FROM assessments")
+    for id_, class_group, task, at, value in cur:
+        groups.setdefault((class_group, task, iso_week(at or today)), []).append((id_, float(value or 0)))
+
+    for key, rows in groups.items():
+        changed = [changes[id_] for id_, _ in rows if id_ in changes]
+        if not changed:
+            continue
+        summary = conn.execute('''
+            SELECT n, min_value, max_value FROM class_rollup
+            WHERE class_group = ? AND task_type = ? AND week = ? AND dimension = ?
+        ''', key + (dimension,)).fetchone()
+        if summary is None:
+            continue
+        n, min_value, max_value = summary
+        values = [v for _, v in rows]
+        if n <= len(rows):
+            min_value, max_value = min(values), max(values)
+        else:
+            min_value, max_value = min(min_value, *values), max(max_value, *values)
+        conn.execute('''
+            UPDATE class_rollup SET total = total + ?, total_sq = total_sq + ?, min_value = ?, max_value = ?
+            WHERE class_group = ? AND task_type = ? AND week = ? AND dimension = ?
+        ''', (sum(new - old for old, new in changed), sum(new * new - old * old for old, new in changed),
+              min_value, max_value) + key + (dimension,))
+        moves = [(old, new) for old, new in changed if _bin(old) != _bin(new)]
+        conn.executemany('''
+            UPDATE class_rollup_hist SET count = count - 1
+            WHERE class_group = ? AND task_type = ? AND week = ? AND dimension = ? AND bin = ?
+        ''', [key + (dimension, _bin(old)) for old, _ in moves])
+        conn.executemany('''
+            INSERT INTO class_rollup_hist (class_group, task_type, week, dimension, bin, count)
+            VALUES (?, ?, ?, ?, ?, 1)
+            ON CONFLICT (class_group, task_type, week, dimension, bin) DO UPDATE SET count = count + 1
+        ''', [key + (dimension, _bin(new)) for _, new in moves])
+    conn.execute("DELETE FROM class_rollup_hist WHERE count <= 0")
+
+# ============================================
+# 集計（集計テーブルを合算するだけ）
+# ============================================
+
+def _filters(dimension: str, class_group: Optional[str], task_type: Optional[str],
+             since_week: Optional[str]) -> tuple:
+    where = ["dimension = ?", "class_group != ''", "class_group != '-- 選択 --'"]
+    params = [dimension]
+    if class_group:
+        where.append("class_group = ?")
+        params.append(class_group)
+    if task_type:
+        where.append("task_type = ?")
+        params.append(task_type)
+    if since_week:
+        where.append("week >= ?")
+        params.append(since_week)
+    return " AND ".join(where), params
+
+def _percentiles(hist: pd.DataFrame, n: int) -> Dict[str, float]:
+    """ヒストグラム（bin, count）から近似パーセンタイル。ビン内は一様分布とみなす"""
+    counts = hist.sort_values("bin")
+    cum = counts["count"].cumsum().tolist()
+    bins = counts["bin"].tolist()
+    result = {}
+    for p in PERCENTILES:
+        target = n * p / 100
+        for i, c in enumerate(cum):
+            if c >= target:
+                prev = cum[i - 1] if i > 0 else 0
+                width = 0 if bins[i] == HIST_BINS - 1 else 1
+                result[f"P{p}"] = round(bins[i] + width * (target - prev) / (c - prev), 1)
+                break
+    return result
+
+def _summarize(db_path: str, group_col: str, dimension: str, class_group: Optional[str],
+               task_type: Optional[str], since_week: Optional[str]) -> List[Dict[str, Any]]:
+    where, params = _filters(dimension, class_group, task_type, since_week)
+    conn = sqlite3.connect(db_path)
+    try:
+        agg = pd.read_sql_query(f'''
+            SELECT {group_col} AS grp, SUM(n) AS n, SUM(total) AS total, SUM(total_sq) AS total_sq,
+                   MIN(min_value) AS min_value, MAX(max_value) AS max_value
+            FROM class_rollup WHERE {where}
+            GROUP BY {group_col} ORDER BY {group_col}
+        ''', conn, params=params)
+        hist = pd.read_sql_query(f'''
+            SELECT {group_col} AS grp, bin, SUM(count) AS count
+            FROM class_rollup_hist WHERE {where}
+            GROUP BY {group_col}, bin
+        ''', conn, params=params)
+    finally:
+        conn.close()
+
+    records = []
+    for r in agg.itertuples(index=False):
+        mean = r.total / r.n
+        sd = math.sqrt(max(0.0, r.total_sq / r.n - mean * mean))
+        records.append({
+            "grp": r.grp,
+            "件数": int(r.n),
+            "平均点": round(mean, 1),
+            "標準偏差": round(sd, 1),
+            "最低点": round(r.min_value, 1),
+            "最高点": round(r.max_value, 1),
+            **_percentiles(hist[hist["grp"] == r.grp], r.n),
+        })
+    return records
+
+def class_summary(db_path: str, dimension: str = "total_score", task_type: Optional[str] = None,
+                  since_week: Optional[str] = None) -> pd.DataFrame:
+    """クラスごとの件数・平均・標準偏差・最低/最高・近似パーセンタイル"""
+    records = _summarize(db_path, "class_group", dimension, None, task_type, since_week)
+    return pd.DataFrame(records).rename(columns={"grp": "クラス"})
+
+def weekly_trend(db_path: str, dimension: str = "total_score", class_group: Optional[str] = None,
+                 task_type: Optional[str] = None, since_week: Optional[str] = None) -> pd.DataFrame:
+    """ISO週ごとの推移（class_group を省略すると全クラス合算）"""
+    records = _summarize(db_path, "week", dimension, class_group, task_type, since_week)
+    return pd.DataFrame(records).rename(columns={"grp": "週"})
+
+def dimension_means(db_path: str, dimensions: List[str], task_type: Optional[str] = None,
+                    since_week: Optional[str] = None) -> pd.DataFrame:
+    """クラス × 観点の平均点"""
+    where = ["class_group != ''", "class_group != '-- 選択 --'",
+             f"dimension IN ({', '.join('?' * len(dimensions))})"]
+    params = list(dimensions)
+    if task_type:
+        where.append("task_type = ?")
+        params.append(task_type)
+    if since_week:
+        where.append("week >= ?")
+        params.append(since_week)
+    conn = sqlite3.connect(db_path)
+    try:
+        df = pd.read_sql_query(f'''
+            SELECT class_group AS クラス, dimension, ROUND(SUM(total) / SUM(n), 1) AS 平均点
+            FROM class_rollup WHERE {" AND ".join(where)}
+            GROUP BY class_group, dimension
+        ''', conn, params=params)
+    finally:
+        conn.close()
+    if len(df) == 0:
+        return df
+    return df.pivot(index="クラス", columns="dimension", values="平均点")[
+        [d for d in dimensions if d in set(df["dimension"])]
+    ].reset_index().rename_axis(columns=None)
@@ -0,0 +1,241 @@
+# scoring.py - スコア計算・換算（Azure版 / Speechace版 共通）
+# 1件ずつのスカラー版と、DataFrame全体をまとめて処理するベクトル化版を提供する
+# ベクトル化版はスカラー版と完全に同じ結果を返す（benchmarks/bench_scoring.py で検証）
+# 重み・換算テーブルはルーブリックとして class_config.json でバージョン管理できる
+
+import copy
+from typing import Dict, Any, Sequence, Optional
+import numpy as np
+import pandas as pd
+from app_config import load_config
+
+# ============================================
+# 換算テーブル
+# ============================================
+
+# 課題タイプ別の重み（辞書の順番で加算する）
+TOTAL_WEIGHTS = {
+    "azure": {
+        "reading": {"accuracy": 0.50, "fluency": 0.25, "prosody": 0.15, "completeness": 0.10},
+        "speech": {"accuracy": 0.30, "fluency": 0.30, "prosody": 0.20, "completeness": 0.20},
+    },
+    "speechace": {
+        "reading": {"pronunciation": 0.50, "fluency": 0.30, "prosody": 0.20},
+        "speech": {"pronunciation": 0.35, "fluency": 0.35, "prosody": 0.30},
+    },
+}
+
+# UI上の課題タイプ → 重みのキー
+TASK_TYPE_KEYS = {"音読課題": "reading", "スピーチ課題": "speech"}
+
+# (下限スコア, ラベル) を上から順に判定。下限 None は「それ以外」
+BAND_TABLE = [(85, "A（優秀）"), (70, "B（良好）"), (55, "C（要努力）"), (None, "D（要改善）")]
+CEFR_TABLE = [(90, "C1"), (80, "B2"), (70, "B1"), (55, "A2"), (40, "A1"), (None, "Pre-A1")]
+
+# 区分線形換算: (下限スコア, 基準値, 幅, 増分)
+#   値 = 基準値 + (s - 下限) / 幅 * 増分   （下限 None の行は原点0で計算）
+TOEFL_SCALE = {
+    "segments": [(90, 26, 10, 4), (80, 22, 10, 4), (70, 18, 10, 4), (55, 14, 15, 4), (None, 0, 55, 14)],
+    "min": 0, "max": 30,
+}
+IELTS_SCALE = {
+    "segments": [(90, 8.0, 10, 1), (80, 7.0, 10, 1), (70, 6.0, 10, 1), (60, 5.5, 20, 1),
+                 (50, 5.0, 20, 1), (40, 4.0, 10, 1), (None, 0, 40, 4)],
+    "min": 1.0, "max": 9.0,
+}
+
+# AIフィードバックに渡すレベル判定（総合点で判定）
+LEVEL_HINTS = [
+    (85, "上位レベル。読んでる感をなくしスピーチのように。場数を踏む段階。"),
+    (70, "まあまあ良い方。リズム、抑揚、スピードの強弱を意識。"),
+    (55, "基本は掴んでいる。リズム、イントネーションを練習。"),
+    (None, "リズムを掴む練習が必要。発音より先にリズム、イントネーションを。"),
+]
+
+# 設定ファイルにルーブリックがない場合の既定値（上のテーブルそのもの）
+DEFAULT_RUBRIC = {
+    "version": "v1",
+    "weights": TOTAL_WEIGHTS,
+    "band": BAND_TABLE,
+    "cefr": CEFR_TABLE,
+    "toefl": TOEFL_SCALE,
+    "ielts": IELTS_SCALE,
+    "level_hints": LEVEL_HINTS,
+}
+
+# ============================================
+# ルーブリック管理
+# ============================================
+
+def load_rubric(version: Optional[str] = None) -> Dict[str, Any]:
+    """class_config.json のルーブリックを読み込む（version 省略時は rubric_version の値）
+
+    設定に書かれていない項目は既定値を使う。
+    """
+    config = load_config()
+    rubrics = config.get("rubrics", {})
+    if version is None:
+        version = config.get("rubric_version", DEFAULT_RUBRIC["version"])
+    if version not in rubrics:
+        if version == DEFAULT_RUBRIC["version"]:
+            return DEFAULT_RUBRIC
+        raise ValueError(f"ルーブリック {version} が class_config.json にありません")
+    rubric = copy.deepcopy(DEFAULT_RUBRIC)
+    rubric.update(rubrics[version])
+    rubric["version"] = version
+    return rubric
+
+def list_rubrics() -> list:
+    """設定されているルーブリックのバージョン一覧"""
+    versions = list(load_config().get("rubrics", {}))
+    return versions or [DEFAULT_RUBRIC["version"]]
+
+# ============================================
+# スカラー版（1件ずつ）
+# ============================================
+
+def task_key(task_type: str) -> str:
+    """UIの課題タイプ（音読課題/スピーチ課題）または reading/speech を重みのキーに変換"""
+    return TASK_TYPE_KEYS.get(task_type, task_type if task_type == "reading" else "speech")
+
+def calc_total(scores: Dict, task_type: str, engine: str, rubric: Optional[Dict] = None) -> float:
+    rubric = rubric or load_rubric()
+    w = rubric["weights"][engine][task_key(task_type)]
+    total = None
+    for key, weight in w.items():
+        term = scores[key] * weight
+        total = term if total is None else total + term
+    return round(total, 1)
+
+def _lookup(s: float, table) -> str:
+    for lower, label in table:
+        if lower is None or s >= lower:
+            return label
+    return table[-1][1]
+
+def _segment(s: float, segments):
+    for lower, base, width, step in segments:
+        if lower is None or s >= lower:
+            return lower or 0, base, width, step
+    lower, base, width, step = segments[-1]
+    return 0, base, width, step
+
+def get_band(s: float, rubric: Optional[Dict] = None) -> str:
+    return _lookup(s, (rubric or load_rubric())["band"])
+
+def get_cefr(s: float, rubric: Optional[Dict] = None) -> str:
+    return _lookup(s, (rubric or load_rubric())["cefr"])
+
+def get_toefl(s: float, rubric: Optional[Dict] = None) -> str:
+    scale = (rubric or load_rubric())["toefl"]
+    origin, base, width, step = _segment(s, scale["segments"])
+    t = base + int((s - origin) / width * step)
+    return f"{max(scale['min'], min(scale['max'], t))}/30"
+
+def get_ielts(s: float, rubric: Optional[Dict] = None) -> str:
+    scale = (rubric or load_rubric())["ielts"]
+    origin, base, width, step = _segment(s, scale["segments"])
+    i = base + (s - origin) / width * step
+    i = max(scale["min"], min(scale["max"], i))
+    return f"{round(i*2)/2}"
+
+def get_level_hint(s: float, rubric: Optional[Dict] = None) -> str:
+    return _lookup(s, (rubric or load_rubric())["level_hints"])
+
+# ============================================
+# ベクトル化版（np.searchsorted で区間を一括判定）
+# ============================================
+
+def _as_float(s) -> np.ndarray:
+    return np.asarray(s, dtype=np.float64)
+
+def _round1(x: np.ndarray) -> np.ndarray:
+    """Pythonの round(x, 1) と同じ結果を返す
+
+    np.rint(x*10)/10 は x*10 がちょうど .5 付近に丸められた場合だけ組み込み round とずれるので、
+    その要素だけ round() で計算し直す。
+    """
+    y = x * 10
+    out = np.rint(y) / 10
+    frac = np.abs(y - np.trunc(y))
+    tie = np.abs(frac - 0.5) < 1e-6
+    if tie.any():
+        out[tie] = [round(v, 1) for v in x[tie].tolist()]
+    return out
+
+def _segment_index(s: np.ndarray, lowers: Sequence[Optional[float]]) -> np.ndarray:
+    """上から並んだテーブルの行番号を返す（s >= 下限 となる最初の行。NaN は最後の行）"""
+    bounds = np.array([b for b in lowers if b is not None][::-1], dtype=np.float64)
+    n = len(lowers)
+    idx = (n - 1) - np.searchsorted(bounds, s, side="right")
+    return np.where(np.isnan(s), n - 1, idx)
+
+def _lookup_vec(s, table) -> np.ndarray:
+    s = _as_float(s)
+    labels = np.array([label for _, label in table], dtype=object)
+    return labels[_segment_index(s, [lower for lower, _ in table])]
+
+def _segment_params(s: np.ndarray, segments):
+    idx = _segment_index(s, [seg[0] for seg in segments])
+    origin = np.array([seg[0] or 0 for seg in segments], dtype=np.float64)[idx]
+    base = np.array([seg[1] for seg in segments], dtype=np.float64)[idx]
+    width = np.array([seg[2] for seg in segments], dtype=np.float64)[idx]
+    step = np.array([seg[3] for seg in segments], dtype=np.float64)[idx]
+    return origin, base, width, step
+
+def calc_total_vec(components: Dict[str, Any], task_types, engine: str,
+                   rubric: Optional[Dict] = None) -> np.ndarray:
+    """components: 列名 → スコア配列、task_types: reading/speech または 音読課題/スピーチ課題 の配列"""
+    rubric = rubric or load_rubric()
+    tasks = np.asarray(task_types, dtype=object)
+    is_reading = (tasks == "reading") | (tasks == "音読課題")
+    totals = []
+    for task in ("reading", "speech"):
+        total = None
+        for key, weight in rubric["weights"][engine][task].items():
+            term = _as_float(components[key]) * weight
+            total = term if total is None else total + term
+        totals.append(total)
+    return _round1(np.where(is_reading, totals[0], totals[1]))
+
+def get_band_vec(s, rubric: Optional[Dict] = None) -> np.ndarray:
+    return _lookup_vec(s, (rubric or load_rubric())["band"])
+
+def get_cefr_vec(s, rubric: Optional[Dict] = None) -> np.ndarray:
+    return _lookup_vec(s, (rubric or load_rubric())["cefr"])
+
+def get_toefl_vec(s, rubric: Optional[Dict] = None) -> np.ndarray:
+    scale = (rubric or load_rubric())["toefl"]
+    s = _as_float(s)
+    origin, base, width, step = _segment_params(s, scale["segments"])
+    lo, hi = scale["min"], scale["max"]
+    t = base + np.trunc((s - origin) / width * step)
+    t = np.clip(np.nan_to_num(t, nan=lo), lo, hi).astype(np.int64)
+    labels = np.array([f"{v}/30" for v in range(lo, hi + 1)], dtype=object)
+    return np.where(np.isnan(s), None, labels[t - lo])
+
+def get_ielts_vec(s, rubric: Optional[Dict] = None) -> np.ndarray:
+    scale = (rubric or load_rubric())["ielts"]
+    s = _as_float(s)
+    origin, base, width, step = _segment_params(s, scale["segments"])
+    lo, hi = scale["min"], scale["max"]
+    i = np.clip(base + (s - origin) / width * step, lo, hi)
+    halves = np.rint(np.nan_to_num(i, nan=lo) * 2).astype(np.int64)
+    first = int(round(lo * 2))
+    labels = np.array([f"{k/2}" for k in range(first, int(round(hi * 2)) + 1)], dtype=object)
+    return np.where(np.isnan(s), None, labels[halves - first])
+
+def rescore_frame(df: pd.DataFrame, engine: str, rubric: Optional[Dict] = None) -> pd.DataFrame:
+    """保存済みの構成スコアから total_score/band/cefr/toefl/ielts を一括で再計算"""
+    rubric = rubric or load_rubric()
+    weights = rubric["weights"][engine]
+    components = {key: df[key].to_numpy() for key in {**weights["reading"], **weights["speech"]}}
+    total = calc_total_vec(components, df["task_type"].to_numpy(), engine, rubric)
+    out = df.copy()
+    out["total_score"] = total
+    out["band"] = get_band_vec(total, rubric)
+    out["cefr"] = get_cefr_vec(total, rubric)
+    out["toefl"] = get_toefl_vec(total, rubric)
+    out["ielts"] = get_ielts_vec(total, rubric)
+    out["rubric_version"] = rubric["version"]
+    return out
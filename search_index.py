@@ -0,0 +1,132 @@
+# search_index.py - 目標テキスト・書き起こし・フィードバック・問題単語の全文検索（SQLite FTS5）
+# assessments への追加・更新・削除はトリガーで assessments_fts に自動反映される。
+# 日本語（「ポーズ」など）や記号入りの音素（/θ/）も引けるように trigram トークナイザを使う。
+
+import sqlite3
+from typing import List, Optional, Tuple
+
+import pandas as pd
+
+FTS_TABLE = "assessments_fts"
+MIN_TRIGRAM = 3  # trigram で MATCH できる最短の文字数
+
+def _problem_expr(prefix: str, problem_columns: List[str]) -> str:
+    return " || ' ' || ".join(f"coalesce({prefix}.{c}, '')" for c in problem_columns)
+
+def init_index(conn: sqlite3.Connection, problem_columns: List[str]):
+    """FTS5テーブルと同期用トリガーを作成し、既存の履歴を取り込む
+
+    problem_columns: 問題単語として索引する列（Azure版は mispronounced_words と phoneme_errors）
+    """
+    try:
+        conn.execute(f'''
+            CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5(
+                assessment_id UNINDEXED, target_text, transcription, feedback, problem_words,
+                tokenize = 'trigram'
+            )
+        ''')
+    except sqlite3.OperationalError:
+        # trigram は SQLite 3.34 以降。古い環境では単語単位で索引する
+        conn.execute(f'''
+            CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5(
+                assessment_id UNINDEXED, target_text, transcription, feedback, problem_words
+            )
+        ''')
+
+    insert_sql = f'''
+        INSERT INTO {FTS_TABLE} (assessment_id, target_text, transcription, feedback, problem_words)
+        VALUES (new.id, new.target_text, new.transcription, new.feedback, {_problem_expr("new", problem_columns)});
+    '''
+    conn.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_insert AFTER INSERT ON assessments
+        BEGIN {insert_sql} END
+    ''')
+    _create_delete_trigger(conn)
+    conn.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_update
+        AFTER UPDATE OF target_text, transcription, feedback, {", ".join(problem_columns)} ON assessments
+        BEGIN
+            DELETE FROM {FTS_TABLE} WHERE assessment_id = old.id;
+            {insert_sql}
+        END
+    ''')
+
+    # この機能より前に保存された履歴を取り込む
+    indexed = conn.execute(f"SELECT COUNT(*) FROM {FTS_TABLE}").fetchone()[0]
+    if indexed == 0:
+        conn.execute(f'''
+            INSERT INTO {FTS_TABLE} (assessment_id, target_text, transcription, feedback, problem_words)
+            SELECT id, target_text, transcription, feedback, {_problem_expr("assessments", problem_columns)}
+            FROM assessments
+        ''')
+
+def _create_delete_trigger(conn: sqlite3.Connection):
+    conn.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_delete AFTER DELETE ON assessments
+        BEGIN DELETE FROM {FTS_TABLE} WHERE assessment_id = old.id; END
+    ''')
+
+def delete_assessments(conn: sqlite3.Connection, where: str, params: tuple = ()) -> int:
+    """assessments から条件に合う行をまとめて削除する（呼び出し側のトランザクション内で使う）
+
+    assessment_id は索引されない列なので、削除トリガーは1行ごとに索引全体を走査する。
+    まとめて削除するときはトリガーを外して索引から一度に消し、削除後に戻す。
+    """
+    conn.execute(f"DROP TRIGGER IF EXISTS {FTS_TABLE}_delete")
+    conn.execute(f"DELETE FROM {FTS_TABLE} WHERE assessment_id IN (SELECT id FROM assessments WHERE {where})", params)
+    deleted = conn.execute(f"DELETE FROM assessments WHERE {where}", params).rowcount
+    _create_delete_trigger(conn)
+    return deleted
+
+def _match_query(terms: List[str]) -> str:
+    """入力語をそれぞれフレーズとして AND 検索する（FTS5の演算子として解釈させない）"""
+    return " ".join('"' + t.replace('"', '""') + '"' for t in terms)
+
+def _like_pattern(term: str) -> str:
+    return "%" + term.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+
+def search(db_path: str, query: str, class_group: Optional[str] = None,
+           limit: int = 20, offset: int = 0) -> Tuple[int, pd.DataFrame]:
+    """全文検索して (総件数, 該当ページの結果) を返す。関連度（bm25）順
+
+    2文字以下の語（「θ」など）は trigram で MATCH できないため LIKE で検索し、新しい順に並べる。
+    """
+    terms = query.split()
+    if not terms:
+        return 0, pd.DataFrame()
+
+    where = []
+    params = []
+    if all(len(t) >= MIN_TRIGRAM for t in terms):
+        where.append(f"{FTS_TABLE} MATCH ?")
+        params.append(_match_query(terms))
+        order = f"bm25({FTS_TABLE})"
+        snippet = f"snippet({FTS_TABLE}, -1, '**', '**', '…', 24)"
+    else:
+        doc = "(f.target_text || ' ' || f.transcription || ' ' || f.feedback || ' ' || f.problem_words)"
+        for t in terms:
+            where.append(f"{doc} LIKE ? ESCAPE '\\'")
+            params.append(_like_pattern(t))
+        order = "a.datetime DESC"
+        snippet = "substr(f.feedback, 1, 80)"
+    if class_group:
+        where.append("a.class_group = ?")
+        params.append(class_group)
+
+    base = f'''
+        FROM {FTS_TABLE} f JOIN assessments a ON a.id = f.assessment_id
+        WHERE {" AND ".join(where)}
+    '''
+    conn = sqlite3.connect(db_path)
+    try:
+        total = conn.execute(f"SELECT COUNT(*) {base}", params).fetchone()[0]
+        df = pd.read_sql_query(f'''
+            SELECT a.id, a.datetime, a.student_id, a.student_name, a.class_group, a.task_type,
+                   a.total_score, {snippet} AS snippet
+            {base}
+            ORDER BY {order}
+            LIMIT ? OFFSET ?
+        ''', conn, params=params + [limit, offset])
+    finally:
+        conn.close()
+    return total, df
@@ -0,0 +1,90 @@
+# text_align.py - 目標テキストを音声のチャンクごとの該当箇所に分ける（Speechace の分割評価用）
+# Speechace は40秒ごとのチャンクで評価するが、目標テキスト全体を毎回送ると、チャンクで読んでいない部分が
+# 「読み飛ばし」として採点されてスコアが崩れる。ここでチャンクごとに読んだ範囲だけを切り出す。
+#   spans_from_transcripts  各チャンクの Whisper の認識結果を目標テキストの単語列に対応付けて区切る
+#   spans_by_duration       認識結果がないとき、チャンクの長さの比で文字数を割り振る（前後に少し余裕を持たせる）
+# どちらも目標テキストの単語を順番どおり、漏れなくどこかのチャンクに割り当てる。
+
+import difflib
+import re
+from typing import List, Sequence
+
+DURATION_MARGIN_WORDS = 3  # 長さの比で割り振るときに前後のチャンクと重ねる単語数
+
+def _norm(token: str) -> str:
+    return re.sub(r"[^a-z0-9']", "", token.lower())
+
+def tokens(text: str) -> List[str]:
+    """空白で区切った単語（句読点は単語に付けたまま。切り出したテキストをそのまま送るため）"""
+    return (text or "").split()
+
+def _join(words: Sequence[str], start: int, end: int) -> str:
+    return " ".join(words[max(0, start):max(0, end)])
+
+def _monotonic(bounds: List[int], total: int) -> List[int]:
+    out = []
+    for b in bounds:
+        out.append(min(max(b, out[-1] if out else 0), total))
+    return out
+
+def spans_from_transcripts(target_text: str, transcripts: Sequence[str]) -> List[str]:
+    """チャンクごとの認識結果から、目標テキストをチャンクごとの範囲に分ける
+
+    認識結果の単語と目標テキストの単語を difflib で対応付け、各チャンクで最初に一致した目標テキストの
+    位置をそのチャンクの開始位置にする。一致がないチャンクは前後の開始位置から単語数の比で補う。
+    """
+    words = tokens(target_text)
+    n = len(transcripts)
+    if n <= 1 or not words:
+        return [target_text] * n
+    target = [_norm(w) for w in words]
+    hyp, owner = [], []
+    for i, text in enumerate(transcripts):
+        for w in tokens(text):
+            if _norm(w):
+                hyp.append(_norm(w))
+                owner.append(i)
+    first: List[int] = [-1] * n
+    matcher = difflib.SequenceMatcher(None, target, hyp, autojunk=False)
+    for block in matcher.get_matching_blocks():
+        for k in range(block.size):
+            chunk = owner[block.b + k]
+            if first[chunk] < 0:
+                first[chunk] = block.a + k
+    # 一致がないチャンクの開始位置は、認識された単語数の比で前後から補う
+    lengths = [max(1, len(tokens(t))) for t in transcripts]
+    starts = [0] * n
+    for i in range(1, n):
+        if first[i] >= 0:
+            starts[i] = first[i]
+        else:
+            nxt = next((j for j in range(i + 1, n) if first[j] >= 0), None)
+            end = first[nxt] if nxt is not None else len(words)
+            remaining = sum(lengths[i - 1:nxt if nxt is not None else n])
+            starts[i] = starts[i - 1] + round((end - starts[i - 1]) * lengths[i - 1] / remaining)
+    starts = _monotonic(starts, len(words))
+    bounds = starts + [len(words)]
+    return [_join(words, bounds[i], bounds[i + 1]) for i in range(n)]
+
+def spans_by_duration(target_text: str, durations: Sequence[float],
+                      margin: int = DURATION_MARGIN_WORDS) -> List[str]:
+    """チャンクの長さの比で目標テキストを割り振る（文字数で比例配分し、前後に margin 単語ずつ重ねる）"""
+    words = tokens(target_text)
+    n = len(durations)
+    if n <= 1 or not words:
+        return [target_text] * n
+    total = sum(durations) or 1.0
+    # 単語の文字数の累積で位置を決める（長い単語ほど読むのに時間がかかる）
+    weights = [len(w) + 1 for w in words]
+    cumulative, acc = [], 0
+    for w in weights:
+        acc += w
+        cumulative.append(acc)
+    bounds, elapsed = [0], 0.0
+    for d in durations[:-1]:
+        elapsed += d
+        target_chars = acc * elapsed / total
+        bounds.append(next((i + 1 for i, c in enumerate(cumulative) if c >= target_chars), len(words)))
+    bounds = _monotonic(bounds, len(words)) + [len(words)]
+    return [_join(words, bounds[i] - (margin if i else 0), bounds[i + 1] + (margin if i < n - 1 else 0))
+            for i in range(n)]
@@ -0,0 +1,156 @@
+# timing.py - 評価処理の段階別の所要時間（ダウンロード・ヘッダ確認・変換・Whisper・エンジン・GPT-4o・DB）
+# 評価ボタンの処理の先頭で start() を呼び、各段階を span() で囲む。
+# 計測結果は assessment_timings テーブルに評価と一緒に保存し、JSON形式のログにも1行出力する。
+# パフォーマンスページでは段階別・エンジン別の p50/p95/p99 を表示し、Prometheus形式でも書き出せる。
+
+import json
+import logging
+import sqlite3
+import time
+from contextlib import contextmanager, nullcontext
+from contextvars import ContextVar
+from typing import Callable, Dict, List, Optional, Tuple
+
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+STAGE_LABELS = {
+    "queue": "待ち行列（評価サーバー）",
+    "download": "ダウンロード",
+    "probe": "ヘッダ確認",
+    "convert": "WAV変換（ffmpeg）",
+    "quality": "音声の品質チェック",
+    "split": "音声分割",
+    "align": "目標テキストの対応付け",
+    "whisper": "Whisper",
+    "engine": "発音評価API",
+    "feedback": "GPT-4o",
+    "db": "DB保存",
+}
+QUANTILES = [0.5, 0.95, 0.99]
+
+class Timings:
+    """1回の評価の段階別の所要時間（ミリ秒）。同じ段階を複数回計測したら合算する"""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.spans: Dict[str, float] = {}
+        self.on_stage: Optional[Callable[[str], None]] = None  # 段階に入ったときに呼ぶ（live_progress の画面表示）
+
+    @contextmanager
+    def span(self, stage: str):
+        if self.on_stage:
+            self.on_stage(stage)
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(stage, (time.perf_counter() - t0) * 1000)
+
+    def add(self, stage: str, ms: float):
+        self.spans[stage] = self.spans.get(stage, 0.0) + ms
+
+    def elapsed(self) -> float:
+        """start() からの経過秒数"""
+        return time.perf_counter() - self.started
+
+_current: ContextVar[Optional[Timings]] = ContextVar("timings", default=None)
+
+def start() -> Timings:
+    """新しい計測を始める（評価ボタンの処理ごとに1回）"""
+    timings = Timings()
+    _current.set(timings)
+    return timings
+
+def current() -> Timings:
+    """計測中の Timings。start() されていなければここから始める"""
+    return _current.get() or start()
+
+def span(stage: str):
+    """計測中なら段階の時間を記録する（計測していなければ何もしない）"""
+    timings = _current.get()
+    return timings.span(stage) if timings else nullcontext()
+
+# ============================================
+# 保存・出力
+# ============================================
+
+def init_table(conn: sqlite3.Connection):
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS assessment_timings (
+            assessment_id TEXT NOT NULL,
+            engine TEXT NOT NULL,
+            stage TEXT NOT NULL,
+            ms REAL NOT NULL,
+            recorded_at TEXT,
+            PRIMARY KEY (assessment_id, stage)
+        )
+    ''')
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_assessment_timings_stage ON assessment_timings (engine, stage, recorded_at)")
+    # 履歴が削除されたら計測値も消す
+    conn.execute('''
+        CREATE TRIGGER IF NOT EXISTS assessment_timings_cleanup AFTER DELETE ON assessments
+        BEGIN
+            DELETE FROM assessment_timings WHERE assessment_id = old.id;
+        END
+    ''')
+
+def save(conn: sqlite3.Connection, assessment_id: str, engine: str, timings: Optional[Timings], at: str):
+    """save_assessment と同じトランザクション内で呼ぶ"""
+    if timings is None or not timings.spans:
+        return
+    conn.executemany(
+        "INSERT OR REPLACE INTO assessment_timings (assessment_id, engine, stage, ms, recorded_at) VALUES (?,?,?,?,?)",
+        [(assessment_id, engine, stage, round(ms, 1), at) for stage, ms in timings.spans.items()]
+    )
+    logger.info(json.dumps({
+        "event": "assessment_timing",
+        "assessment_id": assessment_id,
+        "engine": engine,
+        "at": at,
+        "total_ms": round(sum(timings.spans.values()), 1),
+        "stages_ms": {stage: round(ms, 1) for stage, ms in timings.spans.items()},
+    }, ensure_ascii=False))
+
+def _load(db_path: str, since: Optional[str]) -> pd.DataFrame:
+    sql = "SELECT engine, stage, ms FROM assessment_timings"
+    params: Tuple = ()
+    if since:
+        sql += " WHERE recorded_at >= ?"
+        params = (since,)
+    conn = sqlite3.connect(db_path)
+    try:
+        return pd.read_sql_query(sql, conn, params=params)
+    finally:
+        conn.close()
+
+def stage_percentiles(db_path: str, since: Optional[str] = None) -> pd.DataFrame:
+    """エンジン × 段階ごとの件数・平均・p50/p95/p99（ミリ秒）"""
+    df = _load(db_path, since)
+    if len(df) == 0:
+        return df
+    g = df.groupby(["engine", "stage"])["ms"]
+    stats = g.agg(["count", "mean"]).join(g.quantile(QUANTILES).unstack())
+    stats.columns = ["件数", "平均"] + [f"p{int(q * 100)}" for q in QUANTILES]
+    stats = stats.round(0).reset_index()
+    order = {stage: i for i, stage in enumerate(STAGE_LABELS)}
+    stats = stats.sort_values(["engine", "stage"], key=lambda s: s.map(order) if s.name == "stage" else s)
+    stats["stage"] = stats["stage"].map(lambda s: STAGE_LABELS.get(s, s))
+    return stats.rename(columns={"engine": "エンジン", "stage": "段階"}).reset_index(drop=True)
+
+def prometheus_text(db_path: str, since: Optional[str] = None) -> str:
+    """Prometheus のテキスト形式（summary）で書き出す"""
+    df = _load(db_path, since)
+    name = "assessment_stage_seconds"
+    lines: List[str] = [
+        f"# HELP {name} Time spent in each stage of an assessment run.",
+        f"# TYPE {name} summary",
+    ]
+    for (engine, stage), ms in df.groupby(["engine", "stage"])["ms"]:
+        labels = f'engine="{engine}",stage="{stage}"'
+        for q in QUANTILES:
+            lines.append(f'{name}{{{labels},quantile="{q}"}} {ms.quantile(q) / 1000:.3f}')
+        lines.append(f"{name}_sum{{{labels}}} {ms.sum() / 1000:.3f}")
+        lines.append(f"{name}_count{{{labels}}} {len(ms)}")
+    return "\n".join(lines) + "\n"